@@ -10,7 +10,7 @@ sleep 2
 echo "Starting Server port 8000" 
 uvicorn main:app --host 0.0.0.0 --port 8000 > logs/motor_server.log 2>&1 &
 
-python3 camera_control.py > logs/camA.log 2>&1 &
+# The server starts and supervises the camera pipelines (logs/camA.log, logs/camB.log)
 
 
 
@@ -5,6 +5,4 @@ pkill -f "uvicorn main:app"
 pkill -f "memory_monitor.sh"
 pkill -f "camera_control.py"
 rm -rf __pycache__
-rm -f logs/*.log
-echo " All Logs Cleared"
 echo "All services stopped!"
\ No newline at end of file
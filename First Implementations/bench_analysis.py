@@ -0,0 +1,209 @@
+# Benchmark for live frame analysis (frame_analysis.py) on a local video file.
+# Without --video, writes a test video with known events over a static wall
+# texture: an object crossing the view (motion), the view going out of focus
+# (blur), the lens covered (occlusion), a reflection (bright) and a rust stain
+# (color). Plays the file at its frame rate to two stand-in grabbers, as the
+# cameras would, runs the analyzer at each --budgets CPU budget and reports:
+#   - the sampling rate the analyzer settled at and the CPU the stage used, read
+#     from /proc for the sampler thread and the pool's workers
+#   - per scripted event, whether it was flagged and how long after it began
+#   - flags outside every event (false flags)
+# Exits with status 1 if a run misses an event at the highest budget, raises a
+# false flag, or uses more than --tolerance times its budget once settled.
+#
+# Usage:
+#   python3 bench_analysis.py
+#   python3 bench_analysis.py --budgets 0.02,0.1 --video inspection.mp4
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from frame_analysis import FrameAnalyzer, KINDS
+
+FPS = 30.0
+SIZE = (1280, 720)
+# (kind, start, end) in seconds of the test video
+EVENTS = (("motion", 4.0, 6.0), ("blur", 9.0, 12.0), ("occlusion", 15.0, 17.0), ("bright", 20.0, 22.0),
+          ("color", 25.0, 28.0))
+LENGTH = 31.0
+SETTLE = 6.0     # seconds before the CPU use is held to the budget
+LATE = 1.5       # a flag this long after an event's end still belongs to it
+
+
+def wall_texture(rng):
+    """Grey concrete-like texture with some large-scale shading"""
+    noise = rng.normal(128, 40, (SIZE[1] // 4, SIZE[0] // 4)).astype(np.float32)
+    noise = cv2.GaussianBlur(noise, (0, 0), 1.5)
+    texture = cv2.resize(noise, SIZE, interpolation=cv2.INTER_CUBIC)
+    texture += np.linspace(-20, 20, SIZE[0], dtype=np.float32)[None, :]
+    grey = np.clip(texture, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(grey, cv2.COLOR_GRAY2BGR)
+
+
+def frame_at(t, wall, rng):
+    frame = wall.copy()
+    if 4.0 <= t < 6.0:
+        x = int((t - 4.0) / 2.0 * SIZE[0])
+        cv2.rectangle(frame, (x - 120, 250), (x + 120, 520), (40, 40, 40), -1)
+    elif 9.0 <= t < 12.0:
+        frame = cv2.GaussianBlur(frame, (0, 0), 6)
+    elif 15.0 <= t < 17.0:
+        frame[:] = 8
+    elif 20.0 <= t < 22.0:
+        cv2.circle(frame, (900, 300), 45, (255, 255, 255), -1)
+    elif 25.0 <= t < 28.0:
+        cv2.ellipse(frame, (400, 450), (140, 90), 15, 0, 360, (30, 80, 170), -1)
+    # Sensor noise, every frame differs a little
+    noise = rng.integers(-3, 4, frame.shape, dtype=np.int16)
+    return np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def make_test_video(path, seed=1):
+    rng = np.random.default_rng(seed)
+    wall = wall_texture(rng)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), FPS, SIZE)
+    for i in range(int(LENGTH * FPS)):
+        writer.write(frame_at(i / FPS, wall, rng))
+    writer.release()
+
+
+class FileGrabber(threading.Thread):
+    """
+    Plays a video file at its frame rate with FrameGrabber's interface: every
+    frame is grabbed (decoded), only the ones asked for are retrieved
+    """
+
+    def __init__(self, path):
+        super().__init__(daemon=True)
+        self.path = path
+        self.started_at = None
+        self.finished = threading.Event()
+        self._cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG)
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or FPS
+        self._lock = threading.Lock()
+        self._grabbed_at = None
+        self._index = 0
+        self._retrieved = (-1, None)
+
+    def latest_frame(self, timeout=1.0):
+        with self._lock:
+            if self._grabbed_at is None or self.finished.is_set():
+                return None, None
+            index, frame = self._retrieved
+            if index != self._index:
+                ok, frame = self._cap.retrieve()
+                if not ok:
+                    return None, None
+                self._retrieved = (self._index, frame)
+            return frame, self._grabbed_at
+
+    def run(self):
+        self.started_at = time.monotonic()
+        next_at = self.started_at
+        while True:
+            with self._lock:
+                if not self._cap.grab():
+                    break
+                self._index += 1
+                self._grabbed_at = time.monotonic()
+            next_at += 1.0 / self.fps
+            time.sleep(max(0.0, next_at - time.monotonic()))
+        self.finished.set()
+
+
+def cpu_seconds(stat_path):
+    with open(stat_path) as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def stage_cpu(analyzer):
+    """CPU seconds of the sampler thread and the pool's worker processes so far"""
+    total = cpu_seconds(f"/proc/self/task/{analyzer.native_id}/stat")
+    for pid in list(analyzer._pool._processes):
+        try:
+            total += cpu_seconds(f"/proc/{pid}/stat")
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def run(video, budget, events):
+    grabbers = {camera: FileGrabber(video) for camera in ("camA", "camB")}
+    flags = []
+    analyzer = FrameAnalyzer(grabbers, on_flag=flags.append, cpu_budget=budget, hold=3.0)
+    analyzer.start()
+    while analyzer._pool is None or not analyzer._pool._processes:
+        time.sleep(0.05)
+    time.sleep(1.0)   # The workers are spawned and warm
+    for grabber in grabbers.values():
+        grabber.start()
+    wall_start = time.time()
+    time.sleep(SETTLE)
+    settled_cpu, settled_at = stage_cpu(analyzer), time.monotonic()
+    rates = []
+    while not all(grabber.finished.is_set() for grabber in grabbers.values()):
+        time.sleep(0.5)
+        rates.append(analyzer.rate)
+    cpu_use = (stage_cpu(analyzer) - settled_cpu) / (time.monotonic() - settled_at)
+    analyzer.stop()
+    analyzer.join(5)
+
+    flagged = [(event["at"] - wall_start, event["camera"], event["kind"]) for event in flags]
+    results = []
+    for kind, start, end in events:
+        hits = [t for t, _, flag_kind in flagged if flag_kind == kind and start <= t <= end + LATE]
+        results.append((kind, start, min(hits) - start if hits else None))
+    false = [(t, camera, kind) for t, camera, kind in flagged
+             if not any(start - 0.5 <= t <= end + LATE for _, start, end in events)]
+    return {"cpu_use": cpu_use, "rate": sum(rates) / len(rates) if rates else analyzer.rate,
+            "samples": analyzer.stats["samples"], "skipped": analyzer.stats["skipped"],
+            "analysis_ms": analyzer.stats["last_analysis_ms"], "events": results, "false": false,
+            "flags": len(flags)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame analysis on a local video file")
+    parser.add_argument("--video", help="a video file to play instead of the generated one (no scripted events)")
+    parser.add_argument("--budgets", default="0.01,0.05,0.25", help="CPU budgets in fractions of one core")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed CPU use over the budget")
+    args = parser.parse_args()
+
+    events = EVENTS
+    video = args.video
+    if video is None:
+        video = os.path.join(tempfile.mkdtemp(prefix="doomseek-analysis-"), "inspection.avi")
+        make_test_video(video)
+        print(f"Test video: {video}, {LENGTH:.0f} s at {FPS:.0f} fps, {SIZE[0]}x{SIZE[1]}")
+    else:
+        events = ()
+    budgets = [float(value) for value in args.budgets.split(",")]
+    failed = False
+    for budget in budgets:
+        result = run(video, budget, events)
+        over = result["cpu_use"] > budget * args.tolerance
+        failed |= over
+        print(f"budget {budget:.2f} core: used {result['cpu_use']:.3f} ({'OVER' if over else 'ok'}) | "
+              f"{result['rate']:.2f} samples/s per camera, {result['samples']} samples, "
+              f"{result['skipped']} skipped, analysis {result['analysis_ms']} ms | {result['flags']} flags")
+        for kind, start, latency in result["events"]:
+            verdict = f"flagged after {latency:.2f} s" if latency is not None else "MISSED"
+            print(f"  {kind:>9} at {start:4.1f} s: {verdict}")
+            failed |= latency is None and budget == max(budgets)
+        for t, camera, kind in result["false"]:
+            print(f"  FALSE FLAG {kind} on {camera} at {t:.1f} s")
+        failed |= bool(result["false"]) and bool(events)
+    unknown = set(kind for kind, _, _ in events) - set(KINDS)
+    if unknown:
+        raise RuntimeError(f"Unknown detectors in EVENTS: {unknown}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Benchmark for the snapshot catalog (snapshot_catalog.py).
+# Fills a catalog with a synthetic inspection campaign (the robot crawling the
+# floor and walls, a burst every few seconds) and times inserts and the
+# inspection queries, on the indexed catalog and on a copy without its indexes,
+# which shows what the same queries cost as full scans. Prints the query plan
+# of each query.
+#
+# Usage:
+#   python3 bench_catalog.py
+#   python3 bench_catalog.py --images 100000 --keep /tmp/catalog.sqlite
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from bench_hardware import percentiles
+from snapshot_catalog import SnapshotCatalog
+
+LOCATIONS = ("Floor", "Wall A", "Wall B", "Wall C", "Wall D")
+SURFACES = {"Floor": "Floor", "Wall A": "Left Wall", "Wall B": "Front Wall", "Wall C": "Right Wall",
+            "Wall D": "Back Wall"}
+THUMBNAIL = bytes(6000)   # about the size of a 160 px wide JPEG
+
+
+def campaign(images, rng, start):
+    """(path, camera, taken, pose) of a campaign, a burst of 10-30 frames every few seconds"""
+    t, n = start, 0
+    location = "Floor"
+    while n < images:
+        if rng.random() < 0.1:
+            location = rng.choice(LOCATIONS)
+        camera = rng.choice(("camA", "camB"))
+        pitch = rng.uniform(-80, 80)
+        roll = rng.uniform(-30, 30)
+        yaw = rng.uniform(-180, 180)
+        for _ in range(min(images - n, rng.randint(10, 30))):
+            yield (f"snapshot_{n:07d}_{camera}.jpg", camera, t,
+                   {"location": location, "surface": SURFACES[location], "roll": roll + rng.gauss(0, 1),
+                    "pitch": pitch + rng.gauss(0, 1), "yaw": yaw + rng.gauss(0, 1),
+                    "accel": (0.0, 0.0, -1.0), "zoom": rng.choice((100, 200, 300))})
+            t += 0.1
+            n += 1
+        t += rng.uniform(2, 10)
+
+
+def queries(start, end):
+    middle = (start + end) / 2
+    return (
+        ("newest page", {}),
+        ("Wall B, pitched up", {"location": "Wall B", "pitch": (30, 90)}),
+        ("Wall B, pitched up, zoomed", {"location": "Wall B", "pitch": (30, 90), "zoom": (200, 300)}),
+        ("one hour", {"start": middle, "end": middle + 3600}),
+        ("camA, facing ±180", {"camera": "camA", "yaw": (150, -150)}),
+        ("Wall D, level roll", {"location": "Wall D", "roll": (-5, 5)}),
+    )
+
+
+def timed_queries(catalog, start, end, repeat):
+    results = {}
+    for name, filters in queries(start, end):
+        samples, pages = [], 0
+        for _ in range(repeat):
+            began = time.perf_counter()
+            catalog.query(50, **filters)
+            samples.append(time.perf_counter() - began)
+        # Paging through every match
+        began = time.perf_counter()
+        cursor, matched = None, 0
+        while True:
+            page, cursor = catalog.query(500, cursor, **filters)
+            matched += len(page)
+            pages += 1
+            if cursor is None:
+                break
+        results[name] = (samples, matched, time.perf_counter() - began, pages)
+    return results
+
+
+def plans(db_path, start, end):
+    catalog = SnapshotCatalog(db_path, "")
+    captured = []
+    catalog._db.set_trace_callback(captured.append)
+    db = sqlite3.connect(db_path)
+    for name, filters in queries(start, end):
+        captured.clear()
+        catalog.query(50, **filters)
+        sql = captured[-1]
+        detail = [row[3] for row in db.execute("EXPLAIN QUERY PLAN " + sql)]
+        print(f"  {name}: {'; '.join(detail)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot catalog benchmark")
+    parser.add_argument("--images", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", help="copy the filled catalog here")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="doomseek-catalog-")
+    db_path = os.path.join(workdir, "catalog.sqlite")
+    catalog = SnapshotCatalog(db_path, "")
+    start = time.time() - 30 * 24 * 3600
+    rng = random.Random(args.seed)
+    inserts = []
+    for path, camera, taken, pose in campaign(args.images, rng, start):
+        began = time.perf_counter()
+        catalog.add(path, camera, taken, pose, 1920, 1080, 400_000, THUMBNAIL)
+        inserts.append(time.perf_counter() - began)
+    end = taken
+    print(f"{args.images} images over {(end - start) / 86400:.1f} days, "
+          f"catalog {os.path.getsize(db_path) / 2 ** 20:.1f} MB")
+    print(f"insert: {percentiles(inserts)}")
+
+    bare_path = os.path.join(workdir, "bare.sqlite")
+    catalog._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    shutil.copy(db_path, bare_path)
+    # Opening a catalog creates its indexes, they are dropped after
+    bare = SnapshotCatalog(bare_path, "")
+    for (name,) in bare._db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'snapshots_%'").fetchall():
+        bare._db.execute(f"DROP INDEX {name}")
+    bare._db.commit()
+
+    indexed = timed_queries(catalog, start, end, args.repeat)
+    scanned = timed_queries(bare, start, end, args.repeat)
+    for name, (samples, matched, paging, pages) in indexed.items():
+        bare_samples, _, bare_paging, _ = scanned[name]
+        print(f"{name}: {matched} matches")
+        print(f"  indexed: first page {percentiles(samples)} | all {pages} pages {paging * 1000:.1f} ms")
+        print(f"  no index: first page {percentiles(bare_samples)} | all pages {bare_paging * 1000:.1f} ms")
+    print("Query plans:")
+    plans(db_path, start, end)
+    if args.keep:
+        shutil.copy(db_path, args.keep)
+    shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# Recording download throughput: the old 512 KB generator StreamingResponse vs
+# RangeFileResponse (file_ranges.py). The server runs in a subprocess so its CPU
+# time can be read from /proc and kept apart from the client's.
+#
+# Usage:
+#   python3 bench_downloads.py --size-mb 1024 --repeat 3
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from file_ranges import RangeFileResponse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.environ.get("BENCH_DATA_DIR", tempfile.gettempdir())
+
+app = FastAPI()
+
+
+@app.get("/generator/{name}")
+async def generator_download(name: str):
+    # The implementation download_recording used before Range support
+    file_path = os.path.join(DATA_DIR, name)
+    file_size = os.path.getsize(file_path)
+
+    def file_generator():
+        with open(file_path, "rb") as file:
+            while chunk := file.read(524288):
+                yield chunk
+
+    return StreamingResponse(file_generator(), media_type="application/octet-stream",
+                             headers={"Content-Length": str(file_size)})
+
+
+@app.api_route("/range/{name}", methods=["GET", "HEAD"])
+async def range_download(name: str, request: Request):
+    return RangeFileResponse(os.path.join(DATA_DIR, name), request.headers, request.method, filename=name)
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def download(client, url, headers=None):
+    received = 0
+    with client.stream("GET", url, headers=headers) as response:
+        for chunk in response.iter_raw(1024 * 1024):
+            received += len(chunk)
+    return response, received
+
+
+def measure(client, server, url, expected, repeat):
+    best = None
+    for _ in range(repeat):
+        cpu_before = cpu_seconds(server.pid)
+        started = time.perf_counter()
+        response, received = download(client, url)
+        elapsed = time.perf_counter() - started
+        cpu = cpu_seconds(server.pid) - cpu_before
+        assert received == expected, f"{url}: got {received} of {expected} bytes"
+        if best is None or elapsed < best[0]:
+            best = (elapsed, cpu)
+    elapsed, cpu = best
+    mb = expected / (1024 * 1024)
+    return f"{mb / elapsed:8.1f} MB/s | server CPU {cpu:.2f} s ({cpu / mb * 1000:.2f} ms/MB)"
+
+
+def check_ranges(client, name, data_path):
+    with open(data_path, "rb") as f:
+        head = f.read(4096)
+        f.seek(-1000, os.SEEK_END)
+        tail = f.read()
+    size = os.path.getsize(data_path)
+    response = client.get(f"/range/{name}", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206 and response.content == head[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{size}"
+    response = client.get(f"/range/{name}", headers={"Range": "bytes=-1000"})
+    assert response.status_code == 206 and response.content == tail
+    response = client.get(f"/range/{name}", headers={"Range": "bytes=0-9,1000-1009"})
+    assert response.status_code == 206 and response.headers["content-type"].startswith("multipart/byteranges")
+    assert int(response.headers["content-length"]) == len(response.content)
+    etag = response.headers["etag"]
+    assert client.get(f"/range/{name}", headers={"If-None-Match": etag}).status_code == 304
+    stale = client.get(f"/range/{name}", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert stale.status_code == 200
+    assert client.get(f"/range/{name}", headers={"Range": f"bytes={size}-"}).status_code == 416
+    print("Range, If-Range, multipart and revalidation checks passed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recording download throughput benchmark")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    name = "doomseek-bench-download.ts"
+    data_path = os.path.join(DATA_DIR, name)
+    size = args.size_mb * 1024 * 1024
+    if not os.path.exists(data_path) or os.path.getsize(data_path) != size:
+        with open(data_path, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bench_downloads:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=HERE, env=dict(os.environ, BENCH_DATA_DIR=DATA_DIR))
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{args.port}", timeout=60) as client:
+            deadline = time.monotonic() + 20
+            while True:
+                try:
+                    client.head(f"/range/{name}")
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.2)
+            check_ranges(client, name, data_path)
+            print(f"{args.size_mb} MB file, best of {args.repeat}:")
+            print(f"  generator 512 KB : {measure(client, server, f'/generator/{name}', size, args.repeat)}")
+            print(f"  RangeFileResponse: {measure(client, server, f'/range/{name}', size, args.repeat)}")
+            half = size // 2
+            started = time.perf_counter()
+            response, received = download(client, f"/range/{name}", {"Range": f"bytes={half}-"})
+            assert response.status_code == 206 and received == size - half
+            print(f"  resume from 50%  : {received / (1024 * 1024) / (time.perf_counter() - started):8.1f} MB/s "
+                  f"(the generator has to resend the whole file)")
+    finally:
+        server.terminate()
+        server.wait(10)
+        os.remove(data_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# Benchmark for the Sabertooth drive link.
+# Feeds the same drive command sequences through SabertoothWriter in independent
+# mode at 9600 baud (the original scheme) and in mixed mode at 9600 and higher
+# rates, and reports the bytes written and the time they occupy the wire per
+# update (8N1: 10 bits per byte). Also times building packets from the
+# precomputed tables against building them per packet.
+#
+# Usage:
+#   python3 bench_drive.py
+#   python3 bench_drive.py --updates 2000
+import argparse
+import math
+import random
+import threading
+import time
+import timeit
+
+from motor_writer import SabertoothWriter, build_packet, packet_for, DRIVE_INDEPENDENT, DRIVE_MIXED
+
+SCHEMES = (
+    ("independent @ 9600", DRIVE_INDEPENDENT, 9600),
+    ("mixed @ 9600", DRIVE_MIXED, 9600),
+    ("mixed @ 38400", DRIVE_MIXED, 38400),
+    ("mixed @ 115200", DRIVE_MIXED, 115200),
+)
+BITS_PER_BYTE = 10
+
+
+class RecordingSerial:
+    """Stands in for the port: keeps the size of every write"""
+
+    def __init__(self, baudrate):
+        self.baudrate = baudrate
+        self.writes = []
+        self._cond = threading.Condition()
+
+    def write(self, data):
+        with self._cond:
+            self.writes.append(len(data))
+            self._cond.notify()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def wait_for_writes(self, count, timeout=1.0):
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self.writes) >= count, timeout)
+
+
+def cruise(updates, rng):
+    """Straight driving with the speed changing, as the joystick throttle moves"""
+    return [("forward", s, s) for s in (40 + round(60 * math.sin(i / 20) ** 2) for i in range(updates))]
+
+
+def pivot(updates, rng):
+    """Turning on the spot, left and right, at varying speed"""
+    result = []
+    for i in range(updates):
+        speed = 30 + rng.randrange(60)
+        result.append(("Turning Right" if (i // 25) % 2 else "Turning Left", speed, speed))
+    return result
+
+
+def mission(updates, rng):
+    """A mix of the UI's actions: mostly forward, turns, reverses, stops and repeats"""
+    actions = ("forward",) * 6 + ("reverse", "Turning Right", "Turning Left", "stop")
+    result, action, speed = [], "forward", 60
+    for _ in range(updates):
+        if rng.random() < 0.1:
+            action = rng.choice(actions)
+        if rng.random() < 0.5:
+            speed = max(0, min(127, speed + rng.randint(-10, 10)))
+        result.append((action, speed, speed))
+    return result
+
+
+SCENARIOS = (("cruise", cruise), ("pivot", pivot), ("mission", mission))
+DIRECTIONS = {"forward": (1, 1), "reverse": (-1, -1), "Turning Right": (1, -1), "Turning Left": (-1, 1)}
+
+
+def run(commands, mode, baud):
+    """Bytes written for each command, sent through a real writer thread"""
+    ser = RecordingSerial(baud)
+    writer = SabertoothWriter(ser, deadman_timeout=60.0, mode=mode)
+    writer.start()
+    per_update, written = [], 0
+    for action, motor1_speed, motor2_speed in commands:
+        # The same mapping as mainServer.apply_control
+        first, second = DIRECTIONS.get(action, (0, 0))
+        left, right = first * motor1_speed, second * motor2_speed
+        before = sum(ser.writes)
+        if writer.drive((left + right) / 2, (left - right) / 2):
+            written += 1
+            ser.wait_for_writes(written)
+        per_update.append(sum(ser.writes) - before)
+    writer.stop()
+    return per_update
+
+
+def build_cost(repeat):
+    packets = [(128, command, value) for command in (0, 4, 8, 10) for value in range(0, 128, 8)]
+
+    def built():
+        for entry in packets:
+            build_packet(*entry)
+
+    def tabled():
+        for entry in packets:
+            packet_for(*entry)
+    per_packet = len(packets) * repeat
+    return (min(timeit.repeat(built, number=repeat, repeat=3)) / per_packet,
+            min(timeit.repeat(tabled, number=repeat, repeat=3)) / per_packet)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sabertooth drive link benchmark")
+    parser.add_argument("--updates", type=int, default=1000, help="drive commands per scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for name, scenario in SCENARIOS:
+        commands = scenario(args.updates, random.Random(args.seed))
+        print(f"{name}: {len(commands)} updates")
+        baseline = None
+        for label, mode, baud in SCHEMES:
+            sizes = run(commands, mode, baud)
+            total = sum(sizes)
+            wire_us = total * BITS_PER_BYTE / baud * 1e6 / len(sizes)
+            worst_us = max(sizes) * BITS_PER_BYTE / baud * 1e6
+            baseline = baseline or wire_us
+            print(f"  {label:>20}: {total / len(sizes) / 4:.2f} packets, {total / len(sizes):5.2f} bytes, "
+                  f"{wire_us:7.0f} us on the wire per update (worst {worst_us:5.0f} us) | "
+                  f"{baseline / wire_us if wire_us else math.inf:5.1f}x")
+
+    built, tabled = build_cost(2000)
+    print(f"packet build: {built * 1e9:.0f} ns built per packet, {tabled * 1e9:.0f} ns from the tables")
+
+    ser = RecordingSerial(38400)
+    writer = SabertoothWriter(ser, deadman_timeout=60.0)
+    values = [(v % 255 - 127, (v * 7) % 255 - 127) for v in range(1000)]
+    started = time.perf_counter()
+    for throttle, steer in values:
+        writer.drive(throttle, steer)
+    print(f"drive(): {(time.perf_counter() - started) / len(values) * 1e6:.2f} us per call (queueing only)")
+
+
+if __name__ == "__main__":
+    main()
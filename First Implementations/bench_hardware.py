@@ -0,0 +1,163 @@
+# End-to-end load test against emulated hardware (hw_emulator.py).
+# Starts the Sabertooth and WT901 pty emulators, runs the real server on them and
+# measures:
+#   - control-to-wire latency: drive frame sent on /ws/control (and POST /control)
+#     until the packet arrives at the emulated Sabertooth
+#   - IMU ingest throughput: frames the server decodes vs frames the emulator sends
+#
+# Usage:
+#   python3 bench_hardware.py --commands 500 --imu-rate 1000 --imu-seconds 10
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from websockets.sync.client import connect
+
+from drive_protocol import encode_drive
+from hw_emulator import SabertoothEmulator, WT901Emulator
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# "forward" at equal speeds: motor 1 forward (independent mode) or drive forward (mixed mode)
+FORWARD_COMMANDS = (0, 8)
+
+
+def start_server(port, motor_link, imu_link, workdir, extra_env=None):
+    env = dict(os.environ)
+    env.update({
+        "DOOMSEEK_MOTOR_PORT": motor_link,
+        "DOOMSEEK_IMU_PORT": imu_link,
+        "DOOMSEEK_UI_DIR": os.path.join(HERE, "Web stream", "User Interface"),
+        "DOOMSEEK_MISSION_LOG_DIR": os.path.join(workdir, "missions"),
+        # Everything the server writes goes to the work directory, not the source tree
+        "DOOMSEEK_RECORDINGS_DIR": os.path.join(workdir, "recordings"),
+        "DOOMSEEK_RECORDINGS_INDEX_PATH": os.path.join(workdir, "recordings.sqlite"),
+        "DOOMSEEK_REMUX_CACHE_DIR": os.path.join(workdir, "cache", "remux"),
+        "DOOMSEEK_THUMBNAIL_DIR": os.path.join(workdir, "cache", "thumbnails"),
+        "DOOMSEEK_SNAPSHOT_DIR": os.path.join(workdir, "inspection"),
+        "DOOMSEEK_SNAPSHOT_CATALOG_PATH": os.path.join(workdir, "inspection", "catalog.sqlite"),
+        "DOOMSEEK_CAMERA_PIPELINES_ENABLED": "0",
+        "PYTHONUNBUFFERED": "1",
+    })
+    env.update(extra_env or {})
+    log = open(os.path.join(workdir, "server.log"), "w")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "mainServer:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited, see {log.name}")
+        try:
+            # Ready once the motor link has moved to its configured baud rate
+            if not httpx.get(f"{base}/motor/stats", timeout=0.5).json().get("baud_negotiating"):
+                return server, base
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"Server did not start, see {log.name}")
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return (f"p50 {pick(0.50) * 1000:.2f} ms | p95 {pick(0.95) * 1000:.2f} ms | "
+            f"p99 {pick(0.99) * 1000:.2f} ms | max {ordered[-1] * 1000:.2f} ms | "
+            f"mean {statistics.fmean(ordered) * 1000:.2f} ms")
+
+
+def speed_for(i):
+    # Alternate values so the writer never drops a command as a duplicate
+    return 10 + (i % 100)
+
+
+def measure_socket(base, sabertooth, commands):
+    latencies = []
+    lost = 0
+    with connect(base.replace("http", "ws") + "/ws/control") as ws:
+        for i in range(commands):
+            speed = speed_for(i)
+            since = sabertooth.packet_count()
+            sent_at = time.monotonic()
+            ws.send(encode_drive("forward", speed, speed, i + 1))
+            packet = sabertooth.wait_for(lambda p: p[2] in FORWARD_COMMANDS and p[3] == speed, 1.0, since)
+            if packet is None:
+                lost += 1
+            else:
+                latencies.append(packet[0] - sent_at)
+    return latencies, lost
+
+
+def measure_http(base, sabertooth, commands):
+    latencies = []
+    lost = 0
+    with httpx.Client(base_url=base) as client:
+        for i in range(commands):
+            speed = speed_for(i + 50)
+            since = sabertooth.packet_count()
+            sent_at = time.monotonic()
+            client.post("/control", json={"motor1_speed": speed, "motor2_speed": speed, "action": "forward"})
+            packet = sabertooth.wait_for(lambda p: p[2] in FORWARD_COMMANDS and p[3] == speed, 1.0, since)
+            if packet is None:
+                lost += 1
+            else:
+                latencies.append(packet[0] - sent_at)
+    return latencies, lost
+
+
+def measure_imu(base, wt901, seconds):
+    before = httpx.get(f"{base}/imu/stats").json()
+    sent_before = wt901.stats["frames"]
+    time.sleep(seconds)
+    after = httpx.get(f"{base}/imu/stats").json()
+    sent = wt901.stats["frames"] - sent_before
+    decoded = after["frames"] - before["frames"]
+    bad = after["bad_frames"] - before["bad_frames"]
+    return sent, decoded, bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark on emulated hardware")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--commands", type=int, default=300)
+    parser.add_argument("--imu-rate", type=float, default=200.0, help="frames per second per data type")
+    parser.add_argument("--imu-seconds", type=float, default=5.0)
+    parser.add_argument("--corrupt", type=float, default=0.01)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="doomseek-bench-")
+    sabertooth = SabertoothEmulator(os.path.join(workdir, "motor"))
+    wt901 = WT901Emulator(os.path.join(workdir, "imu"),
+                          {t: args.imu_rate for t in (0x51, 0x52, 0x53)}, args.corrupt)
+    sabertooth.start()
+    wt901.start()
+    server, base = start_server(args.port, sabertooth.path, wt901.path, workdir)
+    try:
+        latencies, lost = measure_socket(base, sabertooth, args.commands)
+        print(f"/ws/control -> wire: {percentiles(latencies)} | lost {lost}")
+        latencies, lost = measure_http(base, sabertooth, args.commands)
+        print(f"POST /control -> wire: {percentiles(latencies)} | lost {lost}")
+
+        sent, decoded, bad = measure_imu(base, wt901, args.imu_seconds)
+        print(f"IMU ingest: {decoded / args.imu_seconds:.0f} frames/s decoded of "
+              f"{sent / args.imu_seconds:.0f} frames/s sent ({wt901.stats['corrupted']} corrupted so far, "
+              f"{bad} rejected headers)")
+        print(f"Motor writer: {httpx.get(f'{base}/motor/stats').json()}")
+    finally:
+        server.terminate()
+        server.wait(10)
+        sabertooth.stop()
+        wt901.stop()
+        print(f"Server log: {os.path.join(workdir, 'server.log')}")
+
+
+if __name__ == "__main__":
+    main()
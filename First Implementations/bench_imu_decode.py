@@ -0,0 +1,107 @@
+# Benchmark for the WT901 decoders.
+# Compares the old per-packet path (read 1 byte, read 10, parse_data, scale with
+# generator expressions), the streaming wt901.FrameBuffer used by the IMU reader
+# thread and the batched wt901.decode_buffer used for offline replays.
+#
+# Usage:
+#   python3 bench_imu_decode.py                      # synthetic 60 s stream
+#   python3 bench_imu_decode.py --input imu_raw.bin  # recorded raw byte stream
+import argparse
+import io
+import random
+import struct
+import time
+
+from wt901 import FrameBuffer, parse_data, decode_buffer
+
+# The WT901 streams accel, gyro and angle frames at up to 200 Hz each
+FRAMES_PER_SECOND = 600
+
+
+def synthetic_stream(seconds, corrupt_rate, seed=1):
+    rng = random.Random(seed)
+    out = bytearray()
+    for i in range(int(seconds * FRAMES_PER_SECOND)):
+        data_type = 0x51 + i % 3
+        values = [rng.randint(-32768, 32767) for _ in range(4)]
+        packet = bytes([0x55, data_type]) + struct.pack('<hhhh', *values)
+        packet += bytes([sum(packet) & 0xFF])
+        if rng.random() < corrupt_rate:
+            packet = bytearray(packet)
+            packet[rng.randrange(11)] ^= 0xFF
+        out += packet
+    return bytes(out)
+
+
+def per_packet(stream):
+    # Same steps as the old imu_loop, with BytesIO standing in for the UART
+    imu = io.BytesIO(stream)
+    count = 0
+    while True:
+        byte = imu.read(1)
+        if not byte:
+            break
+        if byte == b'\x55':
+            packet = b'\x55' + imu.read(10)
+            data_type, values = parse_data(packet)
+            if not data_type:
+                continue
+            if data_type == 0x51:
+                tuple(v / 32768.0 * 16.0 for v in values[:3])
+            elif data_type == 0x52:
+                tuple(v / 32768.0 * 2000.0 for v in values[:3])
+            elif data_type == 0x53:
+                (values[0] / 32768.0 * 180.0, values[1] / 32768.0 * 180.0, values[2] / 32768.0 * 180.0)
+            count += 1
+    return count
+
+
+def frame_buffer(stream, chunk=256):
+    frames = FrameBuffer()
+    count = 0
+    for i in range(0, len(stream), chunk):
+        frames.append(stream[i:i + chunk])
+        count += len(frames.pop_frames())
+    return count
+
+
+def batched(stream, chunk=1 << 20):
+    count = 0
+    leftover = b""
+    for i in range(0, len(stream), chunk):
+        data = leftover + stream[i:i + chunk]
+        result = decode_buffer(data)
+        count += len(result["accel"]) + len(result["gyro"]) + len(result["angle"])
+        leftover = data[result["consumed"]:]
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WT901 decoder benchmark")
+    parser.add_argument("--input", help="raw IMU byte stream recorded from the UART")
+    parser.add_argument("--seconds", type=float, default=60.0, help="length of the synthetic stream")
+    parser.add_argument("--corrupt", type=float, default=0.01, help="fraction of corrupted synthetic frames")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, "rb") as f:
+            stream = f.read()
+    else:
+        stream = synthetic_stream(args.seconds, args.corrupt)
+    stream_seconds = len(stream) / 11 / FRAMES_PER_SECOND
+    print(f"Stream: {len(stream)} bytes (~{stream_seconds:.1f} s of IMU output)")
+
+    for name, decoder in (("per-packet", per_packet), ("FrameBuffer", frame_buffer), ("decode_buffer", batched)):
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            count = decoder(stream)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:>14}: {count} frames in {best * 1000:.1f} ms | "
+              f"{count / best / 1e6:.2f} M frames/s | {stream_seconds / best:.0f}x real time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+# Regression check: drive-command latency must stay flat during a snapshot storm.
+# Runs the real server on the emulated Sabertooth (hw_emulator.py) with both
+# frame grabbers reading a paced 30 fps MJPEG stream served from here, measures
+# /ws/control -> wire latency at a steady command rate, then measures it again
+# while clients hammer /proxy-snapshot, start bursts back to back and list and
+# pin recordings. The cameras and the storm's clients run in processes of their
+# own. Exits with status 1 if under the storm the median latency grows beyond
+# --max-ratio times the quiet one plus --slack-ms, or the p95 by more than
+# P95_SLACK_MS over the quiet one: the tick a woken event loop can wait behind
+# a busy lane thread on a single core, nothing that scales with the load.
+# Before the lanes a storm took the p95 from 5 to 70 ms; with grabbers at a
+# normal priority and a lane worker per core too many it still took it from 2
+# to 20.
+#
+# Usage:
+#   python3 bench_isolation.py
+#   python3 bench_isolation.py --seconds 20 --snapshot-clients 8
+import argparse
+import http.server
+import multiprocessing
+import os
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import httpx
+import numpy as np
+from websockets.sync.client import connect
+
+from bench_hardware import FORWARD_COMMANDS, percentiles, speed_for, start_server
+from drive_protocol import encode_drive
+from hw_emulator import SabertoothEmulator
+
+CAMERA_FPS = 30.0
+COMMAND_RATE = 50.0     # drive commands per second, a joystick client's heartbeat and changes
+# On the robot the cameras are hardware and the clients are other machines, here
+# they run beside the server; niced as far as they go, and idle class where the
+# kernel has one, so they don't take its CPU on a small box
+LOAD_NICE = 19
+# What the storm may add to the quiet p95, in ms: one scheduler tick at 250 Hz.
+# Fixed rather than a ratio or a flag, drive latency under the storm has to stay
+# where it was
+P95_SLACK_MS = 4.0
+
+
+def camera_frames(count=10):
+    """JPEG frames of a moving 720p pattern, encoded once"""
+    rng = np.random.default_rng(1)
+    base = rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+    return [cv2.imencode(".jpg", np.roll(base, i * 16, axis=1))[1].tobytes() for i in range(count)]
+
+
+class _MJPEGHandler(http.server.BaseHTTPRequestHandler):
+    frames = ()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+        self.end_headers()
+        i = 0
+        next_at = time.monotonic()
+        try:
+            while True:
+                jpeg = self.frames[i % len(self.frames)]
+                self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n%s\r\n"
+                                 % (len(jpeg), jpeg))
+                i += 1
+                next_at += 1.0 / CAMERA_FPS
+                time.sleep(max(0.0, next_at - time.monotonic()))
+        except OSError:
+            pass  # The grabber disconnected
+
+    def log_message(self, *args):
+        pass
+
+
+class _CameraServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def background():
+    """Drops this process and the threads it starts after to the lowest priority"""
+    os.nice(LOAD_NICE)
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    except (AttributeError, OSError):
+        pass  # Not Linux, niced is as low as it goes
+
+
+def serve_cameras(port, ready):
+    """Serves every path as an MJPEG camera, in a process of its own"""
+    background()
+    _MJPEGHandler.frames = camera_frames()
+    server = _CameraServer(("127.0.0.1", port), _MJPEGHandler)
+    ready.set()
+    server.serve_forever()
+
+
+def make_recordings(directory, count=200):
+    for i in range(count):
+        day = os.path.join(directory, "camA", f"2026-01-{1 + i % 28:02d}")
+        os.makedirs(day, exist_ok=True)
+        with open(os.path.join(day, f"{i:05d}.ts"), "wb") as f:
+            f.write(b"\x47" + bytes(187) * 4)
+
+
+def drive(base, sabertooth, seconds, results):
+    """Paced drive commands for `seconds`, appends (latency or None) to results"""
+    with connect(base.replace("http", "ws") + "/ws/control") as ws:
+        deadline = time.monotonic() + seconds
+        next_at = time.monotonic()
+        i = 0
+        while time.monotonic() < deadline:
+            speed = speed_for(i)
+            since = sabertooth.packet_count()
+            sent_at = time.monotonic()
+            ws.send(encode_drive("forward", speed, speed, i + 1))
+            packet = sabertooth.wait_for(lambda p: p[2] in FORWARD_COMMANDS and p[3] == speed, 1.0, since)
+            results.append(None if packet is None else packet[0] - sent_at)
+            i += 1
+            next_at += 1.0 / COMMAND_RATE
+            time.sleep(max(0.0, next_at - time.monotonic()))
+
+
+def storm(base, stop, snapshot_clients, results):
+    """
+    The background load, run in a process of its own so its client threads don't
+    compete with the latency measurement for this process's GIL: snapshots,
+    bursts and recordings requests until stop is set. Puts the request counts on
+    the results queue.
+    """
+    counts = {}
+    background()
+
+    def snapshots():
+        with httpx.Client(base_url=base, timeout=30) as client:
+            while not stop.is_set():
+                status = client.post("/proxy-snapshot", json={"camera": "camB", "quality": 95}).status_code
+                counts[f"snapshot {status}"] = counts.get(f"snapshot {status}", 0) + 1
+
+    def bursts():
+        with httpx.Client(base_url=base, timeout=30) as client:
+            while not stop.is_set():
+                status = client.post("/snapshots/burst", json={"camera": "camA", "count": 30, "interval": 0,
+                                                               "preview_width": 320}).status_code
+                counts[f"burst {status}"] = counts.get(f"burst {status}", 0) + 1
+                if status != 202:
+                    time.sleep(0.2)
+
+    def recordings():
+        with httpx.Client(base_url=base, timeout=30) as client:
+            i = 0
+            while not stop.is_set():
+                page = client.get("/recordings", params={"limit": 200})
+                counts[f"recordings {page.status_code}"] = counts.get(f"recordings {page.status_code}", 0) + 1
+                if page.status_code == 200 and page.json()["recordings"]:
+                    path = page.json()["recordings"][i % len(page.json()["recordings"])]["path"]
+                    client.post(f"/recordings/pin/{path}", params={"pinned": i % 2 == 0})
+                i += 1
+
+    workers = [threading.Thread(target=snapshots, daemon=True) for _ in range(snapshot_clients)]
+    workers += [threading.Thread(target=bursts, daemon=True), threading.Thread(target=recordings, daemon=True)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put(counts)
+
+
+def summary(name, results):
+    latencies = [latency for latency in results if latency is not None]
+    print(f"{name:>6}: {percentiles(latencies)} | {len(results)} commands, lost {len(results) - len(latencies)}")
+    ordered = sorted(latencies)
+    return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in (0.5, 0.95)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive latency during a snapshot storm")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--camera-port", type=int, default=8767)
+    parser.add_argument("--seconds", type=float, default=10.0, help="length of each phase")
+    parser.add_argument("--snapshot-clients", type=int, default=6)
+    parser.add_argument("--max-ratio", type=float, default=2.0, help="allowed growth of the median")
+    parser.add_argument("--slack-ms", type=float, default=1.0, help="added to the median limit for timer noise")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="doomseek-isolation-")
+    make_recordings(os.path.join(workdir, "recordings"))
+    ready = multiprocessing.Event()
+    cameras = multiprocessing.Process(target=serve_cameras, args=(args.camera_port, ready), daemon=True)
+    cameras.start()
+    ready.wait(30)
+    camera_base = f"http://127.0.0.1:{args.camera_port}/cam"
+    sabertooth = SabertoothEmulator(os.path.join(workdir, "motor"))
+    sabertooth.start()
+    server, base = start_server(args.port, sabertooth.path, "null", workdir, {
+        "DOOMSEEK_IMU_BACKEND": "null",
+        "DOOMSEEK_RTSP_BASE": camera_base,
+        "DOOMSEEK_FRAME_GRABBERS_ENABLED": "1",
+        "DOOMSEEK_THUMBNAILS_ENABLED": "0",
+        "DOOMSEEK_RECORDINGS_DIR": os.path.join(workdir, "recordings"),
+        "DOOMSEEK_RECORDINGS_INDEX_PATH": os.path.join(workdir, "recordings.sqlite"),
+        "DOOMSEEK_REMUX_CACHE_DIR": os.path.join(workdir, "cache"),
+        "DOOMSEEK_SNAPSHOT_DIR": os.path.join(workdir, "inspection"),
+    })
+    failed, finished = False, False
+    try:
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            grabbers = httpx.get(f"{base}/snapshot/grabbers").json()
+            if all(stats["frames"] for stats in grabbers.values()):
+                break
+            time.sleep(0.2)
+        else:
+            raise RuntimeError(f"Frame grabbers didn't connect to {camera_base}: {grabbers}")
+
+        quiet = []
+        drive(base, sabertooth, args.seconds, quiet)
+        quiet = summary("quiet", quiet)
+
+        stop, counted = multiprocessing.Event(), multiprocessing.Queue()
+        load = multiprocessing.Process(target=storm, args=(base, stop, args.snapshot_clients, counted))
+        load.start()
+        time.sleep(1.0)  # Let the queues fill
+        loaded = []
+        drive(base, sabertooth, args.seconds, loaded)
+        stop.set()
+        counts = counted.get(timeout=60)
+        load.join(10)
+        loaded = summary("storm", loaded)
+
+        print("Storm requests: " + ", ".join(f"{key} x{n}" for key, n in sorted(counts.items())))
+        for name, stats in httpx.get(f"{base}/executors").json().items():
+            print(f"  {name:>7}: wait p95 {stats['wait_ms_p95']} ms, max {stats['wait_ms_max']} ms | "
+                  f"run p95 {stats['run_ms_p95']} ms | rejected {stats.get('rejected', 0)}, "
+                  f"timeouts {stats.get('timeouts', 0)}")
+        latency = httpx.get(f"{base}/metrics/summary").json()["latency"]
+        for key in ("event_loop_lag", "control_apply"):
+            if key in latency:
+                print(f"  {key}: p95 {latency[key]['p95_ms']} ms, max {latency[key]['max_ms']} ms")
+        limits = {0.5: quiet[0.5] * args.max_ratio + args.slack_ms / 1000,
+                  0.95: quiet[0.95] + P95_SLACK_MS / 1000}
+        for q, limit in limits.items():
+            verdict = "ok" if loaded[q] <= limit else "FAIL"
+            failed |= verdict != "ok"
+            print(f"p{q * 100:.0f}: {loaded[q] * 1000:.2f} ms under load, limit {limit * 1000:.2f} ms -> {verdict}")
+        finished = True
+    finally:
+        server.terminate()
+        server.wait(10)
+        sabertooth.stop()
+        cameras.terminate()
+        if failed or not finished:
+            with open(os.path.join(workdir, "server.log")) as log:
+                print("Server log (last lines):\n" + "".join(log.readlines()[-40:]), end="")
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
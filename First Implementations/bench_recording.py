@@ -0,0 +1,182 @@
+# End-to-end check of on-demand recording (recording_control.py) against the
+# mediamtx stand-in (mediamtx_emulator.py) and the emulated IMU, which rolls the
+# robot from the floor onto a wall and back every 31 s.
+# Records both cameras for --seconds, cutting a segment every --cut-every
+# seconds and marking in between, then stops and checks that:
+#   - every span has segments and every segment belongs to exactly one span
+#   - every span is tagged with its start/end time and surface/wall at both ends
+#   - the idle hour-long segments before and after are not part of any span
+#   - /recordings?location= returns only segments of spans that visited the wall
+#   - a record: true the emulator refuses once after record: false is tried
+#     again, and one refused twice leaves the camera reported as not recording
+# Reports the latency of each action and the size of the operator's segments
+# against an hour-long one at the same bitrate. Exits with status 1 on a failed check.
+#
+# Usage:
+#   python3 bench_recording.py
+#   python3 bench_recording.py --seconds 60 --cut-every 5
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench_hardware import percentiles, start_server
+from hw_emulator import SabertoothEmulator, WT901Emulator
+from mediamtx_emulator import MediaMTXEmulator
+
+CAMERAS = ("camA", "camB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="On-demand recording against a mediamtx stand-in")
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--api-port", type=int, default=9998)
+    parser.add_argument("--seconds", type=float, default=40.0, help="length of the operator's recording")
+    parser.add_argument("--cut-every", type=float, default=8.0)
+    parser.add_argument("--segment-seconds", type=int, default=60)
+    parser.add_argument("--bitrate", type=float, default=4.0, help="Mbit/s per camera")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="doomseek-recording-")
+    recordings = os.path.join(workdir, "recordings")
+    mediamtx = MediaMTXEmulator(recordings, args.api_port, CAMERAS, bitrate=int(args.bitrate * 1e6))
+    mediamtx.start()
+    sabertooth = SabertoothEmulator(os.path.join(workdir, "motor"))
+    sabertooth.start()
+    wt901 = WT901Emulator(os.path.join(workdir, "imu"), {t: 50.0 for t in (0x51, 0x52, 0x53)})
+    wt901.start()
+    server, base = start_server(args.port, sabertooth.path, wt901.path, workdir, {
+        "DOOMSEEK_FRAME_GRABBERS_ENABLED": "0",
+        "DOOMSEEK_THUMBNAILS_ENABLED": "0",
+        "DOOMSEEK_MEDIAMTX_API": mediamtx.base,
+        "DOOMSEEK_RECORD_SEGMENT_SECONDS": str(args.segment_seconds),
+        "DOOMSEEK_RECORDINGS_DIR": recordings,
+        "DOOMSEEK_RECORDINGS_INDEX_PATH": os.path.join(workdir, "recordings.sqlite"),
+        "DOOMSEEK_RECORDINGS_SCAN_INTERVAL": "0.5",
+        "DOOMSEEK_REMUX_CACHE_DIR": os.path.join(workdir, "cache"),
+    })
+    failures = []
+
+    def check(ok, message):
+        if not ok:
+            failures.append(message)
+            print(f"FAIL: {message}")
+
+    try:
+        latencies = {}
+        with httpx.Client(base_url=base, timeout=10) as client:
+            def act(camera, action, note=None):
+                started = time.perf_counter()
+                body = {"camera": camera, "action": action}
+                if note is not None:
+                    body["note"] = note
+                response = client.post("/proxy-record", json=body)
+                latencies.setdefault(action, []).append(time.perf_counter() - started)
+                response.raise_for_status()
+                return response.json()
+
+            time.sleep(2.0)   # An idle segment to begin with
+            for camera in CAMERAS:
+                act(camera, "start", "survey")
+            deadline = time.monotonic() + args.seconds
+            next_cut = time.monotonic() + args.cut_every
+            n = 0
+            while time.monotonic() < deadline:
+                time.sleep(min(args.cut_every / 2, max(0.0, deadline - time.monotonic())))
+                n += 1
+                for camera in CAMERAS:
+                    if time.monotonic() >= next_cut:
+                        act(camera, "cut", f"finding {n}")
+                    else:
+                        act(camera, "mark", f"look at {n}")
+                if time.monotonic() >= next_cut:
+                    next_cut += args.cut_every
+            time.sleep(1.5)   # A keyframe into the last span, a cut at the deadline leaves it empty
+            stopped = {camera: act(camera, "stop") for camera in CAMERAS}
+            time.sleep(2.0)   # The idle segment after
+            state = client.get("/recordings/control").json()
+            time.sleep(1.5)   # A scan after the last segment closed
+            spans = client.get("/recordings/spans", params={"limit": 500}).json()["spans"]
+            listed = client.get("/recordings", params={"limit": 500}).json()["recordings"]
+
+            for action, samples in latencies.items():
+                print(f"{action:>6}: {percentiles(samples)} | {len(samples)} requests")
+            print(f"mediamtx API: {state['api_calls']} calls, {state['api_errors']} errors | "
+                  f"emulator: {mediamtx.stats['patches']} patches, {mediamtx.stats['segments']} segments")
+
+            in_spans = {}
+            for span in spans:
+                check(span["segments"], f"span {span['id']} ({span['camera']}) has no segments")
+                check(span["ended"] is not None and span["end"] and span["start"]["surface"]
+                      and span["end"]["surface"], f"span {span['id']} is missing its tags")
+                for segment in span["segments"]:
+                    check(segment["path"] not in in_spans,
+                          f"{segment['path']} is in spans {in_spans.get(segment['path'])} and {span['id']}")
+                    in_spans[segment["path"]] = span["id"]
+            for recording in listed:
+                span = recording["span"]
+                expected = in_spans.get(recording["path"])
+                check((span["id"] if span else None) == expected,
+                      f"{recording['path']} listed with span {span and span['id']}, expected {expected}")
+            idle = [recording for recording in listed if recording["path"] not in in_spans]
+            check(len(idle) >= 2 * len(CAMERAS), f"expected idle segments before and after, got {len(idle)}")
+            for camera, result in stopped.items():
+                check(result["url"] and result["url"].endswith(result["segments"][-1]),
+                      f"stop on {camera} returned {result['url']}")
+
+            locations = sorted({location for span in spans for location in span["locations"]})
+            for location in locations:
+                paths = {r["path"] for r in client.get("/recordings", params={"limit": 500, "location": location})
+                         .json()["recordings"]}
+                expected = {path for path, span_id in in_spans.items()
+                            if location in next(s for s in spans if s["id"] == span_id)["locations"]}
+                check(paths == expected, f"location={location} listed {len(paths)}, expected {len(expected)}")
+
+            sizes = [r["size"] for r in listed if r["path"] in in_spans]
+            hour = args.bitrate * 1e6 / 8 * 3600
+            print(f"Spans: {len(spans)} over {len(CAMERAS)} cameras, {len(in_spans)} segments, "
+                  f"walls visited {locations}")
+            for span in sorted(spans, key=lambda s: (s["camera"], s["started"]))[:2 * len(CAMERAS)]:
+                print(f"  {span['camera']} span {span['id']}: {span['ended'] - span['started']:.1f} s, "
+                      f"{span['start']['location']} -> {span['end']['location']}, {len(span['marks'])} marks, "
+                      f"note {span['note']!r}")
+            if sizes:
+                print(f"Operator segments: mean {sum(sizes) / len(sizes) / 2 ** 20:.1f} MB, "
+                      f"max {max(sizes) / 2 ** 20:.1f} MB | an idle 1h segment: {hour / 2 ** 20:.0f} MB")
+
+            # Lost record: true patches, after the checks above so their spans don't count there
+            camera = CAMERAS[0]
+            conf = mediamtx.paths[camera].conf
+            short = f"{args.segment_seconds}s"
+            for action, expected in (("start", short), ("cut", short), ("stop", "1h")):
+                if action == "stop":
+                    act(camera, "start")
+                mediamtx.fail_records(camera, 1)
+                act(camera, action)
+                check(conf["record"] and conf["recordSegmentDuration"] == expected,
+                      f"{action} with one refused record: true left {camera} at {conf}")
+            act(camera, "start")
+            mediamtx.fail_records(camera, 2)
+            response = client.post("/proxy-record", json={"camera": camera, "action": "cut"})
+            recording = client.get("/recordings/control").json()["cameras"][camera]["recording"]
+            check(response.status_code == 502 and not recording and not conf["record"],
+                  f"cut with two refused record: true answered {response.status_code}, "
+                  f"recording {recording}, mediamtx record {conf['record']}")
+            state = client.get("/recordings/control").json()
+            print(f"Refused record: true: {state['api_errors']} API errors, {state['api_retries']} retried")
+    finally:
+        server.terminate()
+        server.wait(10)
+        mediamtx.stop()
+        sabertooth.stop()
+        wt901.stop()
+        print(f"Server log: {os.path.join(workdir, 'server.log')}")
+    print("ok" if not failures else f"{len(failures)} checks failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
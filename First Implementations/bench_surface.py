@@ -0,0 +1,211 @@
+# Benchmark for surface classification.
+# Runs the original per-angle-frame surface() check (last accel sample, fixed
+# 0.7 g thresholds) and SurfaceTracker over the same IMU stream and reports
+# label changes, spurious flips, classification latency and cost per sample.
+#
+# The synthetic stream has a known ground truth: the robot rolls from the floor
+# onto each wall and back, crawls a curved section that stays 38° off the floor,
+# with motor vibration, jolts and gyro bias on top. Recorded mission logs have
+# no ground truth; there a flip is a change that is undone within FLIP_SECONDS,
+# and latency is measured against the changes of the original classifier that
+# lasted at least that long.
+#
+# Usage:
+#   python3 bench_surface.py                       # synthetic run
+#   python3 bench_surface.py --input logs/missions # recorded mission logs
+import argparse
+import contextlib
+import io
+import math
+import random
+import time
+
+import config
+from mission_log import read_segment, list_segments, KIND_IMU
+from surface_detection import SurfaceTracker, surface
+from wt901 import FrameBuffer, ACCEL, GYRO, ANGLE, ACCEL_SCALE, GYRO_SCALE, ANGLE_SCALE
+
+RATE_HZ = 100.0         # per data type
+READ_INTERVAL = 0.01    # the reader hands over frames in batches this far apart
+FLIP_SECONDS = 2.0      # a change undone within this long is a flip
+MATCH_SECONDS = 3.0     # a detection this long after a true change still counts for it
+
+# (seconds, tilt in degrees at the end of the phase); tilt rolls about y,
+# +90 is the right wall and -90 the left wall
+SCENARIO = ((5, 0), (1.5, 90), (8, 90), (1.5, 0), (4, 0), (2, 38), (10, 38), (2, 0), (3, 0),
+            (1.5, -90), (8, -90), (1.5, 0), (5, 0))
+
+
+def truth_surface(tilt):
+    if abs(tilt) < 45:
+        return "Floor"
+    return "Right Wall" if tilt > 0 else "Left Wall"
+
+
+def synthetic_stream(seed=1):
+    """
+    Returns ([(t, data_type, values), ...] with values in g, deg/s and deg,
+    [(t, surface), ...] ground truth changes).
+    """
+    rng = random.Random(seed)
+    t, tilt, yaw = 0.0, 0.0, 0.0
+    dt = 1.0 / RATE_HZ
+    gyro_bias = (0.4, -0.3, 0.2)
+    current = truth_surface(0.0)
+    samples, truth = [], [(0.0, current)]   # the starting surface counts as the first change
+    for seconds, target in SCENARIO:
+        steps = int(seconds * RATE_HZ)
+        rate = (target - tilt) / seconds
+        for _ in range(steps):
+            # The curved section wobbles a few degrees around its mean tilt
+            wobble_rate = 12.0 * math.cos(t * 3.0) if target == 38 and rate == 0 else 0.0
+            tilt += (rate + wobble_rate) * dt
+            yaw = (yaw + 3.0 * dt + 180.0) % 360.0 - 180.0
+            read_at = math.ceil(t / READ_INTERVAL) * READ_INTERVAL
+            if truth_surface(tilt) != current:
+                current = truth_surface(tilt)
+                truth.append((t, current))
+            rad = math.radians(tilt)
+            jolt = rng.random() < 0.01
+            accel = [math.sin(rad), 0.0, -math.cos(rad)]
+            accel = [v + rng.gauss(0.0, 0.12) + (rng.uniform(-0.8, 0.8) if jolt else 0.0) for v in accel]
+            gyro = [rng.gauss(0.0, 2.0) + gyro_bias[0], rate + wobble_rate + rng.gauss(0.0, 2.0) + gyro_bias[1],
+                    3.0 + rng.gauss(0.0, 2.0) + gyro_bias[2]]
+            samples.append((read_at, ACCEL, accel))
+            samples.append((read_at, GYRO, gyro))
+            samples.append((read_at, ANGLE, [tilt + rng.gauss(0.0, 0.5), rng.gauss(0.0, 0.5), yaw]))
+            t += dt
+    return samples, truth
+
+
+def recorded_stream(path):
+    samples = []
+    frames = FrameBuffer()
+    for kind, t, payload in read_segment_all(path):
+        if kind != KIND_IMU:
+            continue
+        frames.append(payload)
+        for data_type, values in frames.pop_frames():
+            scale = {ACCEL: ACCEL_SCALE, GYRO: GYRO_SCALE, ANGLE: ANGLE_SCALE}.get(data_type)
+            if scale is not None:
+                samples.append((t, data_type, [values[0] * scale, values[1] * scale, values[2] * scale]))
+    return samples
+
+
+def read_segment_all(path):
+    for segment in list_segments(path):
+        for kind, t, payload in read_segment(segment):
+            if kind is not None:
+                yield kind, t, payload
+
+
+def run_legacy(samples):
+    """surface() on every angle frame with the newest accel sample, as the server did"""
+    changes, label, accel = [], None, None
+    for t, data_type, values in samples:
+        if data_type == ACCEL:
+            accel = values
+        elif data_type == ANGLE:
+            new = surface(values[1], values[0], accel)
+            if new != label:
+                changes.append((t, new))
+                label = new
+    return changes
+
+
+def run_tracker(samples):
+    tracker = SurfaceTracker(config.SURFACE_ENTER, config.SURFACE_EXIT, config.SURFACE_DWELL,
+                             config.SURFACE_FILTER_TAU, history=None)
+    update = {ACCEL: tracker.accel, GYRO: tracker.gyro, ANGLE: tracker.angle}
+    with contextlib.redirect_stdout(io.StringIO()):  # the calibration message
+        for t, data_type, values in samples:
+            update[data_type](t, *values)
+    return [(event["at"], event["to"]) for event in tracker.events]
+
+
+def definite(changes):
+    """Changes between real surfaces, "Transitioning" in between is skipped"""
+    result, last = [], None
+    for t, label in changes:
+        if label != "Transitioning" and label != last:
+            result.append((t, label))
+            last = label
+    return result
+
+
+def flips(changes):
+    changes = definite(changes)
+    return sum(1 for (t1, _), (t2, label), (_, before) in zip(changes[1:], changes[2:], changes)
+               if label == before and t2 - t1 < FLIP_SECONDS)
+
+
+def match(reference, changes):
+    """
+    (reference changes detected after the starting surface, their latencies,
+    detected changes matching none). A detection counts only at or after the
+    change it matches, one before it is a guess or noise.
+    """
+    changes = definite(changes)
+    used, latencies = set(), []
+    for n, (t_ref, label) in enumerate(reference):
+        for i, (t, detected) in enumerate(changes):
+            if i not in used and detected == label and t_ref <= t <= t_ref + MATCH_SECONDS:
+                used.add(i)
+                if n:
+                    latencies.append(t - t_ref)
+                break
+    return len(latencies), latencies, len(changes) - len(used)
+
+
+def timed(fn, samples, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(samples)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def report(name, changes, elapsed, samples, reference):
+    detected, latencies, unmatched = match(reference, changes)
+    latency = (f"latency mean {sum(latencies) / len(latencies) * 1000:.0f} ms, max {max(latencies) * 1000:.0f} ms"
+               if latencies else "latency n/a")
+    print(f"{name:>8}: {len(changes):4d} label changes | {flips(changes):3d} flips | "
+          f"{unmatched:3d} spurious | {detected}/{len(reference) - 1} changes detected, {latency} | "
+          f"{elapsed / len(samples) * 1e9:.0f} ns/sample")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Surface classification benchmark")
+    parser.add_argument("--input", help="a .dslog segment or a directory of mission logs")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.input:
+        samples = recorded_stream(args.input)
+        truth = None
+    else:
+        samples, truth = synthetic_stream(args.seed)
+    if not samples:
+        print("No IMU samples")
+        return
+    print(f"Stream: {len(samples)} samples over {samples[-1][0] - samples[0][0]:.1f} s")
+
+    legacy, legacy_time = timed(run_legacy, samples, args.repeat)
+    tracker, tracker_time = timed(run_tracker, samples, args.repeat)
+    if truth is None:
+        # Recorded: lasting changes of the original classifier stand in for the truth
+        steps = definite(legacy) + [(math.inf, None)]
+        truth = [(t, label) for (t, label), (t_next, _) in zip(steps, steps[1:]) if t_next - t >= FLIP_SECONDS]
+        print(f"Reference: {len(truth) - 1} changes of the original classifier lasting "
+              f"{FLIP_SECONDS:.0f} s or more")
+    else:
+        print(f"Ground truth: {len(truth) - 1} surface changes")
+    report("legacy", legacy, legacy_time, samples, truth)
+    report("tracker", tracker, tracker_time, samples, truth)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,41 @@
-import subprocess
-import os
-
-# Track zoom values for each camera
-cam_zoom = {
-    "camA": 0,
-    "camB": 0
-}
-
-# Start Camera B
-def start_camB():
-    cmd = (
-       "ffmpeg -f v4l2 -input_format h264 -framerate 30 -video_size 1920x1080 "
-        "-i /dev/video2 "
-        "-c:v copy -an -fflags nobuffer -flags low_delay "
-        "-b:v 10M -maxrate 10M -bufsize 12M "
-        "-f rtsp -rtsp_transport tcp rtsp://localhost:8554/webrtc/camB "
-        "> logs/camB.log 2>&1 &"
-    )
-    os.system(cmd)
-    print("Camera B started")
-
-# Start Camera A
-def start_camA():
-    cmd = (
-        "ffmpeg -f v4l2 -input_format h264 -framerate 30 -video_size 1920x1080 "
-        "-i /dev/video0 "
-        "-c:v copy -an -fflags nobuffer -flags low_delay "
-        "-b:v 10M -maxrate 10M -bufsize 12M "
-        "-f rtsp -rtsp_transport tcp rtsp://localhost:8554/webrtc/camA "
-        "> logs/camA.log 2>&1 &"
-    )
-    os.system(cmd)
-    print("Camera A started")
-
-# Zoom In for Camera A
-def camA_zoom_in():
-    if cam_zoom["camA"] < 50:  # max = 50
-        cam_zoom["camA"] += 5
-        subprocess.run(["v4l2-ctl", "-d", "/dev/video0", "-c", f"zoom_absolute={cam_zoom['camA']}"])
-        print(f"Camera A zoom set to {cam_zoom['camA']}")
-
-# Zoom Out for Camera A
-def camA_zoom_out():
-    if cam_zoom["camA"] > 0:  # min = 0
-        cam_zoom["camA"] -= 5
-        subprocess.run(["v4l2-ctl", "-d", "/dev/video0", "-c", f"zoom_absolute={cam_zoom['camA']}"])
-        print(f"Camera A zoom set to {cam_zoom['camA']}")
-
-# Zoom In for Camera B
-def camB_zoom_in():
-    if cam_zoom["camB"] < 50:
-        cam_zoom["camB"] += 5
-        subprocess.run(["v4l2-ctl", "-d", "/dev/video2", "-c", f"zoom_absolute={cam_zoom['camB']}"])
-        print(f"Camera B zoom set to {cam_zoom['camB']}")
-
-# Zoom Out for Camera B
-def camB_zoom_out():
-    if cam_zoom["camB"] > 0:
-        cam_zoom["camB"] -= 5
-        subprocess.run(["v4l2-ctl", "-d", "/dev/video2", "-c", f"zoom_absolute={cam_zoom['camB']}"])
-        print(f"Camera B zoom set to {cam_zoom['camB']}")
+import time
+
+import config
+from camera_supervisor import CameraPipeline
+
+# Zoom, focus and exposure are set by the server itself, see v4l2_controls.py
+# The server runs the camera pipelines too (CAMERA_PIPELINES_ENABLED). Run this
+# script instead only with DOOMSEEK_CAMERA_PIPELINES_ENABLED=0 on the server.
+
+# ffmpeg command that publishes a camera's H.264 stream to mediamtx
+def pipeline_command(camera, device):
+    return [
+        config.FFMPEG, "-f", "v4l2", "-input_format", "h264", "-framerate", "30", "-video_size", "1920x1080",
+        "-i", device,
+        "-c:v", "copy", "-an", "-fflags", "nobuffer", "-flags", "low_delay",
+        "-b:v", "10M", "-maxrate", "10M", "-bufsize", "12M",
+        "-f", "rtsp", "-rtsp_transport", "tcp", f"{config.RTSP_BASE}/{camera}",
+    ]
+
+# One supervised pipeline per camera, logging to logs/<camera>.log
+def create_pipelines():
+    return {camera: CameraPipeline(camera, pipeline_command(camera, device), f"logs/{camera}.log",
+                                   config.CAMERA_STALL_TIMEOUT)
+            for camera, device in config.CAMERA_DEVICES.items()}
 
 # Start both cameras when script runs
 if __name__ == "__main__":
-    start_camA()
-    start_camB()
+    pipelines = create_pipelines()
+    for pipeline in pipelines.values():
+        pipeline.start()
+        print(f"Camera {pipeline.camera} started")
+    try:
+        while True:
+            time.sleep(10)
+            for camera, pipeline in pipelines.items():
+                print(camera, pipeline.get_state())
+    except KeyboardInterrupt:
+        for pipeline in pipelines.values():
+            pipeline.stop()
+        for pipeline in pipelines.values():
+            pipeline.join()
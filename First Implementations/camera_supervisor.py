@@ -0,0 +1,174 @@
+# Supervised ffmpeg camera pipelines, one thread per camera.
+# Each thread owns its ffmpeg child and reads the key=value blocks ffmpeg writes
+# with -progress (about two a second) for live fps, bitrate, drop/dup counts and
+# speed. If no block arrives, or the frame counter stops moving, for
+# `stall_timeout` seconds the pipeline is killed and restarted; a pipeline that
+# exits is restarted too. Restarts back off exponentially, and the backoff is
+# reset once a pipeline has run cleanly for a while. Cameras are independent, a
+# glitching USB camera never touches the other one or the server.
+import os
+import select
+import subprocess
+import threading
+import time
+
+BACKOFF_START = 0.5
+BACKOFF_MAX = 30.0
+STABLE_SECONDS = 60.0          # running this long resets the backoff
+STARTUP_GRACE = 5.0            # extra time for opening the camera and the RTSP session
+LOG_MAX_BYTES = 5 * 1024 * 1024
+
+
+def _number(text, suffix=""):
+    text = text.strip().removesuffix(suffix)
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class CameraPipeline(threading.Thread):
+    def __init__(self, camera, command, log_path, stall_timeout=2.0):
+        super().__init__(name=f"pipeline-{camera}", daemon=True)
+        self.camera = camera
+        self.command = list(command) + ["-progress", "pipe:1", "-nostats"]
+        self.log_path = log_path
+        self.stall_timeout = stall_timeout
+        self._restart = threading.Event()
+        self._running = True
+        self.state = {
+            "state": "starting", "pid": None, "started_at": None, "restarts": 0, "stalls": 0,
+            "last_exit": None, "last_error": None, "frame": 0, "fps": None, "bitrate_kbps": None,
+            "total_size": None, "drop_frames": 0, "dup_frames": 0, "speed": None, "last_progress": None,
+        }
+
+    def stop(self):
+        self._running = False
+        self._restart.set()
+
+    def restart(self):
+        """Kills the current ffmpeg, the supervisor starts a fresh one right away"""
+        self._restart.set()
+
+    def get_state(self):
+        state = dict(self.state)
+        now = time.monotonic()
+        state["uptime"] = round(now - state["started_at"], 1) if state["started_at"] else None
+        state["progress_age"] = round(now - state["last_progress"], 2) if state["last_progress"] else None
+        del state["started_at"], state["last_progress"]
+        return state
+
+    def _open_log(self):
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > LOG_MAX_BYTES:
+            os.replace(self.log_path, self.log_path + ".1")
+        log = open(self.log_path, "ab")
+        log.write(f"\n--- {time.strftime('%Y-%m-%d %H:%M:%S')} starting {self.camera}\n".encode())
+        log.flush()
+        return log
+
+    def _log_tail(self):
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(max(0, os.path.getsize(self.log_path) - 300))
+                lines = f.read().decode(errors="replace").strip().splitlines()
+            return lines[-1] if lines else None
+        except OSError:
+            return None
+
+    def _apply_progress(self, block):
+        state = self.state
+        frame = int(block.get("frame", state["frame"]) or 0)
+        state["fps"] = _number(block.get("fps", ""))
+        state["bitrate_kbps"] = _number(block.get("bitrate", ""), "kbits/s")
+        state["total_size"] = int(_number(block.get("total_size", "")) or 0) or state["total_size"]
+        state["drop_frames"] = int(_number(block.get("drop_frames", "")) or 0)
+        state["dup_frames"] = int(_number(block.get("dup_frames", "")) or 0)
+        state["speed"] = _number(block.get("speed", ""), "x")
+        return frame
+
+    def _supervise(self, proc):
+        """Reads progress until ffmpeg exits, stalls or a restart is asked for. Returns the reason."""
+        buffer = b""
+        block = {}
+        last_advance = time.monotonic() + STARTUP_GRACE
+        while True:
+            if self._restart.is_set():
+                return "restart requested"
+            ready, _, _ = select.select([proc.stdout], [], [], 0.25)
+            now = time.monotonic()
+            if ready:
+                data = os.read(proc.stdout.fileno(), 4096)
+                if not data:
+                    proc.wait()
+                    return f"exited with {proc.returncode}"
+                buffer += data
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    key, _, value = line.decode(errors="replace").partition("=")
+                    block[key.strip()] = value.strip()
+                    if key.strip() != "progress":
+                        continue
+                    # End of a progress block
+                    frame = self._apply_progress(block)
+                    self.state["last_progress"] = now
+                    if frame > self.state["frame"]:
+                        last_advance = now
+                        self.state["state"] = "running"
+                    self.state["frame"] = frame
+                    if block["progress"] == "end":
+                        proc.wait()
+                        return f"ended with {proc.returncode}"
+                    block = {}
+            if now - last_advance > self.stall_timeout:
+                self.state["stalls"] += 1
+                self.state["state"] = "stalled"
+                return f"stalled, no new frames for {now - last_advance:.1f}s"
+
+    def _kill(self, proc):
+        if proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(1)  # A stuck V4L2 read can ignore SIGTERM
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+    def run(self):
+        backoff = BACKOFF_START
+        while self._running:
+            self._restart.clear()
+            log = self._open_log()
+            started = time.monotonic()
+            self.state.update(state="starting", started_at=started, frame=0, fps=None, last_progress=None)
+            try:
+                proc = subprocess.Popen(self.command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                        stderr=log)
+            except OSError as e:
+                reason = str(e)
+            else:
+                self.state["pid"] = proc.pid
+                try:
+                    reason = self._supervise(proc)
+                finally:
+                    self._kill(proc)
+                    proc.stdout.close()
+            log.close()
+            self.state.update(pid=None, started_at=None, last_exit=reason)
+            if not self._running:
+                break
+            requested = self._restart.is_set()
+            if not requested:
+                # A stalled ffmpeg usually logged nothing useful, the reason says more
+                stalled = self.state["state"] == "stalled"
+                self.state["last_error"] = reason if stalled else (self._log_tail() or reason)
+            self.state["restarts"] += 1
+            print(f"Camera pipeline {self.camera} {reason}, restarting")
+
+            if requested or time.monotonic() - started > STABLE_SECONDS:
+                backoff = BACKOFF_START
+            if not requested:
+                self.state["state"] = "backoff"
+                self._restart.wait(backoff)
+                backoff = min(backoff * 2, BACKOFF_MAX)
+        self.state["state"] = "stopped"
@@ -1,15 +1,220 @@
 # This script is used to control a robot using a joystick.
-# It sends the motor speeds and actions to a server via HTTP POST requests.
+# It sends the motor speeds and actions to the server over a persistent
+# WebSocket (/ws/control) using the binary frames from drive_protocol.py.
 # [Pygame controls Info](https://www.pygame.org/docs/ref/joystick.html)
 # Our controls are for a Playstation 4 controller
+#
+# The input loop sleeps until pygame has an event and hands the resulting
+# command to CommandSender, which owns the connection on its own thread. A
+# command is only sent when it differs from the last one sent, plus a heartbeat
+# that keeps the server's dead-man timer (DEADMAN_TIMEOUT, 0.5 s) from
+# stopping a robot that is being held at a steady speed.
+import collections
+import threading
+import time
+
+import numpy as np
+
+from drive_protocol import encode_drive, decode_ack, clamp_speed, ACK_APPLIED, ACK_STALE, SEQ_MASK
+
+SERVER_URL = "ws://192.168.8.104:8000/ws/control"
+RECONNECT_DELAY = 1.0     # seconds between connection attempts
+REPORT_INTERVAL = 5.0
+HEARTBEAT = 0.2           # resend interval while driving, must stay under the dead-man timeout
+IDLE_HEARTBEAT = 1.0      # resend interval while stopped
+ONESHOT_RETRIES = 3       # a picture/zoom overtaken by a drive frame is sent again
+
+# Axis value -> speed curves, precomputed for every step of the stick
+LUT_SIZE = 1025           # odd, so 0.0 is an entry of its own
+LUT_SCALE = (LUT_SIZE - 1) / 2.0
+AXIS_GRID = np.linspace(-1.0, 1.0, LUT_SIZE)
+DEADZONE = 0.10
+
+
+def build_tables(base_speed):
+    """Trigger and steering curves for base_speed, as lists indexed by axis_index()"""
+    trigger = np.interp(AXIS_GRID, [0.00, 1.00], [0, base_speed])
+    steering = np.where(AXIS_GRID > DEADZONE, np.interp(AXIS_GRID, [DEADZONE, 1.00], [0, base_speed]),
+                        np.where(AXIS_GRID < -DEADZONE,
+                                 np.interp(AXIS_GRID, [-1.00, -DEADZONE], [base_speed, 0]), 0))
+    return {"trigger": np.rint(trigger).astype(int).tolist(), "steering": np.rint(steering).astype(int).tolist()}
+
+
+def axis_index(value):
+    return int((min(1.0, max(-1.0, value)) + 1.0) * LUT_SCALE + 0.5)
+
+
+class CommandSender(threading.Thread):
+    """
+    Owns the control WebSocket. submit() sets the current drive command and
+    returns at once; this thread sends it if it changed, and repeats the last
+    one every HEARTBEAT (IDLE_HEARTBEAT while stopped). One-shot actions
+    (picture, zoom) go through trigger() and are never coalesced away.
+    Acks are read on a thread of their own and give the round-trip time.
+    """
+
+    def __init__(self, url, heartbeat=HEARTBEAT, idle_heartbeat=IDLE_HEARTBEAT):
+        super().__init__(name="command-sender", daemon=True)
+        self.url = url
+        self.heartbeat = heartbeat
+        self.idle_heartbeat = idle_heartbeat
+        self._cond = threading.Condition()
+        self._command = ("stop", 0, 0)
+        self._input_at = None          # perf_counter() of the input that produced _command
+        self._oneshots = collections.deque()
+        self._running = True
+        self._ws = None
+        self._retry_at = 0.0
+        self._seq = 0
+        self._sent_at = {}             # seq -> perf_counter() at send, cleared by the ack
+        self._oneshot_seqs = {}        # seq -> (action, attempts) until acked
+        self.stats = {"submitted": 0, "unchanged": 0, "sends": 0, "heartbeats": 0, "oneshots": 0,
+                      "errors": 0, "latency_count": 0, "latency_total": 0.0, "latency_max": 0.0,
+                      "rtt_count": 0, "rtt_total": 0.0, "rtt_max": 0.0, "stale": 0}
+        self._reported = time.monotonic()
+
+    def submit(self, action, motor1_speed, motor2_speed, input_at=None):
+        command = (action, clamp_speed(motor1_speed), clamp_speed(motor2_speed))
+        with self._cond:
+            self.stats["submitted"] += 1
+            if command == self._command:
+                self.stats["unchanged"] += 1
+                return
+            self._command = command
+            self._input_at = input_at
+            self._cond.notify()
+
+    def trigger(self, action, input_at=None, attempts=0):
+        with self._cond:
+            self._oneshots.append((action, input_at, attempts))
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def run(self):
+        sent, last_sent_at = None, 0.0
+        while True:
+            with self._cond:
+                while self._running and not self._oneshots and self._command == sent:
+                    wait = last_sent_at + self._interval(sent) - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                if not self._running:
+                    break
+                oneshots, self._oneshots = self._oneshots, collections.deque()
+                command, input_at, self._input_at = self._command, self._input_at, None
+
+            for action, oneshot_input_at, attempts in oneshots:
+                seq = self._send((action, 0, 0), oneshot_input_at)
+                if seq is None:
+                    break
+                self.stats["oneshots"] += 1
+                self._oneshot_seqs[seq] = (action, attempts)
+            # A one-shot that failed to send is dropped, a stale picture is worse than none
+            heartbeat = command == sent
+            if heartbeat and time.monotonic() - last_sent_at < self._interval(sent):
+                continue  # Woken for a one-shot only, a drive frame now would overtake it
+            if self._send(command, None if heartbeat else input_at) is None:
+                sent = None  # Everything is sent again once connected
+                with self._cond:
+                    self._cond.wait(max(0.0, self._retry_at - time.monotonic()))
+                continue
+            sent, last_sent_at = command, time.monotonic()
+            self.stats["heartbeats" if heartbeat else "sends"] += 1
+        if self._ws is not None:
+            self._ws.close()
+
+    def _interval(self, command):
+        return self.idle_heartbeat if command[0] == "stop" else self.heartbeat
+
+    def _connect(self):
+        from websockets.sync.client import connect
+        try:
+            ws = connect(self.url, open_timeout=RECONNECT_DELAY)
+        except Exception as e:
+            print(f"Error connecting to {self.url}: {e}")
+            return None
+        threading.Thread(target=self._read_acks, args=(ws,), daemon=True).start()
+        print("Control channel connected")
+        return ws
+
+    def _send(self, command, input_at):
+        """Sends one drive frame, returns its sequence number or None"""
+        if self._ws is None:
+            if time.monotonic() < self._retry_at:
+                return None
+            self._ws = self._connect()
+            if self._ws is None:
+                self._retry_at = time.monotonic() + RECONNECT_DELAY
+                return None
+        self._seq = (self._seq + 1) & SEQ_MASK
+        if len(self._sent_at) > 1000:  # Acks lost, don't grow forever
+            self._sent_at.clear()
+            self._oneshot_seqs.clear()
+        self._sent_at[self._seq] = time.perf_counter()
+        try:
+            self._ws.send(encode_drive(*command, self._seq))
+        except Exception as e:
+            print(f"Error: {e}")
+            self.stats["errors"] += 1
+            self._ws.close()
+            self._ws = None
+            self._retry_at = time.monotonic() + RECONNECT_DELAY
+            self._sent_at.clear()
+            return None
+        if input_at is not None:
+            latency = (time.perf_counter() - input_at) * 1000.0
+            self.stats["latency_count"] += 1
+            self.stats["latency_total"] += latency
+            self.stats["latency_max"] = max(self.stats["latency_max"], latency)
+        return self._seq
+
+    def _read_acks(self, ws):
+        try:
+            for message in ws:
+                seq, status = decode_ack(message)
+                started = self._sent_at.pop(seq, None)
+                oneshot = self._oneshot_seqs.pop(seq, None)
+                if status != ACK_APPLIED:
+                    self.stats["stale"] += 1
+                    if status == ACK_STALE and oneshot is not None and oneshot[1] < ONESHOT_RETRIES:
+                        self.trigger(oneshot[0], attempts=oneshot[1] + 1)
+                elif started is not None:
+                    elapsed = (time.perf_counter() - started) * 1000.0
+                    self.stats["rtt_count"] += 1
+                    self.stats["rtt_total"] += elapsed
+                    self.stats["rtt_max"] = max(self.stats["rtt_max"], elapsed)
+        except Exception:
+            pass
+
+    def report(self):
+        now = time.monotonic()
+        if now - self._reported < REPORT_INTERVAL:
+            return
+        stats = self.stats
+        if stats["sends"] or stats["heartbeats"]:
+            line = f"Sent {stats['sends']} changes, {stats['heartbeats']} heartbeats, {stats['oneshots']} one-shots"
+            if stats["latency_count"]:
+                line += (f" | input->send avg {stats['latency_total'] / stats['latency_count']:.2f} ms"
+                         f" max {stats['latency_max']:.2f} ms")
+            if stats["rtt_count"]:
+                line += (f" | RTT avg {stats['rtt_total'] / stats['rtt_count']:.1f} ms"
+                         f" max {stats['rtt_max']:.1f} ms")
+            print(f"{line} | skipped {stats['stale']}")
+        for key in stats:
+            stats[key] = 0.0 if isinstance(stats[key], float) else 0
+        self._reported = now
+
 
 def main():
     import pygame
-    import numpy as np
-    import requests
-    import time
 
-    SERVER_URL = "http://192.168.8.104:8000/control"
+    sender = CommandSender(SERVER_URL)
+    sender.start()
 
     pygame.init()
     pygame.joystick.init()
@@ -17,6 +222,7 @@ def main():
     screen = pygame.display.set_mode((400, 100))
     pygame.display.set_caption("Robot Controller - Focus This Window")
 
+    joystick = None
     if pygame.joystick.get_count() == 0:
         print("No controller detected!")
     else:
@@ -29,6 +235,7 @@ def main():
     min_speed = 65
     led_state = "Led Off"
     keyboard_detected = False
+    tables = build_tables(base_speed)
 
     keyboard_state = {
         "up": False,
@@ -38,25 +245,29 @@ def main():
     }
 
     def map_steering(value):
-        if value > 0.10:
-            return round(np.interp(value, [0.10, 1.00], [0, base_speed]))
-        elif value < -0.10:
-            return round(np.interp(value, [-1.00, -0.10], [base_speed, 0]))
-        else:
-            return 0
+        return tables["steering"][axis_index(value)]
 
     def map_forward(value):
-        return round(np.interp(value, [0.00, 1.00], [0, base_speed]))
+        return tables["trigger"][axis_index(value)]
 
     def map_reverse(value):
-        return round(np.interp(value, [0.00, 1.00], [0, base_speed]))
+        return tables["trigger"][axis_index(value)]
 
     try:
         while True:
-            for event in pygame.event.get():
+            # Sleep until there is input; the sender keeps the heartbeat going meanwhile
+            events = [pygame.event.wait(int(REPORT_INTERVAL * 1000))]
+            input_at = time.perf_counter()
+            events.extend(pygame.event.get())
+            for event in events:
                 if event.type == pygame.QUIT:
                     raise KeyboardInterrupt
 
+                if event.type == pygame.JOYDEVICEADDED and joystick is None:
+                    joystick = pygame.joystick.Joystick(event.device_index)
+                    joystick.init()
+                    print(f"Connected to: {joystick.get_name()}")
+
                 if event.type == pygame.KEYDOWN:
                     if not keyboard_detected:
                         print("Keyboard input detected. Keyboard control is active.")
@@ -81,53 +292,25 @@ def main():
                     if event.key in [pygame.K_d, pygame.K_RIGHT]:
                         keyboard_state["right"] = False
 # ------------------------------ Joystick Buttons ---------------------------- #
-                if event.type == pygame.JOYBUTTONDOWN and pygame.joystick.get_count() > 0:
+                if event.type == pygame.JOYBUTTONDOWN and joystick is not None:
                     if joystick.get_button(11):
                         base_speed = min(base_speed + 5, max_speed)
+                        tables = build_tables(base_speed)
                         print(f"Speed increased: {base_speed}")
                     if joystick.get_button(12):
                         base_speed = max(base_speed - 5, min_speed)
+                        tables = build_tables(base_speed)
                         print(f"Speed decreased: {base_speed}")
                     if joystick.get_button(1):
                         print("Picture button pressed!")
-                        data = {
-                            "motor1_speed": 0,
-                            "motor2_speed": 0,
-                            "action": "Take Picture"
-                        }
-                        try:
-                            response = requests.post(SERVER_URL, json=data)
-                            if response.status_code != 200:
-                                print(f"Failed to send Picture command: {response.status_code}")
-                        except requests.exceptions.RequestException as e:
-                            print(f"Error sending Picture command: {e}")
+                        sender.trigger("Take Picture", input_at)
                     if joystick.get_button(10):
                         print("Zoom In")
-                        data = {
-                            "motor1_speed": 0,
-                            "motor2_speed": 0,
-                            "action": "Zoom In"
-                        }
-                        try:
-                            response = requests.post(SERVER_URL, json=data)
-                            if response.status_code != 200:
-                                print(f"Failed to send Zoom command: {response.status_code}")
-                        except requests.exceptions.RequestException as e:
-                            print(f"Error sending Zoom Out command: {e}")
-                    
+                        sender.trigger("Zoom In", input_at)
+
                     if joystick.get_button(9):
                         print("Zoom Out")
-                        data = {
-                            "motor1_speed": 0,
-                            "motor2_speed": 0,
-                            "action": "Zoom Out"
-                        }
-                        try:
-                            response = requests.post(SERVER_URL, json=data)
-                            if response.status_code != 200:
-                                print(f"Failed to send Zoom Out command: {response.status_code}")
-                        except requests.exceptions.RequestException as e:
-                            print(f"Error sending Zoom Out command: {e}")
+                        sender.trigger("Zoom Out", input_at)
 
             # Default values
             action = "stop"
@@ -162,8 +345,7 @@ def main():
                 motor1_speed = motor2_speed = base_speed * 0.5
 #----------------------------- Joystick Controls ---------------------------- #
             # Joystick fallback (if no keyboard input)
-            elif pygame.joystick.get_count() > 0:
-                joystick = pygame.joystick.Joystick(0)
+            elif joystick is not None:
                 left_x = joystick.get_axis(0)
                 abs_gas = joystick.get_axis(5)
                 abs_brake = joystick.get_axis(4)
@@ -212,25 +394,14 @@ def main():
                         action = "Turning Left"
                         motor1_speed = motor2_speed = steering_speed
 
-            data = {
-                "motor1_speed": motor1_speed,
-                "motor2_speed": motor2_speed,
-                "action": action
-            }
-
-            try:
-                response = requests.post(SERVER_URL, json=data)
-                if response.status_code != 200:
-                    print(f"Failed to send data: {response.status_code}")
-            except requests.exceptions.RequestException as e:
-                print(f"Error: {e}")
-
-            time.sleep(0.03)  # Lower delay = smoother control
+            sender.submit(action, motor1_speed, motor2_speed, input_at)
+            sender.report()
 
     except KeyboardInterrupt:
         print("\nExiting cleanly...")
+        sender.stop()  # Closing the socket stops the robot on the server
+        sender.join(RECONNECT_DELAY)
         pygame.quit()
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,167 @@
+# Runtime settings for the robot server.
+# Every value can be overridden with an environment variable of the same name
+# prefixed with DOOMSEEK_, for example:
+#   DOOMSEEK_DEADMAN_TIMEOUT=1.0 uvicorn main:app --host 0.0.0.0 --port 8000
+import os
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(f"DOOMSEEK_{name}")
+    if value is None:
+        return default
+    if cast is bool:
+        return value.lower() in ("1", "true", "yes", "on")
+    return cast(value)
+
+
+# Directory served at /ui (index.html and its assets)
+UI_DIR = _env("UI_DIR", "ui")
+
+# Serial backends: "serial" (pyserial device, pty or URL) or "null" (no hardware),
+# see serial_backend.py. hw_emulator.py provides pty stand-ins for both links.
+MOTOR_BACKEND = _env("MOTOR_BACKEND", "serial")
+IMU_BACKEND = _env("IMU_BACKEND", "serial")
+
+# Sabertooth motor controller link
+MOTOR_PORT = _env("MOTOR_PORT", "/dev/ttyAMA0")
+MOTOR_BAUD = _env("MOTOR_BAUD", 9600, int)
+# Rate the link is moved to at startup (2400, 9600, 19200, 38400 or 115200),
+# 0 stays at MOTOR_BAUD. MOTOR_BAUD is the rate the controller powers up at.
+MOTOR_TARGET_BAUD = _env("MOTOR_TARGET_BAUD", 38400, int)
+# "mixed": drive/turn commands, the Sabertooth mixes them into the two motors.
+# "independent": one speed command per motor.
+MOTOR_DRIVE_MODE = _env("MOTOR_DRIVE_MODE", "mixed")
+# Seconds without a drive command before the writer stops the motors on its own
+DEADMAN_TIMEOUT = _env("DEADMAN_TIMEOUT", 0.5, float)
+
+# WT901 IMU link
+IMU_PORT = _env("IMU_PORT", "/dev/ttyAMA2")
+IMU_BAUD = _env("IMU_BAUD", 115200, int)
+
+# Surface detection (surface_detection.SurfaceTracker): a new surface needs this
+# fraction of 1 g on its axis, the current one is kept until its axis drops below
+# SURFACE_EXIT, and a change must hold for SURFACE_DWELL seconds
+SURFACE_ENTER = _env("SURFACE_ENTER", 0.75, float)
+SURFACE_EXIT = _env("SURFACE_EXIT", 0.65, float)
+SURFACE_DWELL = _env("SURFACE_DWELL", 0.25, float)
+SURFACE_FILTER_TAU = _env("SURFACE_FILTER_TAU", 0.5, float)   # seconds, accel weight in the gravity filter
+
+# IMU history kept in memory for /imu/history (about 45 bytes per sample)
+HISTORY_RATE_HZ = _env("HISTORY_RATE_HZ", 20.0, float)
+HISTORY_SECONDS = _env("HISTORY_SECONDS", 2 * 3600, float)
+
+# /telemetry/stream update rates (updates per second per client)
+TELEMETRY_DEFAULT_RATE = _env("TELEMETRY_DEFAULT_RATE", 10.0, float)
+TELEMETRY_MAX_RATE = _env("TELEMETRY_MAX_RATE", 30.0, float)
+
+# Binary mission log of raw IMU bytes and drive commands (see mission_log.py)
+MISSION_LOG_ENABLED = _env("MISSION_LOG_ENABLED", True, bool)
+MISSION_LOG_DIR = _env("MISSION_LOG_DIR", "logs/missions")
+MISSION_SEGMENT_MB = _env("MISSION_SEGMENT_MB", 64, int)
+# Oldest segments are deleted to keep the log under this size, 0 keeps everything
+MISSION_LOG_MAX_MB = _env("MISSION_LOG_MAX_MB", 1024, int)
+
+# Cameras published by camera_control.py through mediamtx
+CAMERAS = ("camA", "camB")
+RTSP_BASE = _env("RTSP_BASE", "rtsp://localhost:8554/webrtc")
+# V4L2 device of each camera, used for zoom/focus/exposure (see v4l2_controls.py)
+CAMERA_DEVICES = {"camA": "/dev/video0", "camB": "/dev/video2"}
+# The server supervises the ffmpeg pipeline of each camera (see camera_supervisor.py)
+CAMERA_PIPELINES_ENABLED = _env("CAMERA_PIPELINES_ENABLED", True, bool)
+CAMERA_STALL_TIMEOUT = _env("CAMERA_STALL_TIMEOUT", 2.0, float)   # seconds without new frames
+# Keep an RTSP session open per camera so snapshots are instant
+FRAME_GRABBERS_ENABLED = _env("FRAME_GRABBERS_ENABLED", True, bool)
+# Nice value of the grabber threads. Decoding runs without the GIL and takes
+# most of a core, at a normal priority it preempts the request handling threads
+# while they hold the GIL and every other thread waits for it.
+GRABBER_NICE = _env("GRABBER_NICE", 19, int)
+
+# Snapshot encoding pool and burst limits (see snapshot_jobs.py)
+SNAPSHOT_DIR = _env("SNAPSHOT_DIR", "inspection")
+SNAPSHOT_WORKERS = _env("SNAPSHOT_WORKERS", 2, int)
+SNAPSHOT_MAX_PENDING = _env("SNAPSHOT_MAX_PENDING", 8, int)   # frames waiting to be encoded
+SNAPSHOT_MAX_BURSTS = _env("SNAPSHOT_MAX_BURSTS", 2, int)
+SNAPSHOT_MAX_BURST_FRAMES = _env("SNAPSHOT_MAX_BURST_FRAMES", 300, int)
+# Pose-tagged catalog of the saved snapshots with their thumbnails (see snapshot_catalog.py)
+SNAPSHOT_CATALOG_PATH = _env("SNAPSHOT_CATALOG_PATH", os.path.join(SNAPSHOT_DIR, "catalog.sqlite"))
+SNAPSHOT_THUMBNAIL_WIDTH = _env("SNAPSHOT_THUMBNAIL_WIDTH", 160, int)
+
+# Live anomaly flagging on frames sampled from the grabbers (see frame_analysis.py).
+# The sampling rate (per camera) adapts to keep the stage under ANALYSIS_CPU_BUDGET
+# of one core. Flags are saved as bookmarks (GET /recordings/bookmarks).
+ANALYSIS_ENABLED = _env("ANALYSIS_ENABLED", False, bool)
+ANALYSIS_WORKERS = _env("ANALYSIS_WORKERS", 1, int)
+ANALYSIS_WIDTH = _env("ANALYSIS_WIDTH", 320, int)             # frames are scaled down to this width
+ANALYSIS_CPU_BUDGET = _env("ANALYSIS_CPU_BUDGET", 0.25, float)
+ANALYSIS_MIN_RATE = _env("ANALYSIS_MIN_RATE", 0.2, float)     # samples per second per camera
+ANALYSIS_MAX_RATE = _env("ANALYSIS_MAX_RATE", 4.0, float)
+ANALYSIS_FLAG_HOLD = _env("ANALYSIS_FLAG_HOLD", 10.0, float)  # seconds before a standing condition flags again
+# Detector thresholds: changed-pixel fraction, fraction of the camera's usual
+# Laplacian variance (below is blurred),
+# grey level std (below is occluded), saturated-pixel fraction, off-colour pixel fraction
+ANALYSIS_MOTION = _env("ANALYSIS_MOTION", 0.02, float)
+ANALYSIS_BLUR = _env("ANALYSIS_BLUR", 0.5, float)
+ANALYSIS_OCCLUSION = _env("ANALYSIS_OCCLUSION", 6.0, float)
+ANALYSIS_BRIGHT = _env("ANALYSIS_BRIGHT", 0.002, float)
+ANALYSIS_COLOR = _env("ANALYSIS_COLOR", 0.02, float)
+
+# Recordings written by mediamtx (recordPath in mediamtx.yml) and their index
+RECORDINGS_DIR = _env("RECORDINGS_DIR", "./recordings")
+RECORDINGS_INDEX_PATH = _env("RECORDINGS_INDEX_PATH", "logs/recordings_index.sqlite")
+RECORDINGS_SCAN_INTERVAL = _env("RECORDINGS_SCAN_INTERVAL", 5.0, float)
+
+# On-demand recording through the mediamtx Control API (see recording_control.py,
+# mediamtx.yml must have api: yes). Operator recordings are cut into
+# RECORD_SEGMENT_SECONDS segments; between them mediamtx keeps its own setting
+# (record and recordSegmentDuration in mediamtx.yml) unless RECORD_WHEN_IDLE is off.
+MEDIAMTX_API = _env("MEDIAMTX_API", "http://127.0.0.1:9997")
+MEDIAMTX_API_TIMEOUT = _env("MEDIAMTX_API_TIMEOUT", 2.0, float)
+RECORD_SEGMENT_SECONDS = _env("RECORD_SEGMENT_SECONDS", 60, int)
+RECORD_FORMAT = _env("RECORD_FORMAT", "mpegts")     # or "fmp4", served without a remux
+RECORD_WHEN_IDLE = _env("RECORD_WHEN_IDLE", True, bool)
+RECORD_IDLE_SEGMENT = _env("RECORD_IDLE_SEGMENT", "1h")
+
+# MP4 remuxes of MPEG-TS recordings for download (see remux_cache.py).
+# Keep the cache outside RECORDINGS_DIR so the remuxes are not indexed as recordings.
+REMUX_CACHE_DIR = _env("REMUX_CACHE_DIR", "cache/remux")
+REMUX_CACHE_MB = _env("REMUX_CACHE_MB", 4096, int)
+REMUX_WORKERS = _env("REMUX_WORKERS", 1, int)
+FFMPEG = _env("FFMPEG", "ffmpeg")
+
+# Recording retention (see retention.py). Oldest unpinned segments are deleted until
+# the recordings fit the quota and the disk has the free-space floor. 0 disables a rule.
+RETENTION_INTERVAL = _env("RETENTION_INTERVAL", 60.0, float)
+RETENTION_QUOTA_GB = _env("RETENTION_QUOTA_GB", 20.0, float)
+RETENTION_MIN_FREE_GB = _env("RETENTION_MIN_FREE_GB", 2.0, float)
+RETENTION_MAX_AGE_DAYS = _env("RETENTION_MAX_AGE_DAYS", 7.0, float)
+RETENTION_BATCH = _env("RETENTION_BATCH", 10, int)               # files deleted per batch
+RETENTION_BATCH_PAUSE = _env("RETENTION_BATCH_PAUSE", 0.5, float)
+RETENTION_PROTECT_SECONDS = _env("RETENTION_PROTECT_SECONDS", 120.0, float)  # treated as still recording
+
+# Keyframe thumbnails and timeline sprites of finished recordings (see thumbnails.py)
+THUMBNAILS_ENABLED = _env("THUMBNAILS_ENABLED", True, bool)
+THUMBNAIL_DIR = _env("THUMBNAIL_DIR", "cache/thumbnails")
+THUMBNAIL_INTERVAL = _env("THUMBNAIL_INTERVAL", 10.0, float)   # seconds of video per thumbnail
+THUMBNAIL_WIDTH = _env("THUMBNAIL_WIDTH", 160, int)
+THUMBNAIL_COLUMNS = _env("THUMBNAIL_COLUMNS", 10, int)          # tiles per sprite row
+
+# Bounded executors for the blocking work requests start (see executors.py):
+# worker threads, jobs allowed to wait (more get 503) and seconds before a
+# request gives up on its job (504). The motor writer always goes first, then
+# camera frames, encoding and filesystem work in that order. Encoding and
+# filesystem work is CPU bound, more workers than cores only take turns
+# holding the GIL away from the event loop.
+LANE_CAMERA_WORKERS = _env("LANE_CAMERA_WORKERS", 2, int)
+LANE_CAMERA_QUEUE = _env("LANE_CAMERA_QUEUE", 8, int)
+LANE_CAMERA_TIMEOUT = _env("LANE_CAMERA_TIMEOUT", 3.0, float)
+LANE_ENCODE_WORKERS = _env("LANE_ENCODE_WORKERS", min(SNAPSHOT_WORKERS, os.cpu_count() or 1), int)
+LANE_ENCODE_QUEUE = _env("LANE_ENCODE_QUEUE", 2 * SNAPSHOT_MAX_PENDING, int)
+LANE_ENCODE_TIMEOUT = _env("LANE_ENCODE_TIMEOUT", 10.0, float)
+LANE_FILES_WORKERS = _env("LANE_FILES_WORKERS", min(2, os.cpu_count() or 1), int)
+LANE_FILES_QUEUE = _env("LANE_FILES_QUEUE", 32, int)
+LANE_FILES_TIMEOUT = _env("LANE_FILES_TIMEOUT", 30.0, float)
+# Nice value of the camera, encode and filesystem workers, 0 leaves them as is
+LANE_NICE = _env("LANE_NICE", 10, int)
+# Milliseconds a thread keeps the GIL while others wait for it (Python's default
+# is 5), shorter waits for the event loop when a worker thread holds it
+GIL_SWITCH_INTERVAL_MS = _env("GIL_SWITCH_INTERVAL_MS", 1.0, float)
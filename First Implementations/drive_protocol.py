@@ -0,0 +1,67 @@
+# Compact binary drive frames for the WebSocket control channel (/ws/control).
+# Shared by the server (mainServer.py), the joystick client (client.py) and
+# mirrored in the UI (index.html -> encodeDriveFrame).
+import struct
+
+# Drive frame (8 bytes, little endian):
+#   action code (u8) | motor1 speed (u8) | motor2 speed (u8) | pad | sequence number (u32)
+DRIVE_FRAME = struct.Struct("<BBBxI")
+
+# Ack frame (5 bytes): echoed sequence number (u32) | status (u8)
+ACK_FRAME = struct.Struct("<IB")
+
+ACK_APPLIED = 0   # Command was applied to the motors
+ACK_STALE = 1     # A newer command arrived first, this one was skipped
+ACK_INVALID = 2   # Frame could not be decoded
+
+# Action code order is part of the wire format - only append to this list
+ACTIONS = (
+    "stop",
+    "forward",
+    "reverse",
+    "Turning Left",
+    "Turning Right",
+    "Take Picture",
+    "Zoom In",
+    "Zoom Out",
+    "Led On",
+)
+ACTION_CODES = {name: code for code, name in enumerate(ACTIONS)}
+
+SEQ_MASK = 0xFFFFFFFF
+
+
+def clamp_speed(speed):
+    # Sabertooth speeds are 7 bit, the UI and client sometimes send floats
+    return max(0, min(127, int(round(speed))))
+
+
+def encode_drive(action, motor1_speed, motor2_speed, seq):
+    return DRIVE_FRAME.pack(ACTION_CODES.get(action, 0), clamp_speed(motor1_speed),
+                            clamp_speed(motor2_speed), seq & SEQ_MASK)
+
+
+def decode_drive(frame):
+    """Returns (action, motor1_speed, motor2_speed, seq) or None for a bad frame"""
+    if len(frame) != DRIVE_FRAME.size:
+        return None
+    code, motor1_speed, motor2_speed, seq = DRIVE_FRAME.unpack(frame)
+    if code >= len(ACTIONS):
+        return None
+    return ACTIONS[code], motor1_speed, motor2_speed, seq
+
+
+def encode_ack(seq, status=ACK_APPLIED):
+    return ACK_FRAME.pack(seq & SEQ_MASK, status)
+
+
+def decode_ack(frame):
+    return ACK_FRAME.unpack(frame)
+
+
+def seq_newer(seq, last_seq):
+    # Wraparound-safe "seq comes after last_seq"
+    if last_seq is None:
+        return True
+    diff = (seq - last_seq) & SEQ_MASK
+    return 0 < diff < 0x80000000
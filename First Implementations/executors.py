@@ -0,0 +1,229 @@
+# Bounded executors ("lanes") for the blocking work request handlers hand off.
+# Each class of work (camera frames, image encoding, filesystem maintenance) has
+# its own worker threads, queue limit and timeout, so a snapshot storm fills the
+# encode lane and nothing else: a recordings listing or a drive command never
+# queues behind a JPEG encode, as they did on asyncio's one shared default pool.
+#
+# Lanes have a priority. A worker only starts a job when no lane (or foreground
+# section, see foreground()) of a higher priority has work queued or running, so
+# the motor writer's serial writes never share the CPU with a job that started
+# alongside them. The hold is bounded by PRIORITY_HOLD against starvation.
+# Workers of lower-priority lanes also run at a higher nice value, which the
+# kernel honours when the CPU is saturated.
+#
+# A full queue raises LaneFull right away and a job not finished within the
+# lane's timeout raises LaneTimeout (a job that hasn't started yet is dropped).
+import asyncio
+import collections
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+PRIORITY_HOLD = 0.05   # seconds a worker waits at most for higher-priority work
+
+QUEUE_WAIT_SECONDS = metrics.histogram("executor_queue_wait_seconds",
+                                       "Time a job waited for a worker, by lane", ("lane",))
+RUN_SECONDS = metrics.histogram("executor_run_seconds", "Time a job ran, by lane", ("lane",))
+
+
+class LaneFull(Exception):
+    pass
+
+
+class LaneTimeout(Exception):
+    pass
+
+
+def lower_priority(nice):
+    # Linux applies setpriority to a single thread when given its native id
+    if nice:
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+        except (AttributeError, OSError) as e:
+            print(f"Could not lower the priority of {threading.current_thread().name}: {e}")
+
+
+class _Foreground:
+    """
+    Context manager marking work of a priority while it runs, for a thread of
+    its own outside the lanes that keeps its own queue (the motor writer)
+    """
+
+    def __init__(self, scheduler, name, priority):
+        self.scheduler = scheduler
+        self.name = name
+        self.priority = priority
+        self._wait = QUEUE_WAIT_SECONDS.labels(name)
+        self._run = RUN_SECONDS.labels(name)
+        self._started = None
+        self.stats = {"runs": 0}
+
+    def observe_wait(self, seconds):
+        self._wait.observe(seconds)
+
+    def __enter__(self):
+        self.scheduler._busy(self.priority, 1)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._run.observe(time.perf_counter() - self._started)
+        self.stats["runs"] += 1
+        self.scheduler._busy(self.priority, -1)
+
+    def get_stats(self):
+        return {"priority": self.priority, **self.stats, **_latency(self._wait, self._run)}
+
+
+class Lane:
+    def __init__(self, scheduler, name, workers, max_queue, timeout, priority, nice=0):
+        self.scheduler = scheduler
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.priority = priority
+        self.nice = nice
+        self._cond = threading.Condition()
+        self._queue = collections.deque()   # (future, fn, args, queued at)
+        self._running = 0
+        self._threads = []
+        self._wait = QUEUE_WAIT_SECONDS.labels(name)
+        self._run = RUN_SECONDS.labels(name)
+        self.stats = {"submitted": 0, "completed": 0, "errors": 0, "rejected": 0, "timeouts": 0, "cancelled": 0}
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"lane-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, fn, *args):
+        """concurrent.futures.Future for fn(*args), raises LaneFull when max_queue jobs are waiting"""
+        future = Future()
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise LaneFull(f"The {self.name} lane has {self.max_queue} jobs waiting, try again shortly")
+            self._queue.append((future, fn, args, time.perf_counter()))
+            self.stats["submitted"] += 1
+            self.scheduler._busy(self.priority, 1)
+            self._cond.notify()
+        return future
+
+    async def run(self, fn, *args, timeout=None):
+        """Runs fn(*args) on the lane and returns its result, for the event loop"""
+        return await self.result(self.submit(fn, *args), timeout)
+
+    async def result(self, future, timeout=None):
+        """Awaits a future from submit() for at most the lane's timeout"""
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise LaneTimeout(f"The {self.name} lane did not finish within {timeout:g}s") from None
+
+    def get_stats(self):
+        with self._cond:
+            stats = {"workers": self.workers, "max_queue": self.max_queue, "timeout": self.timeout,
+                     "priority": self.priority, "queued": len(self._queue), "running": self._running,
+                     **self.stats}
+        stats.update(_latency(self._wait, self._run))
+        return stats
+
+    def _work(self):
+        lower_priority(self.nice)
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                future, fn, args, queued_at = self._queue.popleft()
+                self._running += 1
+            try:
+                if not future.set_running_or_notify_cancel():
+                    self.stats["cancelled"] += 1  # Timed out while queued
+                    continue
+                self.scheduler._wait_turn(self.priority)
+                started = time.perf_counter()
+                self._wait.observe(started - queued_at)
+                try:
+                    result = fn(*args)
+                except BaseException as e:
+                    self.stats["errors"] += 1
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                self._run.observe(time.perf_counter() - started)
+                self.stats["completed"] += 1
+            finally:
+                with self._cond:
+                    self._running -= 1
+                self.scheduler._busy(self.priority, -1)
+
+
+class Scheduler:
+    """The lanes of the server, lower priority numbers go first"""
+
+    def __init__(self, hold=PRIORITY_HOLD):
+        self.hold = hold
+        self.lanes = {}
+        self._foreground = {}
+        self._gate = threading.Condition()
+        self._active = collections.Counter()   # priority -> jobs queued or running
+
+    def add(self, name, workers, max_queue, timeout, priority, nice=0):
+        if name in self.lanes or name in self._foreground:
+            raise ValueError(f"Lane {name} already exists")
+        lane = self.lanes[name] = Lane(self, name, workers, max_queue, timeout, priority, nice)
+        return lane
+
+    def foreground(self, name, priority=0):
+        """Context manager for a thread of its own (the motor writer) to mark its work with"""
+        if name in self.lanes or name in self._foreground:
+            raise ValueError(f"Lane {name} already exists")
+        section = self._foreground[name] = _Foreground(self, name, priority)
+        return section
+
+    def __getitem__(self, name):
+        return self.lanes[name]
+
+    def start(self):
+        for lane in self.lanes.values():
+            lane.start()
+
+    def get_stats(self):
+        stats = {name: section.get_stats() for name, section in self._foreground.items()}
+        stats.update((name, lane.get_stats()) for name, lane in self.lanes.items())
+        return stats
+
+    def _busy(self, priority, delta):
+        with self._gate:
+            self._active[priority] += delta
+            if delta < 0 and not self._active[priority]:
+                self._gate.notify_all()
+
+    def _wait_turn(self, priority):
+        deadline = None
+        with self._gate:
+            while any(count for p, count in self._active.items() if p < priority):
+                if deadline is None:
+                    deadline = time.monotonic() + self.hold
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self._gate.wait(remaining)
+
+
+def _latency(wait, run):
+    stats = {}
+    for key, series in (("wait", wait), ("run", run)):
+        stats[f"{key}_ms_avg"] = round(series.sum / series.count * 1000, 3) if series.count else None
+        for q in (50, 95, 99):
+            value = series.quantile(q / 100)
+            stats[f"{key}_ms_p{q}"] = None if value is None else round(value * 1000, 3)
+        stats[f"{key}_ms_max"] = round(series.max * 1000, 3)
+    return stats
@@ -0,0 +1,187 @@
+# Byte-range file responses for recording downloads.
+# Handles Range (single and multiple ranges), If-Range, ETag / Last-Modified
+# revalidation and HEAD, so interrupted downloads resume and players can seek.
+# When the ASGI server offers the "http.response.zerocopysend" extension the
+# kernel copies the file straight to the socket (sendfile). Otherwise the
+# file is read with os.pread in large chunks in a worker thread, without a
+# Python generator in between.
+import asyncio
+import email.utils
+import os
+import secrets
+import stat
+
+from starlette.responses import Response
+
+CHUNK_SIZE = 1024 * 1024
+MAX_RANGES = 16     # more than this and the Range header is ignored (full response)
+
+
+def parse_range(header, size):
+    """
+    Returns a list of (start, end) byte ranges (end inclusive), sorted and with
+    overlapping or adjacent ranges merged. Returns None when the header should
+    be ignored and [] when no range can be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for part in spec.split(","):
+        first, sep, last = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if first == "":
+                length = int(last)
+                if length <= 0:
+                    continue
+                start, end = max(0, size - length), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and end < start:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    if len(ranges) > MAX_RANGES:
+        return None
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class RangeFileResponse(Response):
+    def __init__(self, path, request_headers, method="GET", filename=None,
+                 media_type="application/octet-stream", cache_control="no-cache"):
+        st = os.stat(path)
+        if not stat.S_ISREG(st.st_mode):
+            raise FileNotFoundError(path)
+        self.path = path
+        self.size = st.st_size
+        self.media_type = media_type
+        self.background = None
+        self.send_body = method != "HEAD"
+        self.ranges = None
+        self.boundary = None
+
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        last_modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified,
+            "cache-control": cache_control,
+        }
+        if filename:
+            headers["content-disposition"] = f'attachment; filename="{filename}"'
+
+        if self._not_modified(request_headers, etag, st.st_mtime):
+            self.status_code = 304
+            self.send_body = False
+            self.init_headers(headers)
+            return
+
+        ranges = None
+        range_header = request_headers.get("range")
+        if range_header and method in ("GET", "HEAD") and self._if_range_ok(request_headers, etag, last_modified):
+            ranges = parse_range(range_header, self.size)
+
+        if ranges == []:
+            self.status_code = 416
+            self.send_body = False
+            headers["content-range"] = f"bytes */{self.size}"
+            headers["content-length"] = "0"
+        elif ranges and len(ranges) == 1:
+            start, end = ranges[0]
+            self.status_code = 206
+            self.ranges = ranges
+            headers["content-range"] = f"bytes {start}-{end}/{self.size}"
+            headers["content-length"] = str(end - start + 1)
+            headers["content-type"] = media_type
+        elif ranges:
+            self.status_code = 206
+            self.ranges = ranges
+            self.boundary = secrets.token_hex(12)
+            headers["content-type"] = f"multipart/byteranges; boundary={self.boundary}"
+            headers["content-length"] = str(sum(
+                len(self._part_header(start, end)) + end - start + 1 + 2 for start, end in ranges
+            ) + len(self._closing()))
+        else:
+            self.status_code = 200
+            self.ranges = [(0, self.size - 1)] if self.size else []
+            headers["content-length"] = str(self.size)
+            headers["content-type"] = media_type
+        self.init_headers(headers)
+
+    @staticmethod
+    def _not_modified(request_headers, etag, mtime):
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since
+        return False
+
+    @staticmethod
+    def _if_range_ok(request_headers, etag, last_modified):
+        if_range = request_headers.get("if-range")
+        if if_range is None:
+            return True
+        # Ranges only apply to the exact representation the client already has
+        return if_range.strip() in (etag, last_modified)
+
+    def _part_header(self, start, end):
+        return (f"--{self.boundary}\r\nContent-Type: {self.media_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{self.size}\r\n\r\n").encode()
+
+    def _closing(self):
+        return f"--{self.boundary}--\r\n".encode()
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or not self.ranges:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            for index, (start, end) in enumerate(self.ranges):
+                if self.boundary:
+                    await send({"type": "http.response.body", "body": self._part_header(start, end), "more_body": True})
+                last = index == len(self.ranges) - 1 and not self.boundary
+                if zerocopy:
+                    await send({"type": "http.response.zerocopysend", "file": fd,
+                                "offset": start, "count": end - start + 1, "more_body": not last})
+                else:
+                    await self._send_range(send, fd, start, end, last)
+                if self.boundary:
+                    await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+            if self.boundary:
+                await send({"type": "http.response.body", "body": self._closing()})
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    async def _send_range(send, fd, start, end, last):
+        offset = start
+        while offset <= end:
+            chunk = await asyncio.to_thread(os.pread, fd, min(CHUNK_SIZE, end - offset + 1), offset)
+            if not chunk:
+                raise RuntimeError("File shrank while it was being sent")
+            offset += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": not last or offset <= end})
@@ -0,0 +1,224 @@
+# Optional live analysis of the camera streams, so nobody has to watch both
+# feeds for a whole inspection. A sampler thread takes frames from the
+# always-warm grabbers (frame_grabber.py) at an adaptive rate, scales them down
+# to `width` and hands them to a small process pool that runs cheap detectors:
+#   motion     - fraction of pixels that changed since the camera's previous
+#                sample; not flagged while the robot drives, the whole view moves
+#   blur       - variance of the Laplacian as a fraction of the camera's usual
+#                value (a slow average of its sharp samples), low when the view
+#                goes out of focus; how sharp a wall looks depends on the wall
+#   occlusion  - a nearly uniform frame, lens covered or pointing into darkness
+#   bright     - fraction of saturated pixels: reflections, light leaks, sparks
+#   color      - fraction of pixels far from the frame's median chroma: rust,
+#                stains, anything of a colour the surface doesn't have
+# The grabbers already decode every frame to keep snapshots instant, so the
+# stage doesn't open a second RTSP session and decode the streams again; only
+# sampled frames are converted (retrieve) and scaled.
+#
+# The sampling rate adapts to keep the stage's CPU use (the sampler thread plus
+# the detectors in the pool) under `cpu_budget`, a fraction of one core: every
+# ADAPT_INTERVAL the rate is scaled by budget / use, within [min_rate, max_rate]
+# samples per second per camera. Detectors run in processes so they never hold
+# the server's GIL, and at a lowered priority.
+#
+# A detector flags when its score crosses its threshold, then at most once per
+# `hold` seconds while it stays crossed. Flags go to `on_flag(event)`.
+import collections
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import cv2
+import numpy as np
+
+ADAPT_INTERVAL = 2.0         # seconds between sampling rate updates
+MAX_STEP = 1.5               # the rate changes at most by this factor per update
+DIFF_LEVEL = 25              # grey levels a pixel must change by to count as motion
+SATURATED = 250
+CHROMA_DISTANCE = 40         # Lab a/b distance from the median that makes a pixel stand out
+SHARPNESS_WEIGHT = 0.05      # weight of each sharp sample in a camera's usual sharpness
+
+DEFAULT_THRESHOLDS = {"motion": 0.02, "blur": 0.5, "occlusion": 6.0, "bright": 0.002, "color": 0.02}
+KINDS = tuple(DEFAULT_THRESHOLDS)
+
+
+def _init_worker(nice):
+    cv2.setNumThreads(1)   # The pool is the parallelism, one thread per worker
+    if nice:
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+
+
+def analyze(frame, previous):
+    """
+    Scores of one downscaled BGR frame, runs in a pool worker.
+    Returns (grey frame for the camera's next sample, scores, CPU seconds used).
+    """
+    started = time.process_time()
+    grey = cv2.GaussianBlur(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+    scores = {
+        "blur": float(cv2.Laplacian(grey, cv2.CV_32F).var()),
+        "occlusion": float(grey.std()),
+        "bright": float(np.count_nonzero(grey >= SATURATED)) / grey.size,
+    }
+    if previous is not None and previous.shape == grey.shape:
+        scores["motion"] = float(np.count_nonzero(cv2.absdiff(grey, previous) > DIFF_LEVEL)) / grey.size
+    lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
+    chroma = lab[:, :, 1:].reshape(-1, 2).astype(np.int16)
+    distance = np.abs(chroma - np.median(chroma, axis=0).astype(np.int16)).sum(axis=1)
+    scores["color"] = float(np.count_nonzero(distance > CHROMA_DISTANCE)) / distance.size
+    return grey, scores, time.process_time() - started
+
+
+def flagged(kind, score, threshold):
+    # blur and occlusion are low when bad, the others high
+    if kind in ("blur", "occlusion"):
+        return score < threshold
+    return score > threshold
+
+
+class FrameAnalyzer(threading.Thread):
+    def __init__(self, grabbers, on_flag=None, moving=None, workers=1, width=320, cpu_budget=0.25,
+                 min_rate=0.2, max_rate=4.0, hold=10.0, thresholds=None, nice=0):
+        super().__init__(name="frame-analyzer", daemon=True)
+        self.grabbers = grabbers
+        self.on_flag = on_flag or (lambda event: None)
+        self.moving = moving or (lambda: False)
+        self.workers = workers
+        self.width = width
+        self.cpu_budget = cpu_budget
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.hold = hold
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.nice = nice
+        self.rate = max_rate       # samples per second per camera
+        self._pool = None
+        self._running = True
+        self._previous = {}        # camera -> grey frame of its last analyzed sample
+        self._sharpness = {}       # camera -> its usual Laplacian variance
+        self._last_grab = {}
+        self._active = {}          # (camera, kind) -> time of its last flag while crossed
+        self.scores = {camera: {} for camera in grabbers}
+        self.flags = collections.deque(maxlen=100)
+        self.stats = {"samples": 0, "analyzed": 0, "skipped": 0, "errors": 0, "flags": 0,
+                      "cpu_use": 0.0, "rate": self.rate, "last_analysis_ms": None}
+
+    def stop(self):
+        self._running = False
+
+    def get_state(self):
+        return {"cpu_budget": self.cpu_budget, "min_rate": self.min_rate, "max_rate": self.max_rate,
+                "width": self.width, "workers": self.workers, "thresholds": self.thresholds, **self.stats,
+                "scores": self.scores, "recent_flags": list(self.flags)[-20:][::-1]}
+
+    def _sample(self, camera, now):
+        """Scaled-down copy of the camera's newest frame, or None"""
+        frame, grabbed_at = self.grabbers[camera].latest_frame(timeout=0)
+        if frame is None or grabbed_at == self._last_grab.get(camera):
+            return None, None
+        self._last_grab[camera] = grabbed_at
+        if frame.shape[1] > self.width:
+            height = round(frame.shape[0] * self.width / frame.shape[1])
+            frame = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        return frame, time.time() - (now - grabbed_at)
+
+    def _handle(self, camera, taken, moving, result):
+        grey, scores, cpu = result
+        self._previous[camera] = grey
+        # An occluded frame is never sharp, the occlusion flag covers it
+        if flagged("occlusion", scores["occlusion"], self.thresholds["occlusion"]):
+            del scores["blur"]
+        else:
+            sharpness = scores["blur"]
+            usual = self._sharpness.setdefault(camera, sharpness)
+            scores["blur"] = sharpness / usual if usual > 0 else 1.0
+            if not flagged("blur", scores["blur"], self.thresholds["blur"]):
+                self._sharpness[camera] = usual + SHARPNESS_WEIGHT * (sharpness - usual)
+        self.scores[camera] = {kind: round(score, 4) for kind, score in scores.items()}
+        self.stats["analyzed"] += 1
+        for kind, score in scores.items():
+            key = (camera, kind)
+            if not flagged(kind, score, self.thresholds[kind]) or (kind == "motion" and moving):
+                self._active.pop(key, None)
+                continue
+            last = self._active.get(key)
+            if last is not None and taken - last < self.hold:
+                continue
+            self._active[key] = taken
+            event = {"camera": camera, "at": taken, "kind": kind, "score": round(score, 4),
+                     "threshold": self.thresholds[kind]}
+            self.flags.append(event)
+            self.stats["flags"] += 1
+            try:
+                self.on_flag(event)
+            except Exception as e:
+                print(f"Analysis flag not saved: {e}")
+        return cpu
+
+    def _adapt(self, cpu, elapsed):
+        use = cpu / elapsed if elapsed > 0 else 0.0
+        self.stats["cpu_use"] = round(use, 3)
+        factor = self.cpu_budget / use if use > 0 else MAX_STEP
+        self.rate = max(self.min_rate, min(self.max_rate, self.rate * max(1 / MAX_STEP, min(MAX_STEP, factor))))
+        self.stats["rate"] = round(self.rate, 3)
+
+    def run(self):
+        # spawn: forking the server's threads into the workers isn't safe
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                         initializer=_init_worker, initargs=(self.nice,))
+        # The pool starts its workers on the first jobs; start them now so the first samples aren't late
+        wait([self._pool.submit(time.process_time) for _ in range(self.workers)])
+        pending = {}    # future -> (camera, taken, moving, submitted at)
+        next_due = {camera: time.monotonic() for camera in self.grabbers}
+        window_start, window_cpu = time.monotonic(), 0.0
+        thread_cpu = time.thread_time()
+        try:
+            while self._running:
+                now = time.monotonic()
+                for camera in self.grabbers:
+                    if now < next_due[camera]:
+                        continue
+                    # One frame per worker in flight: a due camera waits for a free worker, and
+                    # a slow pool gets fewer samples (skipped) instead of a backlog
+                    if len(pending) >= self.workers:
+                        if now - next_due[camera] >= 1.0 / self.rate:
+                            self.stats["skipped"] += 1
+                            next_due[camera] = now
+                        continue
+                    next_due[camera] = max(next_due[camera] + 1.0 / self.rate, now)
+                    frame, taken = self._sample(camera, now)
+                    if frame is None:
+                        continue
+                    self.stats["samples"] += 1
+                    future = self._pool.submit(analyze, frame, self._previous.get(camera))
+                    pending[future] = (camera, taken, self.moving(), time.monotonic())
+
+                timeout = max(0.0, min(next_due.values()) - time.monotonic())
+                if len(pending) >= self.workers:
+                    timeout = ADAPT_INTERVAL   # Nothing to submit before a worker is free
+                if pending:
+                    done, _ = wait(pending, timeout, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(timeout)
+                    done = ()
+                for future in done:
+                    camera, taken, moving, submitted = pending.pop(future)
+                    try:
+                        window_cpu += self._handle(camera, taken, moving, future.result())
+                        self.stats["last_analysis_ms"] = round((time.monotonic() - submitted) * 1000, 1)
+                    except Exception as e:
+                        self.stats["errors"] += 1
+                        print(f"Frame analysis failed on {camera}: {e}")
+
+                now = time.monotonic()
+                if now - window_start >= ADAPT_INTERVAL:
+                    cpu = time.thread_time()
+                    self._adapt(window_cpu + cpu - thread_cpu, now - window_start)
+                    window_start, window_cpu, thread_cpu = now, 0.0, cpu
+        finally:
+            self._pool.shutdown(wait=False, cancel_futures=True)
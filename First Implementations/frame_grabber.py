@@ -0,0 +1,111 @@
+# Always-warm frame grabbers, one per camera.
+# Each grabber keeps one RTSP session to mediamtx open and pulls every frame
+# with cap.grab(), so the decoder is never behind. Only when someone asks for a
+# picture is the newest grabbed frame converted with cap.retrieve(), so a
+# snapshot costs at most one frame interval instead of an RTSP handshake plus a
+# wait for the next keyframe.
+import os
+import threading
+import time
+
+# mediamtx is local, TCP avoids the UDP packet loss smearing on busy Wi-Fi
+os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "rtsp_transport;tcp")
+import cv2
+
+from executors import lower_priority
+
+RECONNECT_DELAY = 1.0       # seconds, doubled after every failed attempt
+MAX_RECONNECT_DELAY = 10.0
+
+
+class FrameGrabber(threading.Thread):
+    def __init__(self, camera, url, nice=0):
+        super().__init__(name=f"grabber-{camera}", daemon=True)
+        self.camera = camera
+        self.url = url
+        self.nice = nice   # Decoding every frame shouldn't take CPU from the drive path
+        self._cap = None
+        self._lock = threading.Lock()    # Serializes grab() and retrieve()
+        self._grabbed = threading.Event()
+        self._grab_index = 0             # Frames grabbed on the current session
+        self._grabbed_at = 0.0
+        self._retrieved = (-1, None)     # (grab index, frame) - single slot cache
+        self._running = True
+        self.stats = {"connected": False, "frames": 0, "reconnects": 0, "snapshots": 0, "fps": 0.0}
+
+    def stop(self):
+        self._running = False
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["frame_age_ms"] = round((time.monotonic() - self._grabbed_at) * 1000, 1) if self._grabbed_at else None
+        return stats
+
+    def latest_frame(self, timeout=1.0):
+        """
+        Returns (frame, monotonic time it was grabbed) for the newest frame, or
+        (None, None) if the stream is down. The frame is shared, don't modify it.
+        """
+        if not self._grabbed.wait(timeout):
+            return None, None
+        with self._lock:
+            if self._cap is None:
+                return None, None
+            index, frame = self._retrieved
+            if index != self._grab_index:
+                ok, frame = self._cap.retrieve()
+                if not ok:
+                    return None, None
+                self._retrieved = (self._grab_index, frame)
+            self.stats["snapshots"] += 1
+            return frame, self._grabbed_at
+
+    def _connect(self):
+        delay = RECONNECT_DELAY
+        while self._running:
+            cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            if cap.isOpened():
+                print(f"Frame grabber {self.camera} connected to {self.url}")
+                return cap
+            cap.release()
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+        return None
+
+    def run(self):
+        lower_priority(self.nice)
+        while self._running:
+            cap = self._connect()
+            if cap is None:
+                break
+            with self._lock:
+                self._cap = cap
+                self._grab_index = 0
+                self._retrieved = (-1, None)
+            self.stats["connected"] = True
+            window_start, window_frames = time.monotonic(), 0
+
+            while self._running:
+                with self._lock:
+                    ok = cap.grab()
+                    if ok:
+                        self._grab_index += 1
+                        self._grabbed_at = time.monotonic()
+                if not ok:
+                    break
+                self._grabbed.set()
+                self.stats["frames"] += 1
+                window_frames += 1
+                elapsed = self._grabbed_at - window_start
+                if elapsed >= 2.0:
+                    self.stats["fps"] = round(window_frames / elapsed, 1)
+                    window_start, window_frames = self._grabbed_at, 0
+
+            print(f"Frame grabber {self.camera} lost {self.url}, reconnecting...")
+            self._grabbed.clear()
+            with self._lock:
+                self._cap = None
+            cap.release()
+            self.stats["connected"] = False
+            self.stats["reconnects"] += 1
@@ -0,0 +1,255 @@
+# Pseudo-terminal stand-ins for the robot's serial hardware, so the server can
+# be driven and load-tested on any Linux box.
+#   SabertoothEmulator - decodes packetized-serial frames written by the server and
+#                        records the monotonic time each one arrives. Follows the
+#                        baud command (15): bytes written while the port's rate
+#                        differs from the emulated controller's are dropped.
+#   WT901Emulator      - streams 0x51/0x52/0x53 frames at configurable rates,
+#                        optionally corrupting bytes
+#
+# Usage (then point the server at the printed links):
+#   python3 hw_emulator.py --motor-link /tmp/doomseek-motor --imu-link /tmp/doomseek-imu
+#   DOOMSEEK_MOTOR_PORT=/tmp/doomseek-motor DOOMSEEK_IMU_PORT=/tmp/doomseek-imu \
+#       DOOMSEEK_UI_DIR="Web stream/User Interface" uvicorn mainServer:app --port 8000
+import argparse
+import collections
+import errno
+import math
+import os
+import random
+import select
+import struct
+import threading
+import termios
+import time
+import tty
+
+
+class PtyDevice:
+    """A pty pair. The server opens the slave path, the emulator uses the master fd."""
+
+    def __init__(self, link=None):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+        self.link = link
+        if link:
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(self.path, link)
+        os.set_blocking(self.master, False)
+
+    def close(self):
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+        os.close(self.master)
+        os.close(self.slave)
+
+
+# Command 15 values, and the rate a pty reports for each baud setting
+BAUD_RATES = {1: 2400, 2: 9600, 3: 19200, 4: 38400, 5: 115200}
+TERMIOS_SPEEDS = {getattr(termios, f"B{rate}"): rate for rate in BAUD_RATES.values()}
+
+
+class SabertoothEmulator(threading.Thread):
+    def __init__(self, link=None, baud=9600, history=100000, verbose=False):
+        super().__init__(name="sabertooth-emulator", daemon=True)
+        self.device = PtyDevice(link)
+        self.path = link or self.device.path
+        self.baud = baud
+        self.verbose = verbose
+        # (received_at, address, command, value), newest last
+        self.packets = collections.deque(maxlen=history)
+        self.motors = {"motor1": 0, "motor2": 0}  # signed speed -127..127
+        self.mixed = {"drive": 0, "turn": 0}      # last mixed-mode commands
+        self.stats = {"packets": 0, "bytes": 0, "bad_checksums": 0, "skipped_bytes": 0,
+                      "wrong_baud_bytes": 0, "baud_changes": 0}
+        self._buffer = bytearray()
+        self._arrived = threading.Condition()
+        self._running = True
+
+    def stop(self):
+        self._running = False
+
+    def packet_count(self):
+        with self._arrived:
+            return self.stats["packets"]
+
+    def wait_for(self, predicate, timeout, since=None):
+        """
+        Blocks until predicate(packet) matches a packet numbered `since` or later
+        (default: packets arriving after the call) and returns it, or None on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._arrived:
+            checked = self.stats["packets"] if since is None else since
+            while True:
+                total = self.stats["packets"]
+                first = total - len(self.packets)
+                for index in range(max(checked, first), total):
+                    packet = self.packets[index - first]
+                    if predicate(packet):
+                        return packet
+                checked = total
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._arrived.wait(remaining)
+
+    def _apply(self, command, value):
+        if command == 0:
+            self.motors["motor1"] = value
+        elif command == 1:
+            self.motors["motor1"] = -value
+        elif command == 4:
+            self.motors["motor2"] = value
+        elif command == 5:
+            self.motors["motor2"] = -value
+        elif 8 <= command <= 11:
+            key = "drive" if command < 10 else "turn"
+            self.mixed[key] = value if command in (8, 10) else -value
+            drive, turn = self.mixed["drive"], self.mixed["turn"]
+            self.motors["motor1"] = max(-127, min(127, drive + turn))
+            self.motors["motor2"] = max(-127, min(127, drive - turn))
+        elif command == 15 and value in BAUD_RATES:
+            self.baud = BAUD_RATES[value]
+            self.stats["baud_changes"] += 1
+
+    def _line_baud(self):
+        """Rate the server set on its end of the pty, None if it isn't a standard one"""
+        try:
+            return TERMIOS_SPEEDS.get(termios.tcgetattr(self.device.slave)[5])
+        except termios.error:
+            return None
+
+    def _decode(self, received_at):
+        buf = self._buffer
+        i = 0
+        while len(buf) - i >= 4:
+            address, command, value, checksum = buf[i:i + 4]
+            if address < 128 or address == 0xAA:  # 0xAA is the autobaud byte
+                i += 1
+                self.stats["skipped_bytes"] += 1
+                continue
+            if (address + command + value) & 0x7F != checksum:
+                i += 1
+                self.stats["bad_checksums"] += 1
+                continue
+            self._apply(command, value)
+            self.packets.append((received_at, address, command, value))
+            self.stats["packets"] += 1
+            if self.verbose:
+                print(f"Sabertooth: address {address} command {command} value {value} -> {self.motors}")
+            i += 4
+        del buf[:i]
+
+    def run(self):
+        while self._running:
+            ready, _, _ = select.select([self.device.master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.device.master, 4096)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EIO):  # EIO: nobody has the slave open
+                    time.sleep(0.01)
+                    continue
+                raise
+            received_at = time.monotonic()
+            with self._arrived:
+                self.stats["bytes"] += len(data)
+                if self._line_baud() not in (None, self.baud):
+                    self.stats["wrong_baud_bytes"] += len(data)
+                    continue
+                self._buffer += data
+                self._decode(received_at)
+                self._arrived.notify_all()
+        self.device.close()
+
+
+class WT901Emulator(threading.Thread):
+    def __init__(self, link=None, rates=None, corrupt_rate=0.0, seed=0):
+        super().__init__(name="wt901-emulator", daemon=True)
+        self.device = PtyDevice(link)
+        self.path = link or self.device.path
+        # Frames per second for each data type
+        self.rates = rates or {0x51: 200.0, 0x52: 200.0, 0x53: 200.0}
+        self.corrupt_rate = corrupt_rate
+        self.rng = random.Random(seed)
+        self.stats = {"frames": 0, "corrupted": 0, "dropped": 0}
+        self._running = True
+
+    def stop(self):
+        self._running = False
+
+    def _values(self, data_type, t):
+        # Slowly rolls the robot from the floor onto a wall and back
+        tilt = (math.sin(t * 0.2) + 1.0) * 45.0
+        rad = math.radians(tilt)
+        if data_type == 0x51:
+            g = (math.sin(rad), 0.0, -math.cos(rad))
+            return [int(v / 16.0 * 32768) for v in g] + [0]
+        if data_type == 0x52:
+            # Rolling about y, the rate that turns the gravity vector above
+            rate = 0.2 * 45.0 * math.cos(t * 0.2)
+            return [0, int(rate / 2000.0 * 32768), 0, 0]
+        yaw = (t * 5.0) % 360.0 - 180.0
+        return [int(tilt / 180.0 * 32768), 0, int(yaw / 180.0 * 32767), 0]
+
+    def frame(self, data_type, t):
+        packet = bytearray(bytes([0x55, data_type]) + struct.pack("<hhhh", *self._values(data_type, t)))
+        packet.append(sum(packet) & 0xFF)
+        if self.corrupt_rate and self.rng.random() < self.corrupt_rate:
+            packet[self.rng.randrange(len(packet))] = self.rng.randrange(256)
+            self.stats["corrupted"] += 1
+        return bytes(packet)
+
+    def run(self):
+        start = time.monotonic()
+        next_due = {data_type: start for data_type in self.rates}
+        while self._running:
+            now = time.monotonic()
+            out = bytearray()
+            for data_type, rate in self.rates.items():
+                while next_due[data_type] <= now:
+                    out += self.frame(data_type, next_due[data_type] - start)
+                    next_due[data_type] += 1.0 / rate
+                    self.stats["frames"] += 1
+            if out:
+                try:
+                    os.write(self.device.master, out)
+                except OSError:
+                    # Nobody reading or the pty buffer is full - like a real UART, data is lost
+                    self.stats["dropped"] += len(out) // 11
+            time.sleep(max(0.0, min(next_due.values()) - time.monotonic()))
+        self.device.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sabertooth and WT901 pty emulators")
+    parser.add_argument("--motor-link", default="/tmp/doomseek-motor")
+    parser.add_argument("--imu-link", default="/tmp/doomseek-imu")
+    parser.add_argument("--imu-rate", type=float, default=200.0, help="frames per second per data type")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="fraction of corrupted IMU frames")
+    parser.add_argument("--quiet", action="store_true", help="don't print every motor packet")
+    args = parser.parse_args()
+
+    sabertooth = SabertoothEmulator(args.motor_link, verbose=not args.quiet)
+    wt901 = WT901Emulator(args.imu_link, {t: args.imu_rate for t in (0x51, 0x52, 0x53)}, args.corrupt)
+    sabertooth.start()
+    wt901.start()
+    print(f"Sabertooth emulator on {sabertooth.path} -> {sabertooth.device.path}")
+    print(f"WT901 emulator on {wt901.path} -> {wt901.device.path}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"Sabertooth {sabertooth.stats} | WT901 {wt901.stats}")
+    except KeyboardInterrupt:
+        sabertooth.stop()
+        wt901.stop()
+        sabertooth.join()
+        wt901.join()
+
+
+if __name__ == "__main__":
+    main()
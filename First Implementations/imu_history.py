@@ -0,0 +1,121 @@
+# Fixed-memory history of IMU samples for post-inspection questions
+# ("what was the pitch when we crossed onto Wall C?").
+# Samples live in preallocated NumPy columns used as a ring buffer, so memory
+# never grows: at the default 20 Hz, two hours of samples take about 6.5 MB.
+# Samples are stamped with monotonic time, which only moves forward even when
+# NTP steps the wall clock (the Pi has no RTC); `clock_offset` converts to and
+# from the epoch seconds of queries and results.
+import threading
+import numpy as np
+
+# Numeric columns in the values array
+FIELDS = ("ax", "ay", "az", "gx", "gy", "gz", "roll", "pitch", "yaw")
+FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+
+# Surface and location labels are stored as uint8 codes, only append to this list
+LABELS = (
+    "N/A", "Calibrating...", "Transitioning", "Floor", "Ceiling", "Wall",
+    "Left Wall", "Right Wall", "Front Wall", "Back Wall",
+    "Wall A", "Wall B", "Wall C", "Wall D",
+)
+LABEL_CODES = {label: code for code, label in enumerate(LABELS)}
+
+MAX_POINTS = 5000
+
+
+class IMUHistory:
+    def __init__(self, capacity, min_interval=0.0, clock_offset=0.0):
+        self.capacity = capacity
+        self.min_interval = min_interval  # seconds, thins the IMU rate down to the storage rate
+        self.clock_offset = clock_offset  # epoch seconds at monotonic time 0
+        self.t = np.zeros(capacity, dtype=np.float64)          # monotonic seconds
+        self.values = np.zeros((capacity, len(FIELDS)), dtype=np.float32)
+        self.surface = np.zeros(capacity, dtype=np.uint8)
+        self.location = np.zeros(capacity, dtype=np.uint8)
+        self.count = 0  # samples ever appended
+        self._last_t = float("-inf")
+        self._lock = threading.Lock()
+
+    def nbytes(self):
+        return self.t.nbytes + self.values.nbytes + self.surface.nbytes + self.location.nbytes
+
+    def append(self, t, accel, gyro, roll, pitch, yaw, surface, location):
+        if t - self._last_t < self.min_interval:
+            return
+        self._last_t = t
+        with self._lock:
+            i = self.count % self.capacity
+            self.t[i] = t
+            row = self.values[i]
+            row[0:3] = accel if accel else (0.0, 0.0, 0.0)
+            row[3:6] = gyro if gyro else (0.0, 0.0, 0.0)
+            row[6] = roll
+            row[7] = pitch
+            row[8] = yaw
+            self.surface[i] = LABEL_CODES.get(surface, 0)
+            self.location[i] = LABEL_CODES.get(location, 0)
+            self.count += 1
+
+    def _select(self, start, end):
+        # Copies the samples with start <= t <= end in time order.
+        # The ring is at most two sorted segments, each is searched on its own.
+        with self._lock:
+            n = min(self.count, self.capacity)
+            head = self.count % self.capacity
+            segments = [(head, self.capacity), (0, head)] if self.count > self.capacity else [(0, n)]
+            pieces = []
+            for a, b in segments:
+                times = self.t[a:b]
+                lo = a + (0 if start is None else int(np.searchsorted(times, start, "left")))
+                hi = a + (b - a if end is None else int(np.searchsorted(times, end, "right")))
+                if hi > lo:
+                    pieces.append((self.t[lo:hi].copy(), self.values[lo:hi].copy(),
+                                   self.surface[lo:hi].copy(), self.location[lo:hi].copy()))
+        if not pieces:
+            return (np.zeros(0), np.zeros((0, len(FIELDS)), dtype=np.float32),
+                    np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=np.uint8))
+        if len(pieces) == 1:
+            return pieces[0]
+        return tuple(np.concatenate(column) for column in zip(*pieces))
+
+    def query(self, start=None, end=None, points=500, fields=FIELDS):
+        """
+        Returns the samples between start and end (epoch seconds) reduced to at
+        most `points` buckets. Each field reports the min, max and mean of its
+        bucket; surface and location report the newest label in the bucket.
+        """
+        points = max(1, min(int(points), MAX_POINTS))
+        t, values, surface, location = self._select(None if start is None else start - self.clock_offset,
+                                                    None if end is None else end - self.clock_offset)
+        t = t + self.clock_offset
+        columns = [FIELD_INDEX[name] for name in fields]
+        values = values[:, columns]
+
+        if len(t) > points:
+            starts = np.linspace(0, len(t), points + 1).astype(np.int64)[:-1]
+            ends = np.append(starts[1:], len(t)) - 1
+            sizes = (ends - starts + 1).astype(np.float32)[:, None]
+            mean = np.add.reduceat(values, starts, axis=0) / sizes
+            low = np.minimum.reduceat(values, starts, axis=0)
+            high = np.maximum.reduceat(values, starts, axis=0)
+            t, surface, location = t[starts], surface[ends], location[ends]
+        else:
+            mean = low = high = values
+
+        labels = np.array(LABELS, dtype=object)
+        return {
+            "count": int(len(t)),
+            "start": float(t[0]) if len(t) else None,
+            "end": float(t[-1]) if len(t) else None,
+            "t": np.round(t, 3).tolist(),
+            "fields": {
+                name: {
+                    "min": np.round(low[:, i], 3).tolist(),
+                    "max": np.round(high[:, i], 3).tolist(),
+                    "mean": np.round(mean[:, i], 3).tolist(),
+                }
+                for i, name in enumerate(fields)
+            },
+            "surface": labels[surface].tolist(),
+            "location": labels[location].tolist(),
+        }
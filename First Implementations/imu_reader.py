@@ -0,0 +1,91 @@
+# Dedicated reader thread for the WT901 IMU.
+# Reads whatever bytes the UART has in bulk, splits them into frames with
+# wt901.FrameBuffer and hands each batch of decoded frames to a callback.
+# None of this runs on the asyncio event loop, so a pause in the IMU stream can
+# never stall request handling.
+import threading
+import time
+
+import metrics
+from serial_backend import open_serial
+from wt901 import FrameBuffer, FRAME_LEN, FRAME_TYPES
+
+READ_TIMEOUT = 0.05   # seconds a read may wait for the first bytes
+REOPEN_DELAY = 1.0    # seconds between attempts to (re)open the port
+
+DECODE_SECONDS = metrics.histogram("imu_decode_seconds", "Time to split one serial read into frames")
+HANDLER_SECONDS = metrics.histogram("imu_handler_seconds", "Time the on_frames callback takes per batch")
+FRAMES = metrics.counter("imu_frames_total", "Valid IMU frames by data type", ("type",))
+
+
+class IMUReader(threading.Thread):
+    def __init__(self, port, baud, on_frames, on_raw=None, backend="serial"):
+        super().__init__(name="imu-reader", daemon=True)
+        self.backend = backend
+        self.port = port
+        self.baud = baud
+        self.on_frames = on_frames  # Called as on_frames(frames, monotonic_time)
+        self.on_raw = on_raw        # Optional on_raw(bytes, monotonic_time), e.g. the mission log
+        self.frames = FrameBuffer()
+        self._frame_counters = {data_type: FRAMES.labels(f"0x{data_type:02x}") for data_type in FRAME_TYPES}
+        self._running = True
+        self.stats = {"reads": 0, "bytes": 0, "reconnects": 0, "connected": False}
+
+    def stop(self):
+        self._running = False
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats.update(self.frames.stats)
+        return stats
+
+    def _open(self):
+        while self._running:
+            try:
+                print(f"Attempting to open serial port {self.port}...")
+                imu = open_serial(self.backend, self.port, self.baud, READ_TIMEOUT)
+                imu.reset_input_buffer()
+                print(f"IMU Serial connection established on {self.port}")
+                self.stats["connected"] = True
+                return imu
+            except Exception as e:
+                print(f"Failed to open IMU serial port: {e}")
+                time.sleep(REOPEN_DELAY)
+        return None
+
+    def run(self):
+        imu = self._open()
+        while self._running and imu is not None:
+            try:
+                # Block for at most READ_TIMEOUT, then take everything that is waiting
+                data = imu.read(max(imu.in_waiting, FRAME_LEN))
+            except Exception as e:
+                print(f"IMU error: {e}")
+                self.stats["connected"] = False
+                self.stats["reconnects"] += 1
+                imu.close()
+                time.sleep(REOPEN_DELAY)
+                imu = self._open()
+                continue
+            if not data:
+                continue
+            received_at = time.monotonic()
+            self.stats["reads"] += 1
+            self.stats["bytes"] += len(data)
+            if self.on_raw is not None:
+                self.on_raw(data, received_at)
+            started = time.perf_counter()
+            self.frames.append(data)
+            frames = self.frames.pop_frames()
+            decoded = time.perf_counter()
+            DECODE_SECONDS.observe(decoded - started)
+            if frames:
+                for data_type, _ in frames:
+                    self._frame_counters[data_type].value += 1
+                try:
+                    self.on_frames(frames, received_at)
+                except Exception as e:
+                    print(f"IMU handler error: {e}")
+                HANDLER_SECONDS.observe(time.perf_counter() - decoded)
+        if imu is not None:
+            imu.close()
@@ -1,34 +1,74 @@
 # This FastAPI server integrates motor control and IMU telemetry with a UI
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
-import serial, struct, sys, asyncio, datetime
-import cv2
+import sys, asyncio, datetime, json, math, time
 import os
-import glob
-import shutil
-from camera_control import camA_zoom_in,camB_zoom_in,camA_zoom_out,camB_zoom_out
+import config
+import metrics
+from motor_writer import SabertoothWriter
+from serial_backend import open_serial
+from imu_reader import IMUReader
+from wt901 import ACCEL_SCALE, GYRO_SCALE, ANGLE_SCALE
+from imu_history import IMUHistory, FIELDS as HISTORY_FIELDS
+from telemetry import TelemetryBroadcaster
+from surface_detection import SurfaceTracker
+from mission_log import MissionRecorder
+from frame_grabber import FrameGrabber
+from v4l2_controls import CameraControls
+from camera_control import create_pipelines
+from snapshot_jobs import SnapshotJobs, SnapshotBusy
+from snapshot_catalog import SnapshotCatalog
+from frame_analysis import FrameAnalyzer
+from recordings_index import RecordingsIndex
+from recording_control import MediaMTXClient, MediaMTXError, NotRecording, RecordingControl, span_segments
+from file_ranges import RangeFileResponse
+from remux_cache import RemuxCache
+from retention import RetentionEngine
+from thumbnails import ThumbnailCache
+from executors import Scheduler, LaneFull, LaneTimeout
+from drive_protocol import decode_drive, encode_ack, seq_newer, ACK_APPLIED, ACK_STALE, ACK_INVALID
 
 app = FastAPI()
-app.mount("/ui", StaticFiles(directory="ui"), name="ui")
+app.mount("/ui", StaticFiles(directory=config.UI_DIR), name="ui")
+# Latency of every route, see metrics.py and GET /metrics
+app.add_middleware(metrics.RouteTimer, histogram=metrics.histogram(
+    "http_request_seconds", "HTTP request time to the start of the response", ("method", "route", "status")))
 
 # Connect to Sabertooth motor controller. Information about the Sabertooth motor
 # controller [Sabertooth 2x32](Sabertooth2x32.pdf)
 try:
-    ser = serial.Serial('/dev/ttyAMA0', 9600, timeout=1)
+    ser = open_serial(config.MOTOR_BACKEND, config.MOTOR_PORT, config.MOTOR_BAUD, timeout=1)
     print("Serial connection established with Sabertooth.")
 except Exception as e:
     print(f"Error opening serial port: {e}")
     sys.exit()
 
-def send_packatized_command(address, command, value):
+# Blocking work started by requests runs on a bounded lane per class of work,
+# see executors.py. No lane starts a job while the motor writer is writing.
+lanes = Scheduler()
+camera_lane = lanes.add("camera", config.LANE_CAMERA_WORKERS, config.LANE_CAMERA_QUEUE,
+                        config.LANE_CAMERA_TIMEOUT, priority=1, nice=config.LANE_NICE // 2)
+encode_lane = lanes.add("encode", config.LANE_ENCODE_WORKERS, config.LANE_ENCODE_QUEUE,
+                        config.LANE_ENCODE_TIMEOUT, priority=2, nice=config.LANE_NICE)
+files_lane = lanes.add("files", config.LANE_FILES_WORKERS, config.LANE_FILES_QUEUE,
+                       config.LANE_FILES_TIMEOUT, priority=3, nice=config.LANE_NICE)
+
+async def run_in_lane(lane, fn, *args):
     try:
-        checksum = (address + command + value) & 0x7F
-        packet = bytes([address, command, value, checksum])
-        ser.write(packet)
-    except Exception as e:
-        print(f"Error sending command: {e}")
+        return await lane.run(fn, *args)
+    except LaneFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except LaneTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+# Only the writer thread touches the port, see motor_writer.py
+motor_writer = SabertoothWriter(ser, config.DEADMAN_TIMEOUT, mode=config.MOTOR_DRIVE_MODE,
+                                baud=config.MOTOR_TARGET_BAUD or None, foreground=lanes.foreground("motor"))
+
+def send_packatized_command(address, command, value):
+    motor_writer.submit(command, value, address)
 
 class MotorControl(BaseModel):
     motor1_speed: int
@@ -37,6 +77,14 @@ class MotorControl(BaseModel):
 
 
 
+# Direction of (motor 1, motor 2) for each drive action, any other action stops
+DRIVE_DIRECTIONS = {
+    "forward": (1, 1),
+    "reverse": (-1, -1),
+    "Turning Right": (1, -1),
+    "Turning Left": (-1, 1),
+}
+
 latest_control_input = {
     "timestamp": None,
     "action": None,
@@ -44,59 +92,313 @@ latest_control_input = {
     "motor2_speed": 0
 }
 
-#App.post("/control") receives motor control commands
-#This endpoint expects a JSON payload with motor speeds and action
-@app.post("/control")
-async def control_motors(data: MotorControl):
+# One always-connected grabber per camera holds the newest frame, see frame_grabber.py
+frame_grabbers = {camera: FrameGrabber(camera, f"{config.RTSP_BASE}/{camera}", nice=config.GRABBER_NICE)
+                  for camera in config.CAMERAS}
+
+# ffmpeg publisher of each camera, restarted when it exits or stalls
+camera_pipelines = create_pipelines() if config.CAMERA_PIPELINES_ENABLED else {}
+
+# Zoom, focus and exposure through an open V4L2 fd per camera, see v4l2_controls.py
+camera_controls = {camera: CameraControls(camera, device) for camera, device in config.CAMERA_DEVICES.items()}
+
+# Every saved snapshot is cataloged with the robot's pose when it was taken
+snapshot_catalog = SnapshotCatalog(config.SNAPSHOT_CATALOG_PATH, config.SNAPSHOT_DIR)
+
+def snapshot_pose(camera):
+    controls = camera_controls.get(camera)
+    return {"location": surface_tracker.location, "surface": surface_tracker.surface or "Transitioning",
+            "roll": imu_state["roll"], "pitch": imu_state["pitch"], "yaw": imu_state["yaw"],
+            "accel": imu_state["accel"], "zoom": controls.values.get("zoom") if controls else None}
+
+# JPEG encoding and disk writes for snapshots and bursts run on a bounded pool
+snapshot_jobs = SnapshotJobs(frame_grabbers, config.SNAPSHOT_DIR, workers=config.SNAPSHOT_WORKERS,
+                             max_pending=config.SNAPSHOT_MAX_PENDING, max_bursts=config.SNAPSHOT_MAX_BURSTS,
+                             max_burst_frames=config.SNAPSHOT_MAX_BURST_FRAMES, pool=encode_lane,
+                             catalog=snapshot_catalog, pose=snapshot_pose,
+                             thumbnail_width=config.SNAPSHOT_THUMBNAIL_WIDTH)
+
+# Pushes IMU and control-state updates to every /telemetry/stream subscriber
+telemetry = TelemetryBroadcaster(config.TELEMETRY_MAX_RATE)
+
+# Binary record of raw IMU bytes and drive commands, replay with mission_replay.py
+mission_recorder = (MissionRecorder(config.MISSION_LOG_DIR, config.MISSION_SEGMENT_MB * 1024 * 1024,
+                                    config.MISSION_LOG_MAX_MB * 1024 * 1024)
+                    if config.MISSION_LOG_ENABLED else None)
+
+control_seconds = metrics.histogram("control_apply_seconds", "Time apply_control takes per drive command")
+
+# apply_control is shared by the JSON endpoint and the WebSocket channel
+def apply_control(action, motor1_speed, motor2_speed):
+    started = time.perf_counter()
     # Update the latest control input properly
     latest_control_input["timestamp"] = datetime.datetime.now().strftime('%H:%M:%S')
-    latest_control_input["action"] = data.action
-    latest_control_input["motor1_speed"] = data.motor1_speed
-    latest_control_input["motor2_speed"] = data.motor2_speed
-
-    if data.action == "forward":
-        send_packatized_command(128, 0, data.motor1_speed)
-        send_packatized_command(128, 4, data.motor2_speed)
-    elif data.action == "reverse":
-        send_packatized_command(128, 1, data.motor1_speed)
-        send_packatized_command(128, 5, data.motor2_speed)
-    elif data.action == "Turning Right":
-        send_packatized_command(128, 0, data.motor1_speed)
-        send_packatized_command(128, 5, data.motor2_speed)
-    elif data.action == "Turning Left":
-        send_packatized_command(128, 1, data.motor1_speed)
-        send_packatized_command(128, 4, data.motor2_speed)
-    elif data.action == "Take Picture": # Take picture uses openCV to capture a frame from the stream
-        # Your streaming URL
-        STREAM_URL = "rtsp://localhost:8554/webrtc/camB"  # Change cam depending on the camera you want to use
-        # Create the inspection folder if it doesn't exist
-        os.makedirs("inspection", exist_ok=True)
-        # OpenCV capture from the stream
-        cap = cv2.VideoCapture(STREAM_URL)
-        if not cap.isOpened():
-            print("Failed to open stream!")
-        else:
-            ret, frame = cap.read()
-            if ret:
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"inspection/snapshot_{timestamp}.jpg"
-                cv2.imwrite(filename, frame)
-                print(f"Snapshot saved: {filename}")
-            else:
-                print("Failed to grab frame!")
-        cap.release()
-        
+    latest_control_input["action"] = action
+    latest_control_input["motor1_speed"] = motor1_speed
+    latest_control_input["motor2_speed"] = motor2_speed
+    telemetry.publish("input", latest_control_input)
+    if mission_recorder is not None:
+        mission_recorder.record_control(action, motor1_speed, motor2_speed)
+
+    direction = DRIVE_DIRECTIONS.get(action)
+    if direction is not None:
+        # Signed motor speeds to one throttle/steer vector, see SabertoothWriter.drive
+        left, right = direction[0] * motor1_speed, direction[1] * motor2_speed
+        motor_writer.drive((left + right) / 2, (left - right) / 2)
+    elif action == "Take Picture": # Take picture saves the newest frame from the always-on camB grabber
+        try:
+            snapshot_jobs.submit("camB")
+        except SnapshotBusy as e:
+            print(f"Picture skipped: {e}")
     
-    elif data.action == "Zoom In":
-        camA_zoom_in()
-    elif data.action == "Zoom Out":
-        camA_zoom_out()
+    elif action == "Zoom In":
+        camera_controls["camA"].zoom_by(1)
+    elif action == "Zoom Out":
+        camera_controls["camA"].zoom_by(-1)
     
     else:
-        send_packatized_command(128, 0, 0)
-        send_packatized_command(128, 4, 0)
+        motor_writer.drive(0, 0)
+    control_seconds.observe(time.perf_counter() - started)
+
+#App.post("/control") receives motor control commands
+#This endpoint expects a JSON payload with motor speeds and action
+#Kept for compatibility, drivers should use the /ws/control channel below
+@app.post("/control")
+async def control_motors(data: MotorControl):
+    apply_control(data.action, data.motor1_speed, data.motor2_speed)
     return {"status": "Success", "message": "Data received"}
 
+# Persistent binary control channel (frame layout in drive_protocol.py).
+# The socket reader only keeps the newest frame, the applier sends it to the
+# motors and acks it so the client can measure round-trip time. Frames that were
+# overtaken by a newer one before being applied are acked as stale.
+@app.websocket("/ws/control")
+async def control_socket(websocket: WebSocket):
+    await websocket.accept()
+    latest = {"command": None, "last_seq": None, "stale": [], "invalid": 0}
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        while True:
+            command = decode_drive(await websocket.receive_bytes())
+            if command is None:
+                latest["invalid"] += 1
+            elif seq_newer(command[3], latest["last_seq"]):
+                if latest["command"] is not None:
+                    latest["stale"].append(latest["command"][3])
+                latest["command"] = command
+                latest["last_seq"] = command[3]
+            else:
+                latest["stale"].append(command[3])
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while True:
+            ready = asyncio.create_task(frame_ready.wait())
+            await asyncio.wait({receiver, ready}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver.done():
+                ready.cancel()
+                break
+            frame_ready.clear()
+
+            stale, latest["stale"] = latest["stale"], []
+            for seq in stale:
+                await websocket.send_bytes(encode_ack(seq, ACK_STALE))
+            while latest["invalid"]:
+                latest["invalid"] -= 1
+                await websocket.send_bytes(encode_ack(0, ACK_INVALID))
+
+            command, latest["command"] = latest["command"], None
+            if command is not None:
+                action, motor1_speed, motor2_speed, seq = command
+                apply_control(action, motor1_speed, motor2_speed)
+                await websocket.send_bytes(encode_ack(seq, ACK_APPLIED))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if receiver.done() and not receiver.cancelled():
+            receiver.exception()  # Disconnect ends the reader, mark it handled
+        else:
+            receiver.cancel()
+        # Never leave the robot driving when the driver's link drops
+        apply_control("stop", 0, 0)
+
+class SnapshotRequest(BaseModel):
+    camera: str = "camB"
+    save: bool = True
+    quality: int = 90
+
+# Returns the current frame of camA or camB as a JPEG (and saves it to inspection/)
+@app.post("/proxy-snapshot")
+async def proxy_snapshot(data: SnapshotRequest):
+    if data.camera not in frame_grabbers:
+        raise HTTPException(status_code=404, detail=f"Unknown camera: {data.camera}")
+    # The frame comes from the camera lane, the encode runs on the encode lane
+    future = await run_in_lane(camera_lane, snapshot_jobs.encode_now, data.camera,
+                               max(1, min(100, data.quality)), data.save)
+    if future is None:
+        raise HTTPException(status_code=503, detail=f"No frame available from {data.camera}")
+    try:
+        jpeg, filename = await encode_lane.result(future)
+    except LaneTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    return Response(content=jpeg, media_type="image/jpeg", headers={"X-Snapshot-Path": filename or ""})
+
+class BurstRequest(BaseModel):
+    camera: str = "camB"
+    count: int = 5              # frames to take...
+    interval: float = 0.2       # ...this many seconds apart (0 = every frame)
+    duration: float = None      # or every `interval` for this many seconds instead of count
+    quality: int = 90
+    preview_width: int = None   # also save a downscaled preview this wide
+
+# Starts a burst capture and returns a job id to poll at /snapshots/jobs/{job_id}
+@app.post("/snapshots/burst", status_code=202)
+async def start_burst(data: BurstRequest):
+    if data.camera not in frame_grabbers:
+        raise HTTPException(status_code=404, detail=f"Unknown camera: {data.camera}")
+    try:
+        job_id = snapshot_jobs.submit(data.camera, data.count, data.interval, data.duration,
+                                      data.quality, data.preview_width)
+    except SnapshotBusy as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"job_id": job_id, "status": "capturing"}
+
+@app.get("/snapshots/jobs")
+async def list_snapshot_jobs(limit: int = 20):
+    return {"jobs": snapshot_jobs.list_jobs(limit)}
+
+@app.get("/snapshots/jobs/{job_id}")
+async def get_snapshot_job(job_id: str):
+    job = snapshot_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def parse_range(text, name):
+    # "min,max" query parameters of the catalog
+    try:
+        low, high = (float(value) for value in text.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be min,max")
+    if not (math.isfinite(low) and math.isfinite(high)):
+        raise HTTPException(status_code=400, detail=f"{name} bounds must be finite numbers")
+    return low, high
+
+def catalog_page(*args):
+    snapshots, next_cursor = snapshot_catalog.query(*args)
+    for snapshot in snapshots:
+        snapshot["url"] = f"/snapshots/catalog/{snapshot['id']}.jpg"
+        snapshot["thumbnail_url"] = f"/snapshots/catalog/{snapshot['id']}/thumbnail.jpg"
+    return json.dumps({"snapshots": snapshots, "next_cursor": next_cursor}).encode()
+
+@app.get("/snapshots/catalog")
+async def query_snapshot_catalog(limit: int = 50, cursor: str = None, camera: str = None, location: str = None,
+                                 surface: str = None, start: float = None, end: float = None, roll: str = None,
+                                 pitch: str = None, yaw: str = None, zoom: str = None):
+    """
+    Saved snapshots newest first with the pose they were taken at, e.g.
+    ?location=Wall B&pitch=30,90. start/end are epoch seconds, roll/pitch/yaw
+    are min,max in degrees (a yaw range with min > max wraps through ±180),
+    zoom is min,max. Pass next_cursor back as cursor for the next page.
+    """
+    ranges = [parse_range(value, name) if value else None
+              for name, value in (("roll", roll), ("pitch", pitch), ("yaw", yaw), ("zoom", zoom))]
+    try:
+        body = await run_in_lane(files_lane, catalog_page, limit, cursor, camera, location, surface, start, end,
+                                 *ranges)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=body, media_type="application/json")
+
+# Image count per wall label and the time range of the catalog
+@app.get("/snapshots/catalog/summary")
+async def get_snapshot_catalog_summary():
+    return await run_in_lane(files_lane, snapshot_catalog.summary)
+
+@app.get("/snapshots/catalog/{snapshot_id}.jpg")
+async def get_cataloged_snapshot(snapshot_id: int, request: Request):
+    try:
+        path = await run_in_lane(files_lane, snapshot_catalog.file_path, snapshot_id)
+        return RangeFileResponse(path, request.headers, request.method, media_type="image/jpeg",
+                                 cache_control="public, max-age=31536000, immutable")
+    except (KeyError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
+@app.get("/snapshots/catalog/{snapshot_id}/thumbnail.jpg")
+async def get_snapshot_thumbnail(snapshot_id: int):
+    try:
+        jpeg = await run_in_lane(files_lane, snapshot_catalog.thumbnail, snapshot_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    return Response(content=jpeg, media_type="image/jpeg",
+                    headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+# Connection state, frame rate and frame age of each camera grabber
+@app.get("/snapshot/grabbers")
+async def get_grabber_stats():
+    return {camera: grabber.get_stats() for camera, grabber in frame_grabbers.items()}
+
+class ZoomRequest(BaseModel):
+    value: int = None   # absolute zoom_absolute value...
+    steps: int = None   # ...or zoom in (positive) / out (negative) by this many presses
+
+# Control ranges, applied values and pending targets of every camera
+@app.get("/cameras/controls")
+async def get_camera_controls():
+    return {camera: controls.get_state() for camera, controls in camera_controls.items()}
+
+@app.post("/cameras/{camera}/zoom")
+async def set_camera_zoom(camera: str, data: ZoomRequest):
+    if camera not in camera_controls:
+        raise HTTPException(status_code=404, detail=f"Unknown camera: {camera}")
+    controls = camera_controls[camera]
+    if data.value is not None:
+        try:
+            target = controls.set("zoom", data.value)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"{camera} has no zoom control")
+    elif data.steps is not None:
+        target = controls.zoom_by(data.steps)
+        if target is None:
+            raise HTTPException(status_code=503, detail=f"{camera} controls are not available yet")
+    else:
+        raise HTTPException(status_code=400, detail="Give either value or steps")
+    return {"camera": camera, "zoom": target}
+
+# Sets any of zoom, focus, focus_auto, exposure, exposure_auto, e.g. {"focus_auto": 0, "focus": 120}
+@app.post("/cameras/{camera}/controls")
+async def set_camera_controls(camera: str, data: dict):
+    if camera not in camera_controls:
+        raise HTTPException(status_code=404, detail=f"Unknown camera: {camera}")
+    controls = camera_controls[camera]
+    # Every control is checked before any is set, a bad one applies none of them
+    try:
+        values = {name: controls.check(name, value) for name, value in data.items()}
+        return {name: controls.set(name, value) for name, value in values.items()}
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Unsupported control: {e.args[0]}")
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Control values must be integers")
+
+# fps, bitrate, dropped frames, restarts and last error of each camera pipeline
+@app.get("/cameras/pipelines")
+async def get_camera_pipelines():
+    return {camera: pipeline.get_state() for camera, pipeline in camera_pipelines.items()}
+
+@app.post("/cameras/{camera}/restart")
+async def restart_camera_pipeline(camera: str):
+    if camera not in camera_pipelines:
+        raise HTTPException(status_code=404, detail=f"No pipeline for camera: {camera}")
+    camera_pipelines[camera].restart()
+    return {"camera": camera, "status": "restarting"}
+
+# Queue depth, write latency and dropped-command counts of the motor link
+@app.get("/motor/stats")
+async def get_motor_stats():
+    return motor_writer.get_stats()
+
 # Then update this endpoint accordingly:
 @app.get("/input")
 async def get_input():
@@ -111,7 +413,7 @@ async def get_input():
 # app.get("/") serves the UI information 
 @app.get("/")
 async def get_ui():
-    return FileResponse("ui/index.html")
+    return FileResponse(os.path.join(config.UI_DIR, "index.html"))
 
 #This data includes the timestamp and the input action
 # app.get("/input") returns the latest control input data
@@ -124,85 +426,7 @@ async def get_input():
     })
 #------------------------------------------------------------------------------------------------------
 #Below line is the Beginning for IMU telemetry
-def checksum(data):
-    return sum(data) & 0xFF
-
-def parse_data(packet):
-    if len(packet) < 11 or packet[0] != 0x55 or checksum(packet[:10]) != packet[10]:
-        return None, None
-    return packet[1], struct.unpack('<hhhh', packet[2:10])
-
-# Wall labeling system - calibrated at startup
-wall_calibration = {
-    "reference_yaw": None,  # Yaw angle when starting at Wall A
-    "reference_surface": None,  # Which surface type is Wall A
-    "is_calibrated": False
-}
-
-def get_wall_label(yaw, current_surface):
-    """
-    Label walls as A, B, C, D based on starting position.
-    Wall A = starting wall (basic input)
-    Wall B = 90° clockwise from A
-    Wall C = opposite of A
-    Wall D = 90° counter-clockwise from A
-    """
-    if not wall_calibration["is_calibrated"]:
-        return "Calibrating..."
-
-    # Only label actual walls, not floor/ceiling
-    if current_surface not in ["Left Wall", "Right Wall", "Front Wall", "Back Wall"]:
-        return current_surface
-
-    # Calculate relative angle from starting position
-    ref_yaw = wall_calibration["reference_yaw"]
-    angle_diff = (yaw - ref_yaw) % 360
-
-    # Determine which wall based on rotation
-    # 0° = Wall A, 90° = Wall B, 180° = Wall C, 270° = Wall D
-    if angle_diff < 45 or angle_diff >= 315:
-        return "Wall A"
-    elif 45 <= angle_diff < 135:
-        return "Wall B"
-    elif 135 <= angle_diff < 225:
-        return "Wall C"
-    else:
-        return "Wall D"
-
-def surface(pitch, roll, accel=None):
-    """
-    Enhanced surface detection using gravity vector from accelerometer.
-    The accelerometer measures gravity direction - this tells us which surface we're on.
-
-    Gravity components:
-    - Z-axis negative (az < -0.7): Gravity pulling down → Floor
-    - Z-axis positive (az > 0.7): Gravity pulling up → Ceiling
-    - X-axis negative (ax < -0.7): Gravity pulling left → Left Wall
-    - X-axis positive (ax > 0.7): Gravity pulling right → Right Wall
-    - Y-axis negative (ay < -0.7): Gravity pulling forward → Front Wall
-    - Y-axis positive (ay > 0.7): Gravity pulling backward → Back Wall
-    """
-    if accel:
-        ax, ay, az = accel
-
-        # Use accelerometer to detect gravity direction (most accurate)
-        # Threshold of 0.7g means axis is within ~45° of vertical
-        if abs(az) > 0.7:
-            return "Floor" if az < 0 else "Ceiling"
-        elif abs(ax) > 0.7:
-            return "Left Wall" if ax < 0 else "Right Wall"
-        elif abs(ay) > 0.7:
-            return "Front Wall" if ay < 0 else "Back Wall"
-        else:
-            # Transitioning between surfaces or at an angle
-            return "Transitioning"
-
-    # Fallback to pitch/roll if no accelerometer data
-    if abs(pitch) < 45 and abs(roll) < 45:
-        return "Floor"
-    elif abs(pitch) > 135 or abs(roll) > 135:
-        return "Ceiling"
-    return "Wall"
+#Frame parsing lives in wt901.py, the serial reader thread in imu_reader.py
 
 latest_imu_data = {
     "timestamp": None,
@@ -218,177 +442,389 @@ latest_imu_data = {
 async def get_imu():
     return JSONResponse(content=latest_imu_data.copy())
 
-# def imu_loop reads data from the IMU sensor and updates the latest IMU data
-
-async def imu_loop():
-    try:
-        print("Attempting to open serial port /dev/ttyAMA2...")
-        imu = serial.Serial("/dev/ttyAMA2", 115200, timeout=0.1)
-        imu.flushInput()
-        print("IMU Serial connection established on /dev/ttyAMA2")
-    except Exception as e:
-        print(f"Failed to open IMU serial port: {e}")
-        return
-
-    roll = pitch = yaw = 0.0
-    accel = gyro = None
-
-    try:
-        while True:
-            if imu.read(1) == b'\x55':
-                packet = b'\x55' + imu.read(10)
-                data_type, values = parse_data(packet)
-                if not data_type:
-                    continue
-                #0x51 is the accelerometer data address
-                # ![](./docs/Acceleration0x51.png)
-                if data_type == 0x51:
-                    accel = tuple(v / 32768.0 * 16.0 for v in values[:3])
-
-                #0x52 is the accelerometer data address
-                # ![](./docs/AngularVelocity0x52.png)
-                elif data_type == 0x52:
-                    gyro = tuple(v / 32768.0 * 2000.0 for v in values[:3])
-
-                #0x53 is the Euler angles data address
-                # ![](./docs/Angle0x53.png)
-                elif data_type == 0x53:
-                    roll = values[0] / 32768.0 * 180.0
-                    pitch = values[1] / 32768.0 * 180.0
-                    yaw = values[2] / 32768.0 * 180.0
-
-                    timestamp = datetime.datetime.now().strftime('%H:%M:%S')
-                    surf = surface(pitch, roll, accel)  # Get surface type
-                    location = get_wall_label(yaw, surf)  # Convert to Wall A/B/C/D
-
-                    # Auto-calibrate on first wall detection
-                    if not wall_calibration["is_calibrated"] and "Wall" in surf:
-                        wall_calibration["reference_yaw"] = yaw
-                        wall_calibration["reference_surface"] = surf
-                        wall_calibration["is_calibrated"] = True
-                        print(f"✓ Calibrated! Starting wall set as Wall A at yaw={yaw:.1f}°")
-
-                    latest_imu_data.update({
-                        "timestamp": timestamp,
-                        "location": location,
-                        "surface": surf,
-                        "accel": accel,
-                        "gyro": gyro,
-                        "roll": roll,
-                        "pitch": pitch,
-                        "yaw": yaw
-                    })
-                    print(f"[{timestamp}] Location: {location} | Surface: {surf}")
-            await asyncio.sleep(0)
-    except Exception as e:
-        print(f"IMU error: {e}")
+# Server-Sent Events stream of combined IMU and control input, replaces UI polling
+# of /imu and /input. rate is the most updates per second this client wants.
+@app.get("/telemetry/stream")
+async def telemetry_stream(rate: float = config.TELEMETRY_DEFAULT_RATE):
+    return StreamingResponse(
+        telemetry.subscribe(rate),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Every angle sample goes into a fixed-size history for /imu/history
+imu_history = IMUHistory(int(config.HISTORY_SECONDS * config.HISTORY_RATE_HZ),
+                         min_interval=1.0 / config.HISTORY_RATE_HZ, clock_offset=time.time() - time.monotonic())
+
+# handle_imu_frames runs on the IMU reader thread for every batch of decoded
+# frames and updates the latest IMU data
+imu_state = {"roll": 0.0, "pitch": 0.0, "yaw": 0.0, "accel": None, "gyro": None}
+
+# Gravity filter over every accel/gyro sample with hysteresis on surface changes
+surface_tracker = SurfaceTracker(config.SURFACE_ENTER, config.SURFACE_EXIT, config.SURFACE_DWELL,
+                                 config.SURFACE_FILTER_TAU, clock_offset=time.time() - time.monotonic())
+
+def handle_imu_frames(frames, received_at):
+    for data_type, values in frames:
+        #0x51 is the accelerometer data address
+        # ![](./docs/Acceleration0x51.png)
+        if data_type == 0x51:
+            imu_state["accel"] = (values[0] * ACCEL_SCALE, values[1] * ACCEL_SCALE, values[2] * ACCEL_SCALE)
+            surface_tracker.accel(received_at, *imu_state["accel"])
+
+        #0x52 is the accelerometer data address
+        # ![](./docs/AngularVelocity0x52.png)
+        elif data_type == 0x52:
+            imu_state["gyro"] = (values[0] * GYRO_SCALE, values[1] * GYRO_SCALE, values[2] * GYRO_SCALE)
+            surface_tracker.gyro(received_at, *imu_state["gyro"])
+
+        #0x53 is the Euler angles data address
+        # ![](./docs/Angle0x53.png)
+        elif data_type == 0x53:
+            roll = values[0] * ANGLE_SCALE
+            pitch = values[1] * ANGLE_SCALE
+            yaw = values[2] * ANGLE_SCALE
+            accel = imu_state["accel"]
+            imu_state.update({"roll": roll, "pitch": pitch, "yaw": yaw})
+            surface_tracker.angle(received_at, roll, pitch, yaw)
+
+            timestamp = datetime.datetime.now().strftime('%H:%M:%S')
+            surf, location = surface_tracker.surface or "Transitioning", surface_tracker.location
+            if location != latest_imu_data["location"]:
+                print(f"[{timestamp}] Location: {location} | Surface: {surf}")
+
+            latest_imu_data.update({
+                "timestamp": timestamp,
+                "location": location,
+                "surface": surf,
+                "accel": accel,
+                "gyro": imu_state["gyro"],
+                "roll": roll,
+                "pitch": pitch,
+                "yaw": yaw
+            })
+            telemetry.publish("imu", latest_imu_data)
+            imu_history.append(received_at, accel, imu_state["gyro"], roll, pitch, yaw, surf, location)
+
+imu_reader = IMUReader(config.IMU_PORT, config.IMU_BAUD, handle_imu_frames,
+                       on_raw=mission_recorder.record_imu if mission_recorder is not None else None,
+                       backend=config.IMU_BACKEND)
+
+# Time-range query over the IMU history, downsampled on the server.
+# start/end are epoch seconds, fields is a comma separated subset of
+# ax,ay,az,gx,gy,gz,roll,pitch,yaw
+@app.get("/imu/history")
+async def get_imu_history(start: float = None, end: float = None, points: int = 500, fields: str = None):
+    names = tuple(fields.split(",")) if fields else HISTORY_FIELDS
+    unknown = [name for name in names if name not in HISTORY_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return await run_in_lane(files_lane, imu_history.query, start, end, points, names)
+
+# Size, segment and dropped-record counters of the mission log
+@app.get("/mission/stats")
+async def get_mission_stats():
+    if mission_recorder is None:
+        return {"enabled": False}
+    return {"enabled": True, **mission_recorder.stats}
+
+# Current surface, filtered gravity vector and the latest surface changes
+@app.get("/imu/surface")
+async def get_imu_surface(events: int = 20):
+    return surface_tracker.get_state(max(0, min(events, surface_tracker.events.maxlen)))
+
+# Frame, resync and reconnect counters of the IMU link
+@app.get("/imu/stats")
+async def get_imu_stats():
+    return imu_reader.get_stats()
 
 # Recording management endpoints
+recordings_index = RecordingsIndex(config.RECORDINGS_DIR, config.RECORDINGS_INDEX_PATH,
+                                   config.RECORDINGS_SCAN_INTERVAL)
+thumbnail_cache = (ThumbnailCache(recordings_index, config.THUMBNAIL_DIR, config.THUMBNAIL_INTERVAL,
+                                  config.THUMBNAIL_WIDTH, config.THUMBNAIL_COLUMNS, ffmpeg=config.FFMPEG)
+                   if config.THUMBNAILS_ENABLED else None)
+retention = RetentionEngine(recordings_index, int(config.RETENTION_QUOTA_GB * 1024 ** 3),
+                            int(config.RETENTION_MIN_FREE_GB * 1024 ** 3), config.RETENTION_MAX_AGE_DAYS,
+                            config.RETENTION_INTERVAL, config.RETENTION_BATCH, config.RETENTION_BATCH_PAUSE,
+                            config.RETENTION_PROTECT_SECONDS)
+remux_cache = RemuxCache(config.RECORDINGS_DIR, config.REMUX_CACHE_DIR, config.REMUX_CACHE_MB * 1024 * 1024,
+                         config.REMUX_WORKERS, config.FFMPEG)
+
 @app.get("/recordings")
-async def list_recordings():
-    """List all available recordings"""
+async def list_recordings(limit: int = 50, cursor: str = None, camera: str = None,
+                          start: float = None, end: float = None, location: str = None):
+    """
+    List recordings, newest first, from the recordings index.
+    Pass next_cursor back as cursor for the next page. start/end are epoch seconds,
+    location keeps the segments of recording spans that visited it (e.g. "Wall A").
+    """
     try:
-        recordings_dir = "./recordings"
-        if not os.path.exists(recordings_dir):
-            os.makedirs(recordings_dir)
-            return {"recordings": []}
-
-        # Get all recording files
-        recording_files = []
-        for ext in ['*.mp4', '*.avi', '*.mkv', '*.webm', '*.ts']:
-            recording_files.extend(glob.glob(os.path.join(recordings_dir, "**", ext), recursive=True))
-
-        recordings = []
-        for file_path in recording_files:
-            file_stat = os.stat(file_path)
-            recordings.append({
-                "filename": os.path.basename(file_path),
-                "path": file_path.replace("./recordings/", ""),
-                "size": file_stat.st_size,
-                "modified": datetime.datetime.fromtimestamp(file_stat.st_mtime).isoformat(),
-                "size_mb": round(file_stat.st_size / (1024 * 1024), 2)
-            })
-
-        # Sort by modification time (newest first)
-        recordings.sort(key=lambda x: x['modified'], reverse=True)
-        return {"recordings": recordings}
-
+        # A full page takes a few ms to encode, that happens on the lane too
+        body = await run_in_lane(files_lane, recordings_page, limit, cursor, camera, start, end, location)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing recordings: {str(e)}")
-
-@app.get("/recordings/download/{path:path}")
-async def download_recording(path: str):
-    """Download a specific recording file with optimized streaming"""
+    return Response(content=body, media_type="application/json")
+
+def recordings_page(limit, cursor, camera, start, end, location):
+    recordings, next_cursor = recordings_index.query(limit, cursor, camera, start, end, location)
+    for recording in recordings:
+        # "ready" when /recordings/download/<path>?format=mp4 can be served from the cache
+        recording["mp4"] = (remux_cache.status(recording["path"], recording["mtime"], recording["size"])
+                            if recording["path"].endswith(".ts") else None)
+    return json.dumps({"recordings": recordings, "next_cursor": next_cursor}).encode()
+
+# Counters of the recordings index, the MP4 cache and the thumbnailer
+@app.get("/recordings/stats")
+async def get_recordings_stats():
+    return {"index": recordings_index.stats, "mp4_cache": remux_cache.stats,
+            "thumbnails": thumbnail_cache.stats if thumbnail_cache is not None else None}
+
+@app.api_route("/recordings/download/{path:path}", methods=["GET", "HEAD"])
+async def download_recording(path: str, request: Request, format: str = None):
+    """
+    Download a recording, with Range requests for resuming and seeking.
+    format=mp4 serves a faststart MP4 remux instead, answering 202 while it is
+    being made.
+    """
     try:
-        file_path = os.path.join("./recordings", path)
-
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Recording not found")
-
-        # Get file size for Content-Length header
-        file_size = os.path.getsize(file_path)
-
-        def file_generator():
-            with open(file_path, "rb") as file:
-                while chunk := file.read(524288):  # 512KB chunks for maximum speed
-                    yield chunk
-
-        return StreamingResponse(
-            file_generator(),
-            media_type="application/octet-stream",
-            headers={
-                "Content-Disposition": f"attachment; filename={os.path.basename(file_path)}",
-                "Content-Length": str(file_size),
-                "Cache-Control": "no-cache",
-                "Accept-Ranges": "bytes"
-            }
-        )
-
+        file_path = os.path.join(config.RECORDINGS_DIR, path)
+        if format == "mp4":
+            mp4_path = await run_in_lane(files_lane, remux_cache.get, path)
+            if mp4_path is None:
+                return JSONResponse({"status": "pending"}, status_code=202, headers={"Retry-After": "2"})
+            filename = os.path.splitext(os.path.basename(file_path))[0] + ".mp4"
+            return RangeFileResponse(mp4_path, request.headers, request.method,
+                                     filename=filename, media_type="video/mp4")
+        if format is not None:
+            raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+        return RangeFileResponse(file_path, request.headers, request.method,
+                                 filename=os.path.basename(file_path))
+    except HTTPException:
+        raise
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Recording not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error downloading recording: {str(e)}")
 
+# Retention status and the most recent deletions (newest first)
+@app.get("/recordings/retention")
+async def get_retention(limit: int = 50):
+    status = await run_in_lane(files_lane, retention.status)
+    return {"status": status, "decisions": retention.recent_decisions(limit)}
+
+# Starts a retention pass now instead of waiting for the next scheduled one. A
+# large cleanup outlasts any request, so the pass runs on the retention thread;
+# GET /recordings/retention shows it in last_run once it is done.
+@app.post("/recordings/retention/run")
+async def run_retention():
+    retention.trigger()
+    return JSONResponse({"status": "started", "previous_run": retention.stats["last_run"]}, status_code=202)
+
+# Keyframe thumbnails and timeline sprite of a recording, 202 while they are being made
+@app.get("/recordings/thumbnails/{path:path}")
+async def get_recording_thumbnails(path: str):
+    if thumbnail_cache is None:
+        raise HTTPException(status_code=404, detail="Thumbnails are disabled")
+    try:
+        st = await run_in_lane(files_lane, os.stat, os.path.join(config.RECORDINGS_DIR, path))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    result = await run_in_lane(files_lane, thumbnail_cache.get, path, st.st_mtime, st.st_size)
+    if result["status"] != "ready":
+        return JSONResponse(result, status_code=202 if result["status"] != "failed" else 500)
+    result["sprite_url"] = f"/thumbnails/{result['sprite']}.jpg"
+    for frame in result["frames"]:
+        frame["url"] = f"/thumbnails/{frame['thumb']}.jpg"
+    return result
+
+# Thumbnail and sprite images, named by content hash so they never change
+@app.get("/thumbnails/{digest}.jpg")
+async def get_thumbnail(digest: str, request: Request):
+    try:
+        return RangeFileResponse(thumbnail_cache.blob_path(digest), request.headers, request.method,
+                                 media_type="image/jpeg", cache_control="public, max-age=31536000, immutable")
+    except (AttributeError, KeyError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+
+# Pinned recordings are kept by retention
+@app.post("/recordings/pin/{path:path}")
+async def pin_recording(path: str, pinned: bool = True):
+    try:
+        await run_in_lane(files_lane, recordings_index.pin, path, pinned)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    return {"path": path, "pinned": pinned}
+
+def remove_recording(path):
+    os.remove(os.path.join(config.RECORDINGS_DIR, path))
+    recordings_index.forget(path)
+
 @app.delete("/recordings/{path:path}")
 async def delete_recording(path: str):
     """Delete a specific recording file"""
     try:
-        file_path = os.path.join("./recordings", path)
-
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Recording not found")
-
-        os.remove(file_path)
+        await run_in_lane(files_lane, remove_recording, path)
         return {"message": f"Recording {path} deleted successfully"}
 
+    except HTTPException:
+        raise
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Recording not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting recording: {str(e)}")
 
-@app.get("/recordings/cleanup")
-async def cleanup_old_recordings():
-    """Delete recordings older than 7 days"""
+# Operator recordings: short segments on demand, tagged with where the robot was
+recording_control = RecordingControl(MediaMTXClient(config.MEDIAMTX_API, config.MEDIAMTX_API_TIMEOUT),
+                                     recordings_index, surface_tracker, config.CAMERA_DEVICES,
+                                     config.RECORD_SEGMENT_SECONDS, config.RECORD_FORMAT,
+                                     config.RECORD_WHEN_IDLE, config.RECORD_IDLE_SEGMENT)
+RECORD_ACTIONS = {"start": recording_control.start, "stop": recording_control.stop,
+                  "cut": recording_control.cut, "mark": recording_control.mark}
+
+class RecordRequest(BaseModel):
+    camera: str = "camB"
+    action: str = "start"       # start, stop, cut (close the segment now) or mark
+    note: str = None
+
+def record_action(action, camera, note):
+    result = RECORD_ACTIONS[action](camera, note)
+    if action == "stop":
+        # The operator's last segment, for the UI to open
+        closed = result["closed"]
+        segments = span_segments(config.RECORDINGS_DIR, camera, closed["started"], closed["ended"])
+        result["segments"] = segments
+        result["url"] = f"/recordings/download/{segments[-1]}" if segments else None
+        recordings_index.rescan()
+    return result
+
+# Starts, stops, cuts or marks a camera's recording through the mediamtx API
+@app.post("/proxy-record")
+async def proxy_record(data: RecordRequest):
+    if data.action not in RECORD_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown action: {data.action}")
     try:
-        recordings_dir = "./recordings"
-        if not os.path.exists(recordings_dir):
-            return {"message": "No recordings directory found", "deleted": 0}
-
-        cutoff_time = datetime.datetime.now() - datetime.timedelta(days=7)
-        deleted_count = 0
-
-        for root, dirs, files in os.walk(recordings_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                if os.path.getmtime(file_path) < cutoff_time.timestamp():
-                    os.remove(file_path)
-                    deleted_count += 1
-
-        return {"message": f"Cleanup completed", "deleted": deleted_count}
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error during cleanup: {str(e)}")
+        return await run_in_lane(files_lane, record_action, data.action, data.camera, data.note)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown camera: {data.camera}")
+    except NotRecording:
+        raise HTTPException(status_code=409, detail=f"{data.camera} is not recording")
+    except MediaMTXError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+# Which cameras are recording and the API call counters
+@app.get("/recordings/control")
+async def get_recording_control():
+    return recording_control.get_state()
+
+# Recording spans newest first, with their surface and wall tags, marks and segments
+@app.get("/recordings/spans")
+async def list_recording_spans(limit: int = 50, camera: str = None, start: float = None, end: float = None,
+                               location: str = None):
+    return {"spans": await run_in_lane(files_lane, recordings_index.spans, limit, camera, start, end, location)}
+
+# Optional anomaly flagging on sampled camera frames; flags become bookmarks
+# and are pushed to the UI on the telemetry stream
+def save_flag(event):
+    bookmark = recordings_index.add_bookmark(event["camera"], event["at"], event["kind"], event["score"])
+    telemetry.publish("anomaly", {**event, "id": bookmark, "count": frame_analyzer.stats["flags"]})
+
+frame_analyzer = FrameAnalyzer(frame_grabbers, on_flag=save_flag, moving=motor_writer.moving,
+                               workers=config.ANALYSIS_WORKERS, width=config.ANALYSIS_WIDTH,
+                               cpu_budget=config.ANALYSIS_CPU_BUDGET, min_rate=config.ANALYSIS_MIN_RATE,
+                               max_rate=config.ANALYSIS_MAX_RATE, hold=config.ANALYSIS_FLAG_HOLD,
+                               thresholds={"motion": config.ANALYSIS_MOTION, "blur": config.ANALYSIS_BLUR,
+                                           "occlusion": config.ANALYSIS_OCCLUSION,
+                                           "bright": config.ANALYSIS_BRIGHT, "color": config.ANALYSIS_COLOR},
+                               nice=config.LANE_NICE)
+analysis_enabled = config.ANALYSIS_ENABLED and config.FRAME_GRABBERS_ENABLED
+
+# Sampling rate, CPU use against the budget, latest scores and flags
+@app.get("/analysis")
+async def get_analysis():
+    return {"enabled": analysis_enabled, **frame_analyzer.get_state()}
+
+# Flagged moments newest first, with the recording segment and offset that show them
+@app.get("/recordings/bookmarks")
+async def list_bookmarks(limit: int = 50, camera: str = None, start: float = None, end: float = None,
+                         kind: str = None):
+    bookmarks = await run_in_lane(files_lane, recordings_index.bookmarks, limit, camera, start, end, kind)
+    for bookmark in bookmarks:
+        bookmark["url"] = f"/recordings/download/{bookmark['segment']}" if bookmark["segment"] else None
+    return {"bookmarks": bookmarks}
+
+# Counters the components already keep, read when /metrics is scraped
+for name in ("submitted", "writes", "write_errors", "coalesced", "duplicates", "deadman_stops"):
+    metrics.counter(f"motor_{name}_total", f"Sabertooth writer {name.replace('_', ' ')}",
+                    fn=lambda name=name: motor_writer.stats[name])
+metrics.gauge("motor_queue_depth", "Motor commands waiting for the writer thread",
+              fn=lambda: motor_writer.get_stats()["queue_depth"])
+for name, text in (("bad_frames", "IMU headers that failed the type or checksum test"),
+                   ("skipped_bytes", "IMU bytes skipped while resyncing"),
+                   ("overflows", "IMU receive buffer overflows")):
+    metrics.counter(f"imu_{name}_total", text, fn=lambda name=name: imu_reader.frames.stats[name])
+metrics.counter("imu_reconnects_total", "IMU serial reconnects", fn=lambda: imu_reader.stats["reconnects"])
+metrics.gauge("imu_connected", "1 while the IMU serial port is open", fn=lambda: int(imu_reader.stats["connected"]))
+loop_lag_seconds = metrics.histogram("event_loop_lag_seconds", "How late the event loop wakes a 100 ms sleep")
+loop_lag_last = metrics.gauge("event_loop_lag_last_seconds", "Lag of the latest event loop probe")
+
+# Workers, queue depth, rejections, timeouts and queue-wait / run-time
+# percentiles of every lane and of the motor writer
+@app.get("/executors")
+async def get_executor_stats():
+    return lanes.get_stats()
+
+# Prometheus text format, scrape with a 5-15 s interval
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=metrics.REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+# Percentiles in ms, rates per second and current gauges for the UI
+@app.get("/metrics/summary")
+async def get_metrics_summary():
+    return metrics.REGISTRY.summary()
+
+background_tasks = set()
 
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(imu_loop())
+    # Worker threads hand the GIL back to the event loop sooner, see config.py.
+    # Set here rather than on import so benches and tools importing this module
+    # keep their own interval
+    sys.setswitchinterval(config.GIL_SWITCH_INTERVAL_MS / 1000)
+    telemetry.attach(asyncio.get_running_loop())
+    lanes.start()
+    background_tasks.add(asyncio.create_task(metrics.monitor_loop_lag(loop_lag_seconds, loop_lag_last)))
+    motor_writer.start()
+    if mission_recorder is not None:
+        mission_recorder.start()
+    imu_reader.start()
+    recordings_index.start()
+    retention.start()
+    if thumbnail_cache is not None:
+        thumbnail_cache.start()
+    for pipeline in camera_pipelines.values():
+        pipeline.start()
+    for controls in camera_controls.values():
+        controls.start()
+    if config.FRAME_GRABBERS_ENABLED:
+        for grabber in frame_grabbers.values():
+            grabber.start()
+    if analysis_enabled:
+        frame_analyzer.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    if frame_analyzer.is_alive():
+        frame_analyzer.stop()
+        frame_analyzer.join(2)
+    # ffmpeg children would otherwise keep the cameras busy after the server exits
+    for pipeline in camera_pipelines.values():
+        pipeline.stop()
+    for pipeline in camera_pipelines.values():
+        if pipeline.is_alive():
+            pipeline.join(5)
@@ -0,0 +1,208 @@
+# Stand-in for mediamtx's Control API and recorder, so recording control
+# (recording_control.py) can be run and measured without cameras or mediamtx.
+# Answers the v3 path config calls the server makes and, for every path with
+# record on, writes an MPEG-TS (or fMP4) segment under recordPath's layout
+# (<root>/<path>/%Y-%m-%d_%H-%M-%S-%f.<ext>) at a steady bitrate. Like mediamtx,
+# a segment is closed when record is switched off or recordSegmentDuration has
+# passed, and a new one starts only at the next keyframe (every GOP seconds).
+# fail_records(path, n) makes the next n record: true patches of a path answer
+# 500 without applying them, to check what the server does when one is lost.
+#
+# Usage (then start the server with DOOMSEEK_MEDIAMTX_API=http://127.0.0.1:9997
+# and DOOMSEEK_RECORDINGS_DIR pointing at the same directory):
+#   python3 mediamtx_emulator.py --recordings ./recordings
+import argparse
+import datetime
+import http.server
+import json
+import math
+import os
+import re
+import threading
+import time
+
+PATHS = ("camA", "camB")
+DEFAULTS = {"record": True, "recordFormat": "mpegts", "recordSegmentDuration": "1h"}
+EXTENSIONS = {"mpegts": ".ts", "fmp4": ".mp4"}
+TS_PACKET = b"\x47" + bytes(187)
+DURATION = re.compile(r"(\d+(?:\.\d+)?)(h|ms|m|s)")
+UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_duration(text):
+    """Seconds of a Go duration as mediamtx takes them ("1h", "90s", "1m30s")"""
+    parts = DURATION.findall(text)
+    if not parts or "".join(value + unit for value, unit in parts) != text:
+        raise ValueError(f"invalid duration: {text}")
+    return sum(float(value) * UNITS[unit] for value, unit in parts)
+
+
+class _Path:
+    def __init__(self, name):
+        self.name = name
+        self.conf = dict(DEFAULTS)
+        self.segment = None      # open file
+        self.segment_started = None
+        self.pending_since = None  # record on, waiting for a keyframe
+
+
+class MediaMTXEmulator(threading.Thread):
+    def __init__(self, root, port=9997, paths=PATHS, bitrate=4_000_000, gop=1.0, tick=0.1):
+        super().__init__(name="mediamtx-emulator", daemon=True)
+        self.root = root
+        self.bitrate = bitrate
+        self.gop = gop
+        self.tick = tick
+        self.paths = {name: _Path(name) for name in paths}
+        self._lock = threading.Lock()
+        self._running = True
+        self.stats = {"patches": 0, "segments": 0, "bytes": 0}
+        self.log = []   # (time, path, settings) of every patch
+        self._failing = {}   # path -> record: true patches left to refuse
+        emulator = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                emulator._handle(self, "GET")
+
+            def do_PATCH(self):
+                emulator._handle(self, "PATCH")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.port = self.server.server_address[1]
+        self.base = f"http://127.0.0.1:{self.port}"
+
+    def _handle(self, handler, method):
+        parts = handler.path.split("?")[0].strip("/").split("/")
+        status, body = 404, {"error": "not found"}
+        if len(parts) == 5 and parts[:3] == ["v3", "config", "paths"] and parts[4] in self.paths:
+            path = self.paths[parts[4]]
+            if method == "PATCH" and parts[3] == "patch":
+                try:
+                    length = int(handler.headers.get("Content-Length", 0))
+                    settings = json.loads(handler.rfile.read(length) or b"{}")
+                    if settings.get("record") and self._refuse(path):
+                        status, body = 500, {"error": "record: true refused by fail_records"}
+                    else:
+                        self.patch(path, settings)
+                        status, body = 200, None
+                except ValueError as e:
+                    status, body = 400, {"error": str(e)}
+            elif method == "GET" and parts[3] == "get":
+                status, body = 200, {"name": path.name, **path.conf}
+        elif len(parts) == 4 and parts[:3] == ["v3", "paths", "get"] and parts[3] in self.paths:
+            status, body = 200, {"name": parts[3], "ready": True, "readers": []}
+        content = json.dumps(body).encode() if body is not None else b""
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(content)))
+        handler.end_headers()
+        handler.wfile.write(content)
+
+    def fail_records(self, name, count=1):
+        with self._lock:
+            self._failing[name] = count
+
+    def _refuse(self, path):
+        with self._lock:
+            if not self._failing.get(path.name):
+                return False
+            self._failing[path.name] -= 1
+            return True
+
+    def patch(self, path, settings):
+        unknown = set(settings) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"json: unknown field \"{sorted(unknown)[0]}\"")
+        if "recordSegmentDuration" in settings:
+            parse_duration(settings["recordSegmentDuration"])
+        if settings.get("recordFormat", "mpegts") not in EXTENSIONS:
+            raise ValueError(f"invalid record format: {settings['recordFormat']}")
+        with self._lock:
+            self.stats["patches"] += 1
+            self.log.append((time.time(), path.name, dict(settings)))
+            changes_recorder = any(path.conf[key] != value for key, value in settings.items())
+            path.conf.update(settings)
+            # mediamtx restarts the recorder of a path whose record settings change
+            if changes_recorder:
+                self._close(path)
+                path.pending_since = time.monotonic() if path.conf["record"] else None
+
+    def _close(self, path):
+        if path.segment is not None:
+            path.segment.close()
+            path.segment = None
+        path.pending_since = None
+
+    def _open(self, path, now):
+        started = datetime.datetime.now()
+        directory = os.path.join(self.root, path.name)
+        os.makedirs(directory, exist_ok=True)
+        name = started.strftime("%Y-%m-%d_%H-%M-%S-%f") + EXTENSIONS[path.conf["recordFormat"]]
+        path.segment = open(os.path.join(directory, name), "wb")
+        path.segment_started = now
+        path.pending_since = None
+        self.stats["segments"] += 1
+
+    def stop(self):
+        self._running = False
+        self.server.shutdown()
+
+    def run(self):
+        threading.Thread(target=self.server.serve_forever, name="mediamtx-emulator-api", daemon=True).start()
+        start = time.monotonic()
+        written = 0.0
+        while self._running:
+            time.sleep(self.tick)
+            now = time.monotonic()
+            packets = int(self.bitrate / 8 / len(TS_PACKET) * self.tick)
+            with self._lock:
+                # Keyframes arrive every gop seconds from the emulator's start
+                keyframe = start + math.floor((now - start) / self.gop) * self.gop
+                for path in self.paths.values():
+                    if not path.conf["record"]:
+                        continue
+                    if path.segment is not None and (
+                            now - path.segment_started >= parse_duration(path.conf["recordSegmentDuration"])
+                            and keyframe > path.segment_started):
+                        self._close(path)
+                        path.pending_since = now - self.gop   # the keyframe that ended it starts the next
+                    if path.segment is None:
+                        if path.pending_since is None:
+                            path.pending_since = now
+                        if keyframe < path.pending_since:
+                            continue
+                        self._open(path, now)
+                    path.segment.write(TS_PACKET * packets)
+                    path.segment.flush()
+                    written += packets * len(TS_PACKET)
+                self.stats["bytes"] = int(written)
+        with self._lock:
+            for path in self.paths.values():
+                self._close(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mediamtx Control API and recorder stand-in")
+    parser.add_argument("--recordings", default="./recordings")
+    parser.add_argument("--port", type=int, default=9997)
+    parser.add_argument("--bitrate", type=float, default=4.0, help="Mbit/s per recording path")
+    args = parser.parse_args()
+
+    emulator = MediaMTXEmulator(args.recordings, args.port, bitrate=int(args.bitrate * 1e6))
+    emulator.start()
+    print(f"mediamtx emulator API on {emulator.base}, recording to {args.recordings}")
+    try:
+        while True:
+            time.sleep(5)
+            print(emulator.stats)
+    except KeyboardInterrupt:
+        emulator.stop()
+        emulator.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+# Counters and fixed-bucket latency histograms for the hot paths, exposed in the
+# Prometheus text format on GET /metrics and as a compact JSON summary for the UI.
+# Recording is kept to a few attribute updates so it can sit inside the serial
+# writer and IMU reader loops:
+#   - a series (one combination of label values) is looked up once with
+#     .labels(...) and kept by the caller, observe() is then a bisect into a
+#     short tuple and three additions
+#   - there are no locks, each series is written by one thread (the motor
+#     writer, the IMU reader, the event loop). Where two threads share one, a
+#     rare lost increment is an acceptable price for monitoring.
+# Values that modules already count in their own stats dicts are not copied on
+# every update, they are read by a callback when /metrics is scraped.
+import asyncio
+import bisect
+import collections
+import math
+import time
+
+# Seconds, from 50 us (a serial write that only fills the kernel buffer) to 5 s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+RATE_WINDOW = 10.0   # seconds of history the summary computes rates over
+HTTP_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+
+
+class _CounterSeries:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _HistogramSeries:
+    __slots__ = ("bounds", "counts", "sum", "count", "max")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimated from the buckets, linear within the bucket the quantile falls in"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.bounds):
+                    return self.max
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = min(self.bounds[i], self.max)
+                return lower + (upper - lower) * max(0.0, rank - seen) / n
+            seen += n
+        return self.max
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.fn = fn           # For callback metrics: returns a value, or {label values: value}
+        self._series = {}
+        # The one series of an unlabelled metric, so inc()/observe() skip the lookup
+        self._default = self.labels() if not labelnames and fn is None else None
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        series = self._series.get(values)
+        if series is None:
+            series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def collect(self):
+        """(label values, value) for every series, value is a number or a histogram series"""
+        if self.fn is None:
+            return list(self._series.items())
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f"Metric {self.name} failed: {e}")
+            return []
+        if isinstance(value, dict):
+            return [(key if isinstance(key, tuple) else (key,), v) for key, v in value.items() if v is not None]
+        return [] if value is None else [((), value)]
+
+
+class _Scalar(_Metric):
+    def _new_series(self):
+        return _CounterSeries()
+
+    def collect(self):
+        if self.fn is None:
+            return [(key, series.value) for key, series in list(self._series.items())]
+        return super().collect()
+
+
+class Counter(_Scalar):
+    kind = "counter"
+
+    def inc(self, amount=1):
+        self._default.value += amount
+
+
+class Gauge(_Scalar):
+    kind = "gauge"
+
+    def set(self, value):
+        self._default.value = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class Registry:
+    def __init__(self, prefix="doomseek_"):
+        self.prefix = prefix
+        self.started = time.monotonic()
+        self._metrics = {}
+        self._samples = collections.deque()   # (monotonic time, {key: counter value}) for rates
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=(), fn=None):
+        return self.register(Counter(self.prefix + name, help, labelnames, fn))
+
+    def gauge(self, name, help, labelnames=(), fn=None):
+        return self.register(Gauge(self.prefix + name, help, labelnames, fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(self.prefix + name, help, labelnames, buckets))
+
+    def render_prometheus(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for values, value in metric.collect():
+                if metric.kind != "histogram":
+                    lines.append(f"{metric.name}{_format_labels(metric.labelnames, values)} {_format_value(value)}")
+                    continue
+                # Copy first, the owning thread keeps observing while we format
+                counts, total = list(value.counts), value.sum
+                cumulative = 0
+                for bound, n in zip(value.bounds + (math.inf,), counts):
+                    cumulative += n
+                    labels = _format_labels(metric.labelnames, values, ("le", _format_value(float(bound))))
+                    lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(metric.labelnames, values)
+                lines.append(f"{metric.name}_sum{labels} {_format_value(float(total))}")
+                lines.append(f"{metric.name}_count{labels} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        Compact view for the UI: latency percentiles in ms and rates per second
+        for histograms, value and rate for counters, value for gauges.
+        Series are keyed "name" or "name[label,label]" without the prefix (and
+        without _seconds for histograms), histograms with no samples are left out.
+        """
+        now = time.monotonic()
+        latency, counters, gauges, totals = {}, {}, {}, {}
+        for metric in list(self._metrics.values()):
+            short = metric.name[len(self.prefix):] if metric.name.startswith(self.prefix) else metric.name
+            for values, value in metric.collect():
+                key = f"{short}[{','.join(values)}]" if values else short
+                if metric.kind == "histogram":
+                    count = value.count
+                    if not count:
+                        continue
+                    key = key.replace("_seconds", "", 1)
+                    totals[key] = count
+                    latency[key] = {
+                        "count": count,
+                        "avg_ms": round(value.sum / count * 1000, 3),
+                        "p50_ms": _ms(value.quantile(0.5)),
+                        "p95_ms": _ms(value.quantile(0.95)),
+                        "p99_ms": _ms(value.quantile(0.99)),
+                        "max_ms": _ms(value.max),
+                    }
+                elif metric.kind == "counter":
+                    totals[key] = value
+                    counters[key] = {"value": value}
+                else:
+                    gauges[key] = value
+        for key, rate in self._rates(now, totals).items():
+            (latency.get(key) or counters[key])["rate"] = rate
+        return {"uptime": round(now - self.started, 1), "latency": latency, "counters": counters,
+                "gauges": gauges}
+
+    def _rates(self, now, totals):
+        # Against the oldest sample still inside RATE_WINDOW, a new one is kept every second
+        samples = self._samples
+        while len(samples) > 1 and now - samples[1][0] >= RATE_WINDOW:
+            samples.popleft()
+        base_at, base = samples[0] if samples else (self.started, {})
+        if not samples or now - samples[-1][0] >= 1.0:
+            samples.append((now, totals))
+        elapsed = now - base_at
+        if elapsed <= 0:
+            return {}
+        return {key: round((value - base.get(key, 0)) / elapsed, 2) for key, value in totals.items()}
+
+
+class RouteTimer:
+    """
+    ASGI middleware timing each HTTP request up to the start of its response,
+    labelled by method, route template (not the raw path, so /recordings/a.ts and
+    /recordings/b.ts are one series) and status class. Streaming responses are
+    timed to their headers, how long a client stays subscribed is not latency.
+    """
+
+    def __init__(self, app, histogram):
+        self.app = app
+        self.histogram = histogram
+        self._series = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                method = scope["method"] if scope["method"] in HTTP_METHODS else "other"
+                key = (method, route, message["status"] // 100)
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = self.histogram.labels(method, route, f"{key[2]}xx")
+                series.observe(elapsed)
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+async def monitor_loop_lag(histogram, gauge, interval=0.1):
+    """
+    Sleeps `interval` over and over and records how late each wake-up is: the
+    time the event loop was busy with something else (a blocking call in a
+    handler, a long JSON encode) while this task was ready to run.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        histogram.observe(lag)
+        gauge.set(lag)
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
@@ -0,0 +1,177 @@
+# Append-only binary mission log.
+# Raw IMU bytes (exactly as read from the UART) and every drive command are
+# written with monotonic timestamps to segmented files by a background thread,
+# so the IMU and control paths only pay for a deque append.
+#
+# Segment layout:
+#   header:  b"DSMLOG1\n" | start epoch (f64) | start monotonic (f64)
+#   records: kind (u8) | payload length (u16) | monotonic time (f64) | payload
+# A record cut short by a crash is ignored on read.
+#
+# Before a segment is opened, the oldest segments in the directory are deleted
+# until the log, with the new segment at full size, fits `max_bytes`.
+import collections
+import datetime
+import mmap
+import os
+import struct
+import threading
+import time
+
+from drive_protocol import ACTION_CODES, ACTIONS
+
+MAGIC = b"DSMLOG1\n"
+SEGMENT_HEADER = struct.Struct("<dd")
+RECORD_HEADER = struct.Struct("<BHd")
+CONTROL_PAYLOAD = struct.Struct("<BBB")
+
+KIND_IMU = 1      # raw IMU serial bytes
+KIND_CONTROL = 2  # action code, motor1 speed, motor2 speed (+ utf-8 action if not in ACTIONS)
+
+UNKNOWN_ACTION = 0xFF
+MAX_PAYLOAD = 0xFFFF
+FLUSH_INTERVAL = 1.0  # seconds
+
+
+def encode_control(action, motor1_speed, motor2_speed):
+    m1 = max(0, min(255, int(round(motor1_speed))))
+    m2 = max(0, min(255, int(round(motor2_speed))))
+    code = ACTION_CODES.get(action)
+    if code is None:
+        return CONTROL_PAYLOAD.pack(UNKNOWN_ACTION, m1, m2) + str(action).encode()[:255]
+    return CONTROL_PAYLOAD.pack(code, m1, m2)
+
+
+def decode_control(payload):
+    code, motor1_speed, motor2_speed = CONTROL_PAYLOAD.unpack_from(payload)
+    if code == UNKNOWN_ACTION:
+        action = bytes(payload[CONTROL_PAYLOAD.size:]).decode(errors="replace")
+    else:
+        action = ACTIONS[code] if code < len(ACTIONS) else "stop"
+    return action, motor1_speed, motor2_speed
+
+
+class MissionRecorder(threading.Thread):
+    def __init__(self, directory, segment_bytes, max_bytes=0, max_pending=10000):
+        super().__init__(name="mission-recorder", daemon=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes   # 0 keeps every segment
+        self._pending = collections.deque(maxlen=max_pending)
+        self._wake = threading.Event()
+        self._running = True
+        self._file = None
+        self._segment_index = 0
+        self.stats = {"records": 0, "bytes": 0, "dropped": 0, "segments": 0, "pruned": 0,
+                      "current_segment": None}
+
+    def record_imu(self, data, t=None):
+        self._push(KIND_IMU, bytes(data), t)
+
+    def record_control(self, action, motor1_speed, motor2_speed, t=None):
+        self._push(KIND_CONTROL, encode_control(action, motor1_speed, motor2_speed), t)
+
+    def _push(self, kind, payload, t):
+        if len(self._pending) == self._pending.maxlen:
+            self.stats["dropped"] += 1  # Disk can't keep up, the oldest record goes
+        self._pending.append((kind, time.monotonic() if t is None else t, payload))
+        self._wake.set()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def _prune(self):
+        segments = []
+        for path in list_segments(self.directory):
+            try:
+                segments.append((path, os.path.getsize(path)))
+            except OSError:
+                pass
+        total = sum(size for _, size in segments) + self.segment_bytes
+        for path, size in segments:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Mission log segment not pruned: {e}")
+                continue
+            total -= size
+            self.stats["pruned"] += 1
+            print(f"Mission log segment pruned: {path}")
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.max_bytes:
+            self._prune()
+        self._segment_index += 1
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.directory, f"mission_{stamp}_{self._segment_index:03d}.dslog")
+        self._file = open(path, "ab", buffering=256 * 1024)
+        self._file.write(MAGIC + SEGMENT_HEADER.pack(time.time(), time.monotonic()))
+        self._written = len(MAGIC) + SEGMENT_HEADER.size
+        self.stats["segments"] += 1
+        self.stats["current_segment"] = path
+        print(f"Mission log segment: {path}")
+
+    def _write(self, kind, t, payload):
+        if self._file is None or self._written >= self.segment_bytes:
+            if self._file is not None:
+                self._file.close()
+            self._open_segment()
+        for i in range(0, max(1, len(payload)), MAX_PAYLOAD):
+            chunk = payload[i:i + MAX_PAYLOAD]
+            self._file.write(RECORD_HEADER.pack(kind, len(chunk), t))
+            self._file.write(chunk)
+            self._written += RECORD_HEADER.size + len(chunk)
+            self.stats["bytes"] += RECORD_HEADER.size + len(chunk)
+        self.stats["records"] += 1
+
+    def run(self):
+        last_flush = time.monotonic()
+        while self._running or self._pending:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                while self._pending:
+                    self._write(*self._pending.popleft())
+                if self._file is not None and time.monotonic() - last_flush >= FLUSH_INTERVAL:
+                    self._file.flush()
+                    last_flush = time.monotonic()
+            except Exception as e:
+                print(f"Mission log error: {e}")
+                time.sleep(FLUSH_INTERVAL)
+        if self._file is not None:
+            self._file.close()
+
+
+def read_segment(path):
+    """
+    Memory-maps one segment and yields (kind, monotonic time, payload bytes).
+    The first item is (None, start_monotonic, start_epoch) so callers can map
+    record times back to wall-clock time.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < len(MAGIC) + SEGMENT_HEADER.size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a mission log")
+            start_epoch, start_monotonic = SEGMENT_HEADER.unpack_from(data, len(MAGIC))
+            yield None, start_monotonic, start_epoch
+            offset = len(MAGIC) + SEGMENT_HEADER.size
+            while offset + RECORD_HEADER.size <= len(data):
+                kind, length, t = RECORD_HEADER.unpack_from(data, offset)
+                offset += RECORD_HEADER.size
+                if offset + length > len(data):
+                    break  # Truncated by a crash or power loss
+                yield kind, t, data[offset:offset + length]
+                offset += length
+
+
+def list_segments(path):
+    # A single segment file or every segment in a directory, oldest first
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".dslog"))
+    return [path]
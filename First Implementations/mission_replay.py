@@ -0,0 +1,106 @@
+# Replays a mission log offline through the same IMU frame parsing and
+# SurfaceTracker classification the server runs, so field problems can be
+# reproduced and the pipeline profiled without the robot.
+#
+# Usage:
+#   python3 mission_replay.py logs/missions              # every segment, as fast as possible
+#   python3 mission_replay.py mission_x_001.dslog --speed 1   # real time
+#   python3 mission_replay.py logs/missions --speed 20 --controls
+import argparse
+import time
+
+import config
+from mission_log import read_segment, list_segments, decode_control, KIND_IMU, KIND_CONTROL
+from surface_detection import SurfaceTracker
+from wt901 import FrameBuffer, ACCEL, GYRO, ANGLE, ACCEL_SCALE, GYRO_SCALE, ANGLE_SCALE
+
+
+def replay(paths, speed=0.0, show_controls=False, on_sample=None):
+    """
+    Feeds every record back through the IMU pipeline. speed=0 runs as fast as
+    possible, otherwise 1.0 is real time. on_sample(epoch, surface, location,
+    roll, pitch, yaw, accel) is called for every angle frame. Returns a summary dict,
+    "surface_events" are the tracker's committed surface changes.
+    """
+    tracker = SurfaceTracker(config.SURFACE_ENTER, config.SURFACE_EXIT, config.SURFACE_DWELL,
+                             config.SURFACE_FILTER_TAU, history=None)
+    summary = {"records": 0, "imu_bytes": 0, "frames": 0, "angle_samples": 0,
+               "controls": 0, "transitions": 0, "log_seconds": 0.0}
+    started = time.perf_counter()
+
+    for path in paths:
+        frames = FrameBuffer()
+        accel = None
+        location = None
+        segment_start = epoch_offset = last_t = None
+        replay_start = time.monotonic()
+
+        for kind, t, payload in read_segment(path):
+            if kind is None:
+                epoch_offset = payload - t  # header: (None, start monotonic, start epoch)
+                tracker.clock_offset = epoch_offset
+                continue
+            if segment_start is None:
+                segment_start = t
+            summary["records"] += 1
+            if speed > 0:
+                delay = (t - segment_start) / speed - (time.monotonic() - replay_start)
+                if delay > 0:
+                    time.sleep(delay)
+
+            if kind == KIND_IMU:
+                summary["imu_bytes"] += len(payload)
+                frames.append(payload)
+                for data_type, values in frames.pop_frames():
+                    summary["frames"] += 1
+                    if data_type == ACCEL:
+                        accel = (values[0] * ACCEL_SCALE, values[1] * ACCEL_SCALE, values[2] * ACCEL_SCALE)
+                        tracker.accel(t, *accel)
+                    elif data_type == GYRO:
+                        tracker.gyro(t, values[0] * GYRO_SCALE, values[1] * GYRO_SCALE, values[2] * GYRO_SCALE)
+                    elif data_type == ANGLE:
+                        roll, pitch, yaw = values[0] * ANGLE_SCALE, values[1] * ANGLE_SCALE, values[2] * ANGLE_SCALE
+                        tracker.angle(t, roll, pitch, yaw)
+                        surf, new_location = tracker.surface or "Transitioning", tracker.location
+                        summary["angle_samples"] += 1
+                        if new_location != location:
+                            summary["transitions"] += 1
+                            print(f"[{t - segment_start:9.3f}s] Location: {new_location} | Surface: {surf} | "
+                                  f"roll {roll:.1f} pitch {pitch:.1f} yaw {yaw:.1f}")
+                            location = new_location
+                        if on_sample is not None:
+                            on_sample(t + epoch_offset, surf, new_location, roll, pitch, yaw, accel)
+
+            elif kind == KIND_CONTROL:
+                summary["controls"] += 1
+                if show_controls:
+                    action, motor1_speed, motor2_speed = decode_control(payload)
+                    print(f"[{t - segment_start:9.3f}s] Control: {action} | M1: {motor1_speed} | M2: {motor2_speed}")
+            last_t = t
+        if segment_start is not None and last_t is not None:
+            summary["log_seconds"] += last_t - segment_start
+
+    summary["replay_seconds"] = time.perf_counter() - started
+    summary["surface_events"] = list(tracker.events)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a DOOMSEEK mission log")
+    parser.add_argument("path", help="a .dslog segment or a directory of segments")
+    parser.add_argument("--speed", type=float, default=0.0, help="1 = real time, 0 = as fast as possible")
+    parser.add_argument("--controls", action="store_true", help="print drive commands too")
+    args = parser.parse_args()
+
+    summary = replay(list_segments(args.path), args.speed, args.controls)
+    elapsed = summary["replay_seconds"]
+    print(f"\n{summary['records']} records | {summary['frames']} IMU frames | "
+          f"{summary['angle_samples']} angle samples | {summary['controls']} controls | "
+          f"{summary['transitions']} location changes")
+    if elapsed > 0:
+        print(f"{summary['log_seconds']:.1f} s of log replayed in {elapsed:.2f} s "
+              f"({summary['log_seconds'] / elapsed:.0f}x real time)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+# Single owner of the Sabertooth serial link.
+# Request handlers never touch the port: they drop the newest value for each motor
+# into a slot and this thread writes it. A burst of commands collapses into one
+# write per motor, repeats of what is already on the wire are skipped, and the
+# motors are stopped if no command arrives within the dead-man timeout.
+# Packet format: [Sabertooth 2x32](../Sabertooth2x32.pdf) packetized serial
+#
+# drive(throttle, steer) takes one signed vector for the whole robot. In mixed
+# mode it becomes the controller's drive (8/9) and turn (10/11) commands and the
+# Sabertooth does the mixing, so going straight or only steering changes one
+# packet per update instead of two. In independent mode it is split into the
+# motor 1 (0/1) and motor 2 (4/5) commands as before.
+# The link can also be moved to a faster baud rate at startup (command 15), a
+# 4-byte packet takes 4.2 ms on the wire at 9600 baud and 1.0 ms at 38400.
+import contextlib
+import threading
+import time
+
+import metrics
+
+SABERTOOTH_ADDRESS = 128
+MAX_VALUE = 127
+
+DRIVE_MIXED = "mixed"
+DRIVE_INDEPENDENT = "independent"
+
+# Command 15 value for each baud rate the controller supports
+BAUD_CODES = {2400: 1, 9600: 2, 19200: 3, 38400: 4, 115200: 5}
+BAUD_COMMAND = 15
+BAUDING_BYTE = 0xAA     # Controllers set to autobaud lock onto the rate of this byte
+BAUD_SETTLE = 0.05      # Seconds for the controller to switch after a baud packet
+
+
+def build_packet(address, command, value):
+    checksum = (address + command + value) & 0x7F
+    return bytes([address, command, value, checksum])
+
+
+# Every drive packet for the default address, built once: packet_for() is then a
+# dict and a list lookup on the writer thread instead of building bytes
+_PACKETS = {command: [build_packet(SABERTOOTH_ADDRESS, command, value) for value in range(MAX_VALUE + 1)]
+            for command in (0, 1, 4, 5, 8, 9, 10, 11)}
+
+
+def packet_for(address, command, value):
+    if address == SABERTOOTH_ADDRESS:
+        table = _PACKETS.get(command)
+        if table is not None and 0 <= value <= MAX_VALUE:
+            return table[value]
+    return build_packet(address, command, value)
+
+
+def motor_slot(command):
+    # Commands 0/1 set motor 1, 4/5 set motor 2, 8/9 the mixed drive and 10/11
+    # the mixed turn. Each only ever needs its newest value, any other command
+    # gets a slot of its own.
+    if command in (0, 1):
+        return "motor1"
+    if command in (4, 5):
+        return "motor2"
+    if command in (8, 9):
+        return "drive"
+    if command in (10, 11):
+        return "turn"
+    return command
+
+
+# What the dead-man sends for each motor slot
+STOP_COMMANDS = {"motor1": 0, "motor2": 4, "drive": 8, "turn": 10}
+
+
+def _signed(value, forward, backward):
+    """(command, value) for a signed speed, clamped to the 0..127 range of a packet"""
+    value = round(value)
+    if value >= 0:
+        return forward, min(value, MAX_VALUE)
+    return backward, min(-value, MAX_VALUE)
+
+
+def negotiate_baud(ser, target, address=SABERTOOTH_ADDRESS):
+    """
+    Moves the controller and the port to `target` baud. The controller may be at
+    any supported rate (power-up default, or left at `target` by an earlier run),
+    so the baud packet is sent at each of them, the port's current rate first.
+    At the wrong rate the bytes arrive as garbage that fails the address or
+    checksum check and is ignored.
+    """
+    if target not in BAUD_CODES:
+        raise ValueError(f"Sabertooth doesn't support {target} baud, use one of {sorted(BAUD_CODES)}")
+    packet = build_packet(address, BAUD_COMMAND, BAUD_CODES[target])
+    original = ser.baudrate
+    for rate in [original] + [rate for rate in BAUD_CODES if rate != original]:
+        ser.baudrate = rate
+        ser.write(packet)
+        ser.flush()
+        time.sleep(BAUD_SETTLE)
+    ser.baudrate = target
+    ser.write(bytes([BAUDING_BYTE]))
+    ser.flush()
+    time.sleep(BAUD_SETTLE)
+
+WRITE_SECONDS = metrics.histogram("serial_write_seconds", "Time spent in ser.write per batch of motor packets")
+
+
+class _NoForeground(contextlib.nullcontext):
+    def observe_wait(self, seconds):
+        pass
+
+
+class SabertoothWriter(threading.Thread):
+    def __init__(self, ser, deadman_timeout, address=SABERTOOTH_ADDRESS, mode=DRIVE_MIXED, baud=None,
+                 foreground=None):
+        super().__init__(name="sabertooth-writer", daemon=True)
+        if mode not in (DRIVE_MIXED, DRIVE_INDEPENDENT):
+            raise ValueError(f"Unknown drive mode: {mode}")
+        self.ser = ser
+        self.deadman_timeout = deadman_timeout
+        self.address = address
+        self.mode = mode
+        self.target_baud = baud  # Negotiated when the thread starts, None keeps the port's rate
+        # Wraps every write and is told how long commands waited for the writer,
+        # executors.Scheduler.foreground holds back lower-priority work meanwhile
+        self._foreground = foreground or _NoForeground()
+        self._cond = threading.Condition()
+        self._pending = {}    # slot -> (address, command, value), newest value only
+        self._pending_since = 0.0  # perf_counter time the oldest pending entry was queued
+        self._last_sent = {}  # slot -> (address, command, value) currently on the wire
+        self._last_command_at = time.monotonic()
+        self._deadman_tripped = False
+        self._driving = False  # The last drive() asked for a nonzero throttle or steer
+        self._running = True
+        self._latency_total = 0.0
+        self.stats = {
+            "submitted": 0,
+            "duplicates": 0,      # Same value as already sent, never queued
+            "coalesced": 0,       # Overwritten by a newer value before being sent
+            "writes": 0,
+            "bytes_written": 0,
+            "write_errors": 0,
+            "deadman_stops": 0,
+            "write_latency_ms_last": 0.0,
+            "write_latency_ms_max": 0.0,
+            "baud": getattr(ser, "baudrate", None),
+            "baud_error": None,
+            # Commands wait until the link is at its new rate
+            "baud_negotiating": bool(baud) and baud != getattr(ser, "baudrate", None),
+        }
+
+    def submit(self, command, value, address=None):
+        entry = (self.address if address is None else address, command, value)
+        with self._cond:
+            self._touch()
+            if self._queue(motor_slot(command), entry):
+                self._cond.notify()
+
+    def drive(self, throttle, steer):
+        """
+        Signed throttle and steer (-127..127, positive = forward / right) for the
+        whole robot; motor 1 runs at throttle + steer and motor 2 at throttle - steer.
+        Both halves are queued under one lock so the writer never sends one without
+        the other. Returns how many packets were queued, 0 if nothing changed.
+        """
+        if self.mode == DRIVE_MIXED:
+            first = ("drive", (self.address, *_signed(throttle, 8, 9)))
+            second = ("turn", (self.address, *_signed(steer, 10, 11)))
+        else:
+            first = ("motor1", (self.address, *_signed(throttle + steer, 0, 1)))
+            second = ("motor2", (self.address, *_signed(throttle - steer, 4, 5)))
+        with self._cond:
+            self._touch()
+            self._driving = bool(throttle or steer)
+            queued = self._queue(*first) + self._queue(*second)
+            if queued:
+                self._cond.notify()
+        return queued
+
+    def moving(self):
+        """Whether the robot was last told to drive and the deadman hasn't stopped it since"""
+        return self._driving and not self._deadman_tripped
+
+    def _touch(self):
+        # Called with the lock held
+        self._last_command_at = time.monotonic()
+        self._deadman_tripped = False
+
+    def _queue(self, slot, entry):
+        # Called with the lock held, returns 1 if the entry was queued
+        self.stats["submitted"] += 1
+        if self._last_sent.get(slot) == entry:
+            # Already on the wire, anything still pending for this slot is obsolete
+            if self._pending.pop(slot, None) is not None:
+                self.stats["coalesced"] += 1
+            self.stats["duplicates"] += 1
+            return 0
+        if slot in self._pending:
+            self.stats["coalesced"] += 1
+        elif not self._pending:
+            self._pending_since = time.perf_counter()
+        self._pending[slot] = entry
+        return 1
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats["queue_depth"] = len(self._pending)
+            stats["dropped"] = stats["duplicates"] + stats["coalesced"]
+            stats["deadman_timeout"] = self.deadman_timeout
+            stats["deadman_tripped"] = self._deadman_tripped
+            stats["drive_mode"] = self.mode
+            stats["write_latency_ms_avg"] = round(self._latency_total / stats["writes"], 3) if stats["writes"] else 0.0
+        return stats
+
+    def _queue_deadman_stop(self):
+        # Called with the lock held
+        self._deadman_tripped = True
+        self._pending_since = time.perf_counter()
+        for slot, stop_command in STOP_COMMANDS.items():
+            sent = self._last_sent.get(slot)
+            if sent is not None and sent[2] != 0:
+                self._pending[slot] = (sent[0], stop_command, 0)
+        if self._pending:
+            self.stats["deadman_stops"] += 1
+            print(f"Dead-man stop: no drive command for {self.deadman_timeout}s")
+
+    def _next_batch(self):
+        with self._cond:
+            while self._running and not self._pending:
+                idle = time.monotonic() - self._last_command_at
+                if not self._deadman_tripped and idle >= self.deadman_timeout:
+                    self._queue_deadman_stop()
+                    continue
+                self._cond.wait(None if self._deadman_tripped else self.deadman_timeout - idle)
+            batch = list(self._pending.items())
+            self._pending.clear()
+            return batch, self._pending_since
+
+    def _negotiate_baud(self):
+        try:
+            negotiate_baud(self.ser, self.target_baud, self.address)
+        except Exception as e:
+            self.stats["baud_error"] = str(e)
+            print(f"Error changing Sabertooth baud rate to {self.target_baud}: {e}")
+        else:
+            print(f"Sabertooth link at {self.target_baud} baud")
+        self.stats["baud"] = getattr(self.ser, "baudrate", None)
+        self.stats["baud_negotiating"] = False
+
+    def run(self):
+        if self.stats["baud_negotiating"]:
+            self._negotiate_baud()
+        while self._running:
+            batch, queued_at = self._next_batch()
+            if not batch:
+                continue
+            # Both motors go out in a single write
+            packet = b"".join(packet_for(*entry) for _, entry in batch)
+            started = time.perf_counter()
+            self._foreground.observe_wait(started - queued_at)
+            try:
+                with self._foreground:
+                    self.ser.write(packet)
+            except Exception as e:
+                self.stats["write_errors"] += 1
+                print(f"Error sending command: {e}")
+                with self._cond:
+                    for slot, _ in batch:
+                        self._last_sent.pop(slot, None)  # Resend on the next command
+                continue
+            elapsed = time.perf_counter() - started
+            WRITE_SECONDS.observe(elapsed)
+            elapsed *= 1000.0
+            with self._cond:
+                self._last_sent.update(batch)
+                self._latency_total += elapsed
+                self.stats["writes"] += 1
+                self.stats["bytes_written"] += len(packet)
+                self.stats["write_latency_ms_last"] = round(elapsed, 3)
+                self.stats["write_latency_ms_max"] = round(max(self.stats["write_latency_ms_max"], elapsed), 3)
@@ -0,0 +1,239 @@
+# Operator recordings per camera, driven through the mediamtx Control API.
+# mediamtx.yml records every path around the clock in hour-long segments, so a
+# finding ends up somewhere inside an hour of video. "start" closes the running
+# segment and records in short RECORD_SEGMENT_SECONDS segments instead, "cut"
+# closes the current segment right away so what follows starts a file of its
+# own, and "stop" closes it and goes back to the idle setting. mediamtx closes a
+# segment when recording is switched off on its path, so every cut is a
+# record: false then record: true patch; the next segment starts at the next
+# keyframe. Once record: false went through, the record: true that follows is
+# tried a second time if it fails, so one lost request doesn't leave the camera
+# unrecorded, not even by the idle recording; if the action failed in between,
+# the setting the camera had is put back.
+#
+# The stretch between two of these actions is a span in the recordings index,
+# tagged with its start and end time, the IMU surface and wall at both ends and
+# every wall visited in between. Segments are matched to spans by the start time
+# mediamtx puts in their file names. A mark notes a moment and where the robot
+# was without cutting.
+#
+# Every call blocks on the API (MEDIAMTX_API_TIMEOUT at most), run them off the
+# event loop.
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from recordings_index import segment_start, EXTENSIONS, SPAN_SLACK
+
+
+class MediaMTXError(Exception):
+    pass
+
+
+class NotRecording(Exception):
+    pass
+
+
+class MediaMTXClient:
+    """The few Control API (v3) calls recording needs"""
+
+    def __init__(self, base, timeout=2.0):
+        self.base = base.rstrip("/")
+        self.timeout = timeout
+
+    def _call(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"} if data else {})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                content = response.read()
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode(errors="replace").strip()
+            raise MediaMTXError(f"mediamtx {method} {path}: {e.code} {detail}") from None
+        except (urllib.error.URLError, OSError) as e:
+            raise MediaMTXError(f"mediamtx API at {self.base} unreachable: {e}") from None
+        return json.loads(content) if content else None
+
+    def patch_path(self, name, **settings):
+        self._call("PATCH", f"/v3/config/paths/patch/{name}", settings)
+
+    def path_config(self, name):
+        return self._call("GET", f"/v3/config/paths/get/{name}")
+
+    def path_state(self, name):
+        """Whether the path has a publisher (ready) and its readers"""
+        return self._call("GET", f"/v3/paths/get/{name}")
+
+
+def span_segments(root, camera, started, ended=None):
+    """Segment files of a camera starting within a span, oldest first"""
+    directory = os.path.join(root, camera)
+    segments = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(EXTENSIONS):
+                    continue
+                at = segment_start(entry.name)
+                if at is not None and at >= started - SPAN_SLACK and (ended is None or at < ended):
+                    segments.append((at, f"{camera}/{entry.name}"))
+    except FileNotFoundError:
+        pass
+    return [path for _, path in sorted(segments)]
+
+
+class RecordingControl:
+    def __init__(self, api, index, tracker, cameras, segment_seconds=60, record_format="mpegts",
+                 record_when_idle=True, idle_segment="1h"):
+        self.api = api
+        self.index = index
+        self.tracker = tracker
+        self.cameras = tuple(cameras)
+        self.segment_seconds = segment_seconds
+        self.record_format = record_format
+        self.record_when_idle = record_when_idle
+        self.idle_segment = idle_segment
+        self._lock = threading.Lock()
+        self._active = {}   # camera -> {"span", "started", "location", "note"}
+        self._short = {"recordFormat": record_format, "recordSegmentDuration": f"{segment_seconds}s"}
+        self._idle = {"recordFormat": record_format, "recordSegmentDuration": idle_segment}
+        self.stats = {"starts": 0, "stops": 0, "cuts": 0, "marks": 0, "api_calls": 0, "api_errors": 0,
+                      "api_retries": 0, "last_api_ms": None}
+        # Spans the server was stopped in end now, or they would take every later segment
+        index.end_open_spans(time.time())
+
+    def _check(self, camera):
+        if camera not in self.cameras:
+            raise KeyError(camera)
+
+    def _pose(self):
+        return self.tracker.surface or "Transitioning", self.tracker.location
+
+    def _patch(self, camera, **settings):
+        started = time.perf_counter()
+        self.stats["api_calls"] += 1
+        try:
+            self.api.patch_path(camera, **settings)
+        except MediaMTXError:
+            self.stats["api_errors"] += 1
+            raise
+        finally:
+            self.stats["last_api_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    def _resume(self, camera, settings):
+        """record: true with `settings`, a second time if the first call fails"""
+        try:
+            self._patch(camera, record=True, **settings)
+        except MediaMTXError:
+            self.stats["api_retries"] += 1
+            self._patch(camera, record=True, **settings)
+
+    def _restore(self, camera, settings):
+        """_resume after an action failed with recording off; that failure is the one reported"""
+        try:
+            self._resume(camera, settings)
+        except MediaMTXError as e:
+            print(f"Recording on {camera} not restored: {e}")
+
+    def _open(self, camera, note=None):
+        surface, location = self._pose()
+        started = time.time()
+        span = self.index.open_span(camera, started, surface, location, note)
+        self._active[camera] = {"span": span, "started": started, "location": location, "note": note}
+        return {"id": span, "camera": camera, "started": started,
+                "start": {"surface": surface, "location": location}, "note": note}
+
+    def _close(self, camera, note=None):
+        active = self._active[camera]
+        surface, location = self._pose()
+        ended = time.time()
+        # Every wall visited, from the surface changes the tracker committed during the span
+        locations = [active["location"]]
+        for event in list(self.tracker.events):
+            if active["started"] <= event["at"] <= ended and event["location"] != locations[-1]:
+                locations.append(event["location"])
+        if location != locations[-1]:
+            locations.append(location)
+        self.index.close_span(active["span"], ended, surface, location, locations, note)
+        del self._active[camera]
+        return {"id": active["span"], "camera": camera, "started": active["started"], "ended": ended,
+                "end": {"surface": surface, "location": location}, "locations": locations,
+                "note": note if note is not None else active["note"]}
+
+    def start(self, camera, note=None):
+        """Starts short segments on a camera; a camera already recording keeps its span"""
+        self._check(camera)
+        with self._lock:
+            if camera in self._active:
+                active = self._active[camera]
+                return {"camera": camera, "already_recording": True,
+                        "span": {"id": active["span"], "camera": camera, "started": active["started"]}}
+            if self.record_when_idle:
+                self._patch(camera, record=False)   # Closes the idle segment
+            self._resume(camera, self._short)
+            self.stats["starts"] += 1
+            return {"camera": camera, "span": self._open(camera, note)}
+
+    def cut(self, camera, note=None):
+        """Closes the current segment now, `note` goes on the span that starts"""
+        self._check(camera)
+        with self._lock:
+            if camera not in self._active:
+                raise NotRecording(camera)
+            self._patch(camera, record=False)
+            try:
+                closed = self._close(camera)
+            except Exception:
+                self._restore(camera, self._short)   # The span is still open
+                raise
+            # Should this fail too the span stays closed and the camera isn't recording
+            self._resume(camera, self._short)
+            self.stats["cuts"] += 1
+            return {"camera": camera, "closed": closed, "span": self._open(camera, note)}
+
+    def mark(self, camera, note=None):
+        """Notes the moment and the robot's position in the current span"""
+        self._check(camera)
+        with self._lock:
+            if camera not in self._active:
+                raise NotRecording(camera)
+            surface, location = self._pose()
+            at = time.time()
+            self.index.add_mark(self._active[camera]["span"], at, surface, location, note)
+            self.stats["marks"] += 1
+            return {"camera": camera, "span": self._active[camera]["span"], "at": at,
+                    "surface": surface, "location": location, "note": note}
+
+    def stop(self, camera, note=None):
+        self._check(camera)
+        with self._lock:
+            if camera not in self._active:
+                raise NotRecording(camera)
+            self._patch(camera, record=False)
+            try:
+                closed = self._close(camera, note)
+            except Exception:
+                self._restore(camera, self._short)   # The span is still open
+                raise
+            if self.record_when_idle:
+                self._resume(camera, self._idle)
+            self.stats["stops"] += 1
+            return {"camera": camera, "closed": closed}
+
+    def get_state(self):
+        with self._lock:
+            active = {camera: dict(state) for camera, state in self._active.items()}
+        now = time.time()
+        return {
+            "cameras": {camera: ({"recording": True, "span": active[camera]["span"],
+                                  "seconds": round(now - active[camera]["started"], 1)}
+                                 if camera in active else {"recording": False})
+                        for camera in self.cameras},
+            "segment_seconds": self.segment_seconds,
+            "format": self.record_format,
+            **self.stats,
+        }
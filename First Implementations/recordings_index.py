@@ -0,0 +1,471 @@
+# Persistent index of the recordings directory, kept in SQLite.
+# mediamtx writes hourly segments to recordings/<path>/<start time>.ts; over an
+# inspection campaign that is thousands of files, too many to glob and stat on
+# every GET /recordings. A background thread keeps the index current instead:
+#   - a directory is re-listed only when its mtime changed (a file was added,
+#     renamed or removed in it)
+#   - files modified in the last ACTIVE_SECONDS are re-stat'ed every pass, since
+#     the segment mediamtx is writing grows without touching the directory
+# Listing is a keyset-paginated query on (modified, path), so a page costs the
+# same however large the archive gets.
+# The index also keeps the spans of operator recordings (recording_control.py):
+# a span is tagged with its start and end time and where the robot was, and a
+# segment belongs to the span its file name's start time falls in.
+# Bookmarks are moments flagged on a camera (frame_analysis.py); each is listed
+# with the segment that covers it and the offset into that segment.
+import base64
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+EXTENSIONS = (".mp4", ".avi", ".mkv", ".webm", ".ts")
+ACTIVE_SECONDS = 120.0
+MAX_PAGE = 500
+# mediamtx names a segment after its first frame, which comes a little after the
+# API call that started it; a segment starting this long before a span still counts
+SPAN_SLACK = 1.0
+
+# The span a recording's segment belongs to, for a query on recordings
+SPAN_OF = ("(SELECT spans.id FROM spans WHERE spans.camera = recordings.camera "
+           "AND recordings.started >= spans.started - ? AND recordings.started < COALESCE(spans.ended, 1e300) "
+           "ORDER BY spans.started DESC LIMIT 1)")
+SPAN_COLUMNS = ("id, camera, started, ended, start_surface, start_location, end_surface, end_location, "
+                "locations, note")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    path TEXT PRIMARY KEY,
+    camera TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    modified REAL NOT NULL,
+    started REAL,
+    duration REAL
+);
+CREATE INDEX IF NOT EXISTS recordings_modified ON recordings (modified DESC, path DESC);
+CREATE INDEX IF NOT EXISTS recordings_camera ON recordings (camera, modified DESC, path DESC);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pins (
+    path TEXT PRIMARY KEY,
+    pinned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS spans (
+    id INTEGER PRIMARY KEY,
+    camera TEXT NOT NULL,
+    started REAL NOT NULL,
+    ended REAL,
+    start_surface TEXT,
+    start_location TEXT,
+    end_surface TEXT,
+    end_location TEXT,
+    locations TEXT,
+    note TEXT
+);
+CREATE INDEX IF NOT EXISTS spans_camera ON spans (camera, started);
+CREATE TABLE IF NOT EXISTS marks (
+    id INTEGER PRIMARY KEY,
+    span INTEGER NOT NULL,
+    at REAL NOT NULL,
+    surface TEXT,
+    location TEXT,
+    note TEXT
+);
+CREATE INDEX IF NOT EXISTS marks_span ON marks (span, at);
+CREATE TABLE IF NOT EXISTS bookmarks (
+    id INTEGER PRIMARY KEY,
+    camera TEXT NOT NULL,
+    at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    score REAL,
+    source TEXT NOT NULL,
+    note TEXT
+);
+CREATE INDEX IF NOT EXISTS bookmarks_at ON bookmarks (at DESC);
+CREATE INDEX IF NOT EXISTS bookmarks_camera ON bookmarks (camera, at DESC);
+CREATE INDEX IF NOT EXISTS recordings_started ON recordings (camera, started);
+"""
+
+
+def segment_start(filename):
+    """Start time encoded by mediamtx's recordPath (%Y-%m-%d_%H-%M-%S-%f), or None"""
+    stem = os.path.splitext(filename)[0]
+    try:
+        return datetime.datetime.strptime(stem, "%Y-%m-%d_%H-%M-%S-%f").timestamp()
+    except ValueError:
+        return None
+
+
+def encode_cursor(modified, path):
+    return base64.urlsafe_b64encode(f"{modified!r}|{path}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        modified, path = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return float(modified), path
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+class RecordingsIndex(threading.Thread):
+    def __init__(self, root, db_path, scan_interval=5.0):
+        super().__init__(name="recordings-index", daemon=True)
+        self.root = root
+        self.scan_interval = scan_interval
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = True
+        self.stats = {"files": 0, "scans": 0, "directories_listed": 0, "last_scan_ms": None}
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def rescan(self):
+        """Ask the background thread for a pass now instead of at the next interval"""
+        self._wake.set()
+
+    def run(self):
+        while self._running:
+            try:
+                self.scan()
+            except Exception as e:
+                print(f"Recordings index scan failed: {e}")
+            self._wake.wait(self.scan_interval)
+            self._wake.clear()
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def _entry(self, rel_path, st):
+        parent = os.path.dirname(rel_path)
+        camera = os.path.basename(parent) if parent else ""
+        started = segment_start(os.path.basename(rel_path))
+        duration = round(st.st_mtime - started, 3) if started is not None and st.st_mtime >= started else None
+        return (rel_path, camera, st.st_size, st.st_mtime, started, duration)
+
+    def scan(self):
+        """One incremental pass over the recordings directory"""
+        begin = time.monotonic()
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            known_dirs = dict(self._db.execute("SELECT path, mtime FROM directories"))
+        # An unchanged directory has the same subdirectories as when it was last
+        # listed, they are taken from the index instead of listing it again
+        children = {}
+        for rel_dir in known_dirs:
+            if rel_dir != ".":
+                children.setdefault(self._parent(rel_dir), []).append(rel_dir)
+        seen_dirs = {}
+        changed_dirs = []
+        pending = [self.root]
+        while pending:
+            directory = pending.pop()
+            try:
+                mtime = os.stat(directory).st_mtime
+                rel_dir = self._relative(directory)
+                seen_dirs[rel_dir] = mtime
+                if known_dirs.get(rel_dir) == mtime:
+                    pending.extend(os.path.join(self.root, child) for child in children.get(rel_dir, ()))
+                    continue
+                with os.scandir(directory) as entries:
+                    files = []
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.name.lower().endswith(EXTENSIONS):
+                            files.append(entry)
+                changed_dirs.append((rel_dir, files))
+            except FileNotFoundError:
+                continue
+
+        upserts = []
+        removed_dirs = [path for path in known_dirs if path not in seen_dirs]
+        with self._lock:
+            for rel_dir, files in changed_dirs:
+                self.stats["directories_listed"] += 1
+                present = set()
+                for entry in files:
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    rel_path = self._relative(entry.path)
+                    present.add(rel_path)
+                    upserts.append(self._entry(rel_path, st))
+                indexed = self._files_in(rel_dir)
+                gone = [(path,) for path in indexed if path not in present]
+                self._db.executemany("DELETE FROM recordings WHERE path = ?", gone)
+
+            # Segments still being written grow without touching their directory
+            changed = {rel_dir for rel_dir, _ in changed_dirs}
+            cutoff = time.time() - ACTIVE_SECONDS
+            for (rel_path,) in self._db.execute(
+                    "SELECT path FROM recordings WHERE modified >= ?", (cutoff,)).fetchall():
+                if self._parent(rel_path) in changed:
+                    continue
+                try:
+                    upserts.append(self._entry(rel_path, os.stat(os.path.join(self.root, rel_path))))
+                except FileNotFoundError:
+                    self._db.execute("DELETE FROM recordings WHERE path = ?", (rel_path,))
+
+            for rel_dir in removed_dirs:
+                for path in self._files_in(rel_dir):
+                    self._db.execute("DELETE FROM recordings WHERE path = ?", (path,))
+                self._db.execute("DELETE FROM directories WHERE path = ?", (rel_dir,))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO recordings (path, camera, size, modified, started, duration) "
+                "VALUES (?, ?, ?, ?, ?, ?)", upserts)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO directories (path, mtime) VALUES (?, ?)",
+                [(rel_dir, seen_dirs[rel_dir]) for rel_dir, _ in changed_dirs])
+            self._db.commit()
+            self.stats["files"] = self._db.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+        self.stats["scans"] += 1
+        self.stats["last_scan_ms"] = round((time.monotonic() - begin) * 1000, 1)
+
+    @staticmethod
+    def _parent(rel_path):
+        parent = os.path.dirname(rel_path)
+        return parent or "."
+
+    def _files_in(self, rel_dir):
+        # Files directly inside rel_dir ("." is the recordings root)
+        if rel_dir == ".":
+            rows = self._db.execute("SELECT path FROM recordings WHERE instr(path, '/') = 0")
+        else:
+            prefix = rel_dir + "/"
+            rows = self._db.execute(
+                "SELECT path FROM recordings WHERE path >= ? AND path < ? AND instr(substr(path, ?), '/') = 0",
+                (prefix, rel_dir + "0", len(prefix) + 1))
+        return [path for (path,) in rows]
+
+    def forget(self, rel_path):
+        """Drop a file the server deleted itself, without waiting for the next scan"""
+        with self._lock:
+            self._db.execute("DELETE FROM recordings WHERE path = ?", (rel_path,))
+            self._db.execute("DELETE FROM pins WHERE path = ?", (rel_path,))
+            self._db.commit()
+
+    def pin(self, rel_path, pinned=True):
+        """Pinned recordings are never deleted by the retention engine"""
+        with self._lock:
+            if not self._db.execute("SELECT 1 FROM recordings WHERE path = ?", (rel_path,)).fetchone():
+                raise KeyError(rel_path)
+            if pinned:
+                self._db.execute("INSERT OR IGNORE INTO pins (path, pinned_at) VALUES (?, ?)", (rel_path, time.time()))
+            else:
+                self._db.execute("DELETE FROM pins WHERE path = ?", (rel_path,))
+            self._db.commit()
+
+    def usage(self):
+        """(recordings, total bytes, pinned bytes)"""
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM recordings").fetchone()
+            pinned = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM recordings WHERE path IN (SELECT path FROM pins)").fetchone()[0]
+        return count, total, pinned
+
+    def oldest(self, limit, modified_before, after=None):
+        """
+        Unpinned recordings last modified before `modified_before`, oldest first,
+        as (path, size, modified). Pass the last row as `after` for the next batch.
+        """
+        sql = ("SELECT path, size, modified FROM recordings "
+               "WHERE modified < ? AND path NOT IN (SELECT path FROM pins)")
+        args = [modified_before]
+        if after is not None:
+            sql += " AND (modified > ? OR (modified = ? AND path > ?))"
+            args.extend((after[2], after[2], after[0]))
+        sql += " ORDER BY modified, path LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def query(self, limit=50, cursor=None, camera=None, start=None, end=None, location=None):
+        """
+        Newest first. start/end are epoch seconds on the modification time,
+        location keeps the segments of spans that visited it.
+        Returns (list of recordings, cursor for the next page or None).
+        """
+        limit = max(1, min(limit, MAX_PAGE))
+        where, args = [], []
+        if camera:
+            where.append("camera = ?")
+            args.append(camera)
+        if start is not None:
+            where.append("modified >= ?")
+            args.append(start)
+        if end is not None:
+            where.append("modified <= ?")
+            args.append(end)
+        if location:
+            where.append(f"{SPAN_OF} IN (SELECT id FROM spans WHERE ',' || locations || ',' LIKE ?)")
+            args.extend((SPAN_SLACK, f"%,{location},%"))
+        if cursor:
+            modified, path = decode_cursor(cursor)
+            where.append("(modified < ? OR (modified = ? AND path < ?))")
+            args.extend((modified, modified, path))
+        sql = ("SELECT path, camera, size, modified, started, duration, "
+               f"EXISTS (SELECT 1 FROM pins WHERE pins.path = recordings.path), {SPAN_OF} FROM recordings")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY modified DESC, path DESC LIMIT ?"
+        args = [SPAN_SLACK] + args + [limit + 1]
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+            span_ids = sorted({row[7] for row in rows if row[7] is not None})
+            spans = {span["id"]: span for span in self._spans_where(
+                f"id IN ({','.join('?' * len(span_ids))})", span_ids)} if span_ids else {}
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][3], rows[-1][0])
+        recordings = [{
+            "filename": os.path.basename(path),
+            "path": path,
+            "camera": camera,
+            "size": size,
+            "size_mb": round(size / (1024 * 1024), 2),
+            "modified": datetime.datetime.fromtimestamp(modified).isoformat(),
+            "mtime": modified,
+            "started": datetime.datetime.fromtimestamp(started).isoformat() if started is not None else None,
+            "duration": duration,
+            "pinned": bool(pinned),
+            "span": spans.get(span),
+        } for path, camera, size, modified, started, duration, pinned, span in rows]
+        return recordings, next_cursor
+
+    def open_span(self, camera, started, surface, location, note=None):
+        """Starts a span of an operator recording, returns its id"""
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO spans (camera, started, start_surface, start_location, locations, note) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (camera, started, surface, location, location, note))
+            self._db.commit()
+        return cursor.lastrowid
+
+    def close_span(self, span_id, ended, surface, location, locations, note=None):
+        """Ends a span; locations are all the places visited during it, in order"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE spans SET ended = ?, end_surface = ?, end_location = ?, locations = ?, "
+                "note = COALESCE(?, note) WHERE id = ?",
+                (ended, surface, location, ",".join(locations), note, span_id))
+            self._db.commit()
+
+    def end_open_spans(self, ended):
+        with self._lock:
+            self._db.execute("UPDATE spans SET ended = ? WHERE ended IS NULL", (ended,))
+            self._db.commit()
+
+    def add_mark(self, span_id, at, surface, location, note=None):
+        with self._lock:
+            cursor = self._db.execute("INSERT INTO marks (span, at, surface, location, note) VALUES (?, ?, ?, ?, ?)",
+                                      (span_id, at, surface, location, note))
+            self._db.commit()
+        return cursor.lastrowid
+
+    def spans(self, limit=50, camera=None, start=None, end=None, location=None):
+        """
+        Spans newest first with their marks and segments. start/end are epoch
+        seconds; a span matches when it overlaps them.
+        """
+        limit = max(1, min(limit, MAX_PAGE))
+        where, args = [], []
+        if camera:
+            where.append("camera = ?")
+            args.append(camera)
+        if start is not None:
+            where.append("COALESCE(ended, 1e300) >= ?")
+            args.append(start)
+        if end is not None:
+            where.append("started <= ?")
+            args.append(end)
+        if location:
+            where.append("',' || locations || ',' LIKE ?")
+            args.append(f"%,{location},%")
+        with self._lock:
+            spans = self._spans_where(" AND ".join(where) or "1", args, limit)
+            for span in spans:
+                span["marks"] = [{"at": at, "surface": surface, "location": location, "note": note}
+                                 for at, surface, location, note in self._db.execute(
+                                     "SELECT at, surface, location, note FROM marks WHERE span = ? ORDER BY at",
+                                     (span["id"],))]
+                span["segments"] = [{"path": path, "size": size, "started": started, "duration": duration}
+                                    for path, size, started, duration in self._db.execute(
+                                        "SELECT path, size, started, duration FROM recordings "
+                                        "WHERE camera = ? AND started >= ? AND started < ? ORDER BY started",
+                                        (span["camera"], span["started"] - SPAN_SLACK,
+                                         span["ended"] if span["ended"] is not None else 1e300))]
+        return spans
+
+    def add_bookmark(self, camera, at, kind, score=None, source="analysis", note=None):
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO bookmarks (camera, at, kind, score, source, note) VALUES (?, ?, ?, ?, ?, ?)",
+                (camera, at, kind, score, source, note))
+            self._db.commit()
+        return cursor.lastrowid
+
+    def bookmarks(self, limit=50, camera=None, start=None, end=None, kind=None):
+        """
+        Bookmarks newest first, each with the segment covering it (path and
+        offset in seconds) when one is indexed. start/end are epoch seconds.
+        """
+        limit = max(1, min(limit, MAX_PAGE))
+        where, args = [], []
+        for column, value in (("camera", camera), ("kind", kind)):
+            if value:
+                where.append(f"bookmarks.{column} = ?")
+                args.append(value)
+        if start is not None:
+            where.append("at >= ?")
+            args.append(start)
+        if end is not None:
+            where.append("at <= ?")
+            args.append(end)
+        sql = ("SELECT id, camera, at, kind, score, source, note, "
+               "(SELECT path || '|' || started FROM recordings WHERE recordings.camera = bookmarks.camera "
+               "AND started <= bookmarks.at AND modified >= bookmarks.at ORDER BY started DESC LIMIT 1) FROM bookmarks")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY at DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        bookmarks = []
+        for bookmark_id, camera, at, kind, score, source, note, segment in rows:
+            path = offset = None
+            if segment:
+                path, started = segment.rsplit("|", 1)
+                offset = round(at - float(started), 3)
+            bookmarks.append({"id": bookmark_id, "camera": camera, "at": at, "kind": kind, "score": score,
+                              "source": source, "note": note, "segment": path, "offset": offset})
+        return bookmarks
+
+    def _spans_where(self, condition, args, limit=-1):
+        rows = self._db.execute(f"SELECT {SPAN_COLUMNS} FROM spans WHERE {condition} "
+                                "ORDER BY started DESC LIMIT ?", (*args, limit)).fetchall()
+        return [{
+            "id": span_id,
+            "camera": camera,
+            "started": started,
+            "ended": ended,
+            "start": {"surface": start_surface, "location": start_location},
+            "end": {"surface": end_surface, "location": end_location} if ended is not None else None,
+            "locations": locations.split(",") if locations else [],
+            "note": note,
+        } for span_id, camera, started, ended, start_surface, start_location, end_surface, end_location,
+              locations, note in rows]
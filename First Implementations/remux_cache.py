@@ -0,0 +1,146 @@
+# On-demand MPEG-TS -> MP4 remux of recordings, with an on-disk LRU cache.
+# mediamtx records MPEG-TS, which laptops can't scrub through. The first request
+# for a recording's MP4 starts a stream-copy remux (no re-encode, faststart so
+# playback starts before the download finishes) on a background worker, later
+# requests get the cached file.
+#   - cache entries are keyed by source path, mtime and size, so a segment that
+#     was still growing gets remuxed again once it changed
+#   - concurrent requests for the same file share one remux
+#   - the cache is bounded by total size, least recently used files go first
+import collections
+import hashlib
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RETRY_AFTER = 60.0   # seconds before a failed remux of an unchanged file is tried again
+
+
+def cache_key(rel_path, mtime, size):
+    return hashlib.sha1(f"{rel_path}\0{mtime!r}\0{size}".encode()).hexdigest()
+
+
+class RemuxCache:
+    def __init__(self, source_dir, cache_dir, max_bytes, workers=1, ffmpeg="ffmpeg", timeout=600):
+        self.source_dir = source_dir
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ffmpeg = ffmpeg
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="remux")
+        self._lock = threading.Lock()
+        self._pending = set()                     # keys being remuxed
+        self._failed = {}                         # key -> (error message, monotonic time)
+        self._entries = collections.OrderedDict()  # key -> size, least recently used first
+        self.stats = {"hits": 0, "misses": 0, "remuxed": 0, "failed": 0, "evicted": 0, "bytes": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        # Rebuild the LRU order from the files left by the previous run
+        found = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".part"):
+                os.remove(path)
+            elif name.endswith(".mp4"):
+                st = os.stat(path)
+                found.append((st.st_atime, name[:-4], st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+        self.stats["bytes"] = sum(self._entries.values())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mp4")
+
+    def _key_for(self, rel_path):
+        st = os.stat(os.path.join(self.source_dir, rel_path))
+        return cache_key(rel_path, st.st_mtime, st.st_size)
+
+    def status(self, rel_path, mtime, size):
+        """"ready", "pending", "failed" or None, without touching the disk"""
+        key = cache_key(rel_path, mtime, size)
+        with self._lock:
+            if key in self._entries:
+                return "ready"
+            if key in self._pending:
+                return "pending"
+            if key in self._failed:
+                return "failed"
+        return None
+
+    def get(self, rel_path):
+        """
+        Path of the cached MP4, or None after making sure a remux is running.
+        Raises FileNotFoundError for a missing recording and RuntimeError if
+        the remux of this exact file failed less than RETRY_AFTER seconds ago.
+        """
+        key = self._key_for(rel_path)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                path = self._path(key)
+                try:
+                    os.utime(path)  # Keeps the LRU order across restarts
+                    return path
+                except FileNotFoundError:
+                    self.stats["bytes"] -= self._entries.pop(key)
+            if key in self._failed:
+                message, failed_at = self._failed[key]
+                if time.monotonic() - failed_at < RETRY_AFTER:
+                    raise RuntimeError(message)
+                del self._failed[key]
+            if key not in self._pending:
+                self.stats["misses"] += 1
+                self._pending.add(key)
+                self._pool.submit(self._remux, rel_path, key)
+        return None
+
+    def _remux(self, rel_path, key):
+        source = os.path.join(self.source_dir, rel_path)
+        target = self._path(key)
+        temp = target + ".part"
+        started = time.monotonic()
+        try:
+            result = subprocess.run(
+                [self.ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", source,
+                 "-map", "0:v?", "-map", "0:a?", "-c", "copy", "-movflags", "+faststart",
+                 "-f", "mp4", temp],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=self.timeout)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.decode(errors="replace").strip()[-500:] or
+                                   f"ffmpeg exited with {result.returncode}")
+            os.replace(temp, target)
+            size = os.path.getsize(target)
+            with self._lock:
+                self._entries[key] = size
+                self.stats["bytes"] += size
+                self.stats["remuxed"] += 1
+                self._evict(keep=key)
+            print(f"Remuxed {rel_path} to MP4 in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            if os.path.exists(temp):
+                os.remove(temp)
+            with self._lock:
+                self._failed[key] = (f"Remux of {rel_path} failed: {e}", time.monotonic())
+                self.stats["failed"] += 1
+            print(f"Remux of {rel_path} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def _evict(self, keep):
+        # Called with the lock held
+        while self.stats["bytes"] > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self.stats["bytes"] -= self._entries.pop(key)
+            self.stats["evicted"] += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
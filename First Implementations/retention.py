@@ -0,0 +1,146 @@
+# Background retention for the recordings directory.
+# Two 10 Mbit/s streams fill an SD card at about 9 GB an hour, so instead of a
+# cleanup someone has to remember to trigger, a thread checks every `interval`
+# seconds and deletes the oldest segments until:
+#   - the recordings use at most `quota_bytes`
+#   - the filesystem has at least `min_free_bytes` free
+#   - nothing is older than `max_age_days` (0 = no age limit)
+# Pinned recordings and anything modified in the last `protect_seconds` (the
+# segment mediamtx is writing) are never touched. Deletes run in batches with
+# a pause in between so the SD card keeps up with the live recording.
+import collections
+import os
+import shutil
+import threading
+import time
+
+
+class RetentionEngine(threading.Thread):
+    def __init__(self, index, quota_bytes, min_free_bytes, max_age_days=0, interval=60.0,
+                 batch_size=10, batch_pause=0.5, protect_seconds=120.0, history=200):
+        super().__init__(name="retention", daemon=True)
+        self.index = index
+        self.quota_bytes = quota_bytes
+        self.min_free_bytes = min_free_bytes
+        self.max_age_days = max_age_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.protect_seconds = protect_seconds
+        self.decisions = collections.deque(maxlen=history)  # newest last
+        self.stats = {"runs": 0, "deleted": 0, "bytes_reclaimed": 0, "errors": 0, "last_run": None}
+        self._pass_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._manual = False
+        self._running = True
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def trigger(self):
+        """Runs a pass on the retention thread now instead of at the next interval"""
+        self._manual = True
+        self._wake.set()
+
+    def run(self):
+        while self._running:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            trigger, self._manual = "manual" if self._manual else "scheduled", False
+            try:
+                self.run_once(trigger)
+            except Exception as e:
+                print(f"Retention pass failed: {e}")
+
+    def status(self):
+        count, total, pinned = self.index.usage()
+        disk = shutil.disk_usage(self.index.root)
+        return {
+            **self.stats,
+            "recordings": count,
+            "recordings_bytes": total,
+            "pinned_bytes": pinned,
+            "disk_free_bytes": disk.free,
+            "quota_bytes": self.quota_bytes,
+            "min_free_bytes": self.min_free_bytes,
+            "max_age_days": self.max_age_days,
+        }
+
+    def recent_decisions(self, limit=50):
+        decisions = list(self.decisions)
+        return decisions[max(0, len(decisions) - limit):][::-1]
+
+    def run_once(self, trigger="manual"):
+        """One retention pass, returns a summary of what it deleted"""
+        with self._pass_lock:
+            started = time.time()
+            _, total, _ = self.index.usage()
+            free = shutil.disk_usage(self.index.root).free
+            over_quota = max(0, total - self.quota_bytes) if self.quota_bytes else 0
+            under_floor = max(0, self.min_free_bytes - free) if self.min_free_bytes else 0
+            needed = max(over_quota, under_floor)
+            age_cutoff = started - self.max_age_days * 86400 if self.max_age_days else None
+
+            deleted, reclaimed, last = 0, 0, None
+            protect_before = started - self.protect_seconds
+            done = False
+            while self._running and not done:
+                batch = self.index.oldest(self.batch_size, protect_before, last)
+                if not batch:
+                    break
+                for path, size, modified in batch:
+                    last = (path, size, modified)
+                    if reclaimed < needed:
+                        reason = "quota" if over_quota >= under_floor else "free_space"
+                    elif age_cutoff is not None and modified < age_cutoff:
+                        reason = "age"
+                    else:
+                        done = True  # Oldest first, so nothing further along qualifies either
+                        break
+                    if self._delete(path, size, modified, reason, trigger):
+                        deleted += 1
+                        reclaimed += size
+                if not done and len(batch) == self.batch_size:
+                    time.sleep(self.batch_pause)
+
+            if needed and reclaimed < needed:
+                self._record(None, 0, None, "short", trigger,
+                             f"Needed {needed} bytes, only {reclaimed} deletable "
+                             f"(the rest is pinned or still being written)")
+            self.stats["runs"] += 1
+            self.stats["deleted"] += deleted
+            self.stats["bytes_reclaimed"] += reclaimed
+            self.stats["last_run"] = {
+                "at": started,
+                "trigger": trigger,
+                "needed_bytes": needed,
+                "deleted": deleted,
+                "bytes_reclaimed": reclaimed,
+                "seconds": round(time.time() - started, 2),
+            }
+            return self.stats["last_run"]
+
+    def _delete(self, path, size, modified, reason, trigger):
+        try:
+            os.remove(os.path.join(self.index.root, path))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.stats["errors"] += 1
+            self._record(path, 0, modified, "error", trigger, str(e))
+            return False
+        self.index.forget(path)
+        self._record(path, size, modified, reason, trigger)
+        return True
+
+    def _record(self, path, size, modified, reason, trigger, detail=None):
+        self.decisions.append({
+            "at": time.time(),
+            "path": path,
+            "bytes": size,
+            "modified": modified,
+            "reason": reason,
+            "trigger": trigger,
+            "detail": detail,
+        })
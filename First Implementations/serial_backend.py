@@ -0,0 +1,40 @@
+# Pluggable serial backends, picked in config.py (MOTOR_BACKEND / IMU_BACKEND)
+#   "serial" - pyserial. The port may be a device (/dev/ttyAMA0), a pty made by
+#              hw_emulator.py, or any pyserial URL (loop://, socket://host:port)
+#   "null"   - discards writes and never produces data, for running the server
+#              on a machine without the hardware
+import time
+import serial
+
+
+class NullSerial:
+    def __init__(self, port="null", baudrate=9600, timeout=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.in_waiting = 0
+        self.is_open = True
+
+    def write(self, data):
+        return len(data)
+
+    def read(self, size=1):
+        time.sleep(self.timeout or 0)
+        return b""
+
+    def reset_input_buffer(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+def open_serial(backend, port, baud, timeout):
+    if backend == "null":
+        return NullSerial(port, baud, timeout)
+    if backend == "serial":
+        return serial.serial_for_url(port, baud, timeout=timeout)
+    raise ValueError(f"Unknown serial backend: {backend}")
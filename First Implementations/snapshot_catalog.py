@@ -0,0 +1,212 @@
+# Catalog of inspection snapshots, kept in SQLite beside the images.
+# Every image the server saves gets a row with where the robot was when the
+# frame was grabbed: wall label and surface, roll/pitch/yaw, the accelerometer
+# vector, the camera and its zoom. A small thumbnail is kept in the catalog
+# too, so a page of results is one query and no image files are opened.
+#
+# Queries run on indexes: time, wall label + time, camera + time, and wall
+# label + orientation bins (ORIENTATION_BIN degrees of pitch and roll), so
+# "Wall B, camera pitched up 30-60°" reads only the matching rows however many
+# images the campaign has. Pages are keyset-paginated on (taken, id).
+import base64
+import math
+import os
+import sqlite3
+import threading
+
+ORIENTATION_BIN = 15.0   # degrees per pitch/roll/yaw bin
+MAX_PAGE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    camera TEXT NOT NULL,
+    taken REAL NOT NULL,
+    location TEXT,
+    surface TEXT,
+    roll REAL,
+    pitch REAL,
+    yaw REAL,
+    roll_bin INTEGER,
+    pitch_bin INTEGER,
+    yaw_bin INTEGER,
+    ax REAL,
+    ay REAL,
+    az REAL,
+    zoom INTEGER,
+    width INTEGER,
+    height INTEGER,
+    size INTEGER,
+    preview TEXT,
+    job TEXT
+);
+CREATE INDEX IF NOT EXISTS snapshots_taken ON snapshots (taken DESC, id DESC);
+CREATE INDEX IF NOT EXISTS snapshots_location ON snapshots (location, taken DESC, id DESC);
+CREATE INDEX IF NOT EXISTS snapshots_camera ON snapshots (camera, taken DESC, id DESC);
+CREATE INDEX IF NOT EXISTS snapshots_orientation ON snapshots (location, pitch_bin, roll_bin, taken DESC);
+CREATE TABLE IF NOT EXISTS thumbnails (
+    id INTEGER PRIMARY KEY,
+    jpeg BLOB NOT NULL
+);
+"""
+
+# A path cataloged again keeps its id, and with it its thumbnail row
+UPSERT = ("INSERT INTO snapshots (path, camera, taken, location, surface, roll, pitch, yaw, roll_bin, pitch_bin, "
+          "yaw_bin, ax, ay, az, zoom, width, height, size, preview, job) "
+          "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET "
+          + ", ".join(f"{column} = excluded.{column}" for column in (
+              "camera", "taken", "location", "surface", "roll", "pitch", "yaw", "roll_bin", "pitch_bin",
+              "yaw_bin", "ax", "ay", "az", "zoom", "width", "height", "size", "preview", "job")))
+
+COLUMNS = ("id", "path", "camera", "taken", "location", "surface", "roll", "pitch", "yaw",
+           "ax", "ay", "az", "zoom", "width", "height", "size", "preview", "job")
+
+
+def orientation_bin(angle):
+    return None if angle is None else math.floor(angle / ORIENTATION_BIN)
+
+
+def encode_cursor(taken, row_id):
+    return base64.urlsafe_b64encode(f"{taken!r}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        taken, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return float(taken), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+class SnapshotCatalog:
+    def __init__(self, db_path, root):
+        self.root = root
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # A crash may lose the last few rows, never corrupt the catalog; an fsync per
+        # burst frame would stall the SD card
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        # Thumbnails of rows INSERT OR REPLACE gave a new id before
+        self._db.execute("DELETE FROM thumbnails WHERE id NOT IN (SELECT id FROM snapshots)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.stats = {"added": 0, "queries": 0}
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def add(self, path, camera, taken, pose, width=None, height=None, size=None, thumbnail=None,
+            preview=None, job=None):
+        """
+        Catalogs a saved image. pose has location, surface, roll, pitch, yaw,
+        accel (x, y, z in g) and zoom, any of them may be None.
+        """
+        roll, pitch, yaw = pose.get("roll"), pose.get("pitch"), pose.get("yaw")
+        accel = pose.get("accel") or (None, None, None)
+        row = (self._relative(path), camera, taken, pose.get("location"), pose.get("surface"),
+               roll, pitch, yaw, orientation_bin(roll), orientation_bin(pitch), orientation_bin(yaw),
+               accel[0], accel[1], accel[2], pose.get("zoom"), width, height, size,
+               self._relative(preview) if preview else None, job)
+        with self._lock:
+            self._db.execute(UPSERT, row)
+            # lastrowid isn't set by an update, and RETURNING needs a newer SQLite than Raspberry Pi OS has
+            row_id = self._db.execute("SELECT id FROM snapshots WHERE path = ?", (row[0],)).fetchone()[0]
+            if thumbnail is not None:
+                self._db.execute("INSERT OR REPLACE INTO thumbnails (id, jpeg) VALUES (?, ?)", (row_id, thumbnail))
+            else:
+                self._db.execute("DELETE FROM thumbnails WHERE id = ?", (row_id,))   # Of the image replaced
+            self._db.commit()
+        self.stats["added"] += 1
+        return row_id
+
+    def get(self, row_id):
+        with self._lock:
+            row = self._db.execute(f"SELECT {', '.join(COLUMNS)} FROM snapshots WHERE id = ?",
+                                   (row_id,)).fetchone()
+        if row is None:
+            raise KeyError(row_id)
+        return self._item(row)
+
+    def file_path(self, row_id):
+        return os.path.join(self.root, self.get(row_id)["path"])
+
+    def thumbnail(self, row_id):
+        with self._lock:
+            row = self._db.execute("SELECT jpeg FROM thumbnails WHERE id = ?", (row_id,)).fetchone()
+        if row is None:
+            raise KeyError(row_id)
+        return row[0]
+
+    def query(self, limit=50, cursor=None, camera=None, location=None, surface=None, start=None, end=None,
+              roll=None, pitch=None, yaw=None, zoom=None):
+        """
+        Newest first. start/end are epoch seconds; roll, pitch and yaw are
+        (min, max) in degrees, a yaw range with min > max wraps through ±180;
+        zoom is (min, max). Returns (list of snapshots, cursor for the next page or None).
+        """
+        limit = max(1, min(limit, MAX_PAGE))
+        where, args = [], []
+        for column, value in (("camera", camera), ("location", location), ("surface", surface)):
+            if value:
+                where.append(f"{column} = ?")
+                args.append(value)
+        if start is not None:
+            where.append("taken >= ?")
+            args.append(start)
+        if end is not None:
+            where.append("taken <= ?")
+            args.append(end)
+        for column, bounds in (("roll", roll), ("pitch", pitch)):
+            if bounds is not None:
+                low, high = bounds
+                # The bins let SQLite use the orientation index, the angles make it exact
+                where.append(f"{column}_bin BETWEEN ? AND ? AND {column} BETWEEN ? AND ?")
+                args.extend((orientation_bin(low), orientation_bin(high), low, high))
+        if yaw is not None:
+            low, high = yaw
+            if low <= high:
+                where.append("yaw BETWEEN ? AND ?")
+            else:
+                where.append("(yaw >= ? OR yaw <= ?)")
+            args.extend((low, high))
+        if zoom is not None:
+            where.append("zoom BETWEEN ? AND ?")
+            args.extend(zoom)
+        if cursor:
+            taken, row_id = decode_cursor(cursor)
+            where.append("(taken < ? OR (taken = ? AND id < ?))")
+            args.extend((taken, taken, row_id))
+        sql = f"SELECT {', '.join(COLUMNS)} FROM snapshots"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY taken DESC, id DESC LIMIT ?"
+        args.append(limit + 1)
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        self.stats["queries"] += 1
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][3], rows[-1][0])
+        return [self._item(row) for row in rows], next_cursor
+
+    def summary(self):
+        """Image count per wall label, and the catalog's time range"""
+        with self._lock:
+            locations = dict(self._db.execute(
+                "SELECT COALESCE(location, ''), COUNT(*) FROM snapshots GROUP BY location"))
+            count, first, last = self._db.execute("SELECT COUNT(*), MIN(taken), MAX(taken) FROM snapshots").fetchone()
+        return {"images": count, "first": first, "last": last, "locations": locations, **self.stats}
+
+    @staticmethod
+    def _item(row):
+        item = dict(zip(COLUMNS, row))
+        ax, ay, az = item.pop("ax"), item.pop("ay"), item.pop("az")
+        item["accel"] = None if ax is None else [ax, ay, az]
+        return item
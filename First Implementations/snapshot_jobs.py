@@ -0,0 +1,221 @@
+# Snapshot and burst capture jobs.
+# Frames come from the always-warm grabbers (frame_grabber.py). JPEG encoding,
+# preview scaling and SD-card writes run on a small worker pool, never on the
+# event loop. Each job gets an id the UI can poll.
+#
+# Backpressure: a frame holds one of `max_pending` slots from the moment it is
+# captured until it is on disk, so a burst that outruns the encoder waits for a
+# slot (its interval stretches) instead of piling frames up in memory. At most
+# `max_bursts` capture loops run at once, further requests are refused.
+#
+# With a catalog (snapshot_catalog.py), every saved image is cataloged with a
+# thumbnail and the robot's pose, which `pose(camera)` returns when the frame is
+# taken from the grabber.
+import collections
+import datetime
+import itertools
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+import metrics
+
+MAX_JOBS_KEPT = 200          # finished jobs remembered for polling
+SLOT_TIMEOUT = 5.0           # seconds a burst waits for the encoder before giving up
+THUMBNAIL_QUALITY = 70
+NEW_FRAME_POLL = 1.0 / 60    # how often "every frame" bursts look for a new frame
+
+ENCODE_SECONDS = metrics.histogram("snapshot_encode_seconds", "JPEG encode (and preview resize) per frame")
+WRITE_SECONDS = metrics.histogram("snapshot_write_seconds", "Writing one snapshot JPEG to disk")
+
+
+class SnapshotBusy(Exception):
+    pass
+
+
+def encode_jpeg(frame, quality, width=None):
+    started = time.perf_counter()
+    if width and frame.shape[1] > width:
+        height = round(frame.shape[0] * width / frame.shape[1])
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("Failed to encode frame")
+    ENCODE_SECONDS.observe(time.perf_counter() - started)
+    return jpeg.tobytes()
+
+
+class SnapshotJobs:
+    def __init__(self, grabbers, output_dir="inspection", workers=2, max_pending=8,
+                 max_bursts=2, max_burst_frames=300, pool=None, catalog=None, pose=None, thumbnail_width=160):
+        self.grabbers = grabbers
+        self.catalog = catalog
+        self.pose = pose or (lambda camera: {})
+        self.thumbnail_width = thumbnail_width
+        self.output_dir = output_dir
+        self.max_burst_frames = max_burst_frames
+        # Anything with submit(fn, *args) -> Future, such as an executors.Lane
+        self.pool = pool or ThreadPoolExecutor(workers, thread_name_prefix="snapshot-encode")
+        self._capture_pool = ThreadPoolExecutor(max_bursts, thread_name_prefix="snapshot-capture")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._bursts = threading.BoundedSemaphore(max_bursts)
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else dict(job, files=list(job["files"]), previews=list(job["previews"]))
+
+    def list_jobs(self, limit=20):
+        with self._lock:
+            ids = list(self._jobs)[-limit:]
+        return [self.get_job(job_id) for job_id in reversed(ids)]
+
+    def submit(self, camera, count=1, interval=0.0, duration=None, quality=90, preview_width=None):
+        """
+        Starts a capture job and returns its id right away.
+        count frames `interval` seconds apart, or with duration set, frames for
+        `duration` seconds (interval 0 = every frame the camera delivers).
+        Raises SnapshotBusy when max_bursts jobs are already capturing.
+        """
+        if camera not in self.grabbers:
+            raise KeyError(camera)
+        if not self._bursts.acquire(blocking=False):
+            raise SnapshotBusy("Too many capture jobs running, try again shortly")
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "camera": camera,
+            "status": "capturing",
+            "requested": None if duration else max(1, min(count, self.max_burst_frames)),
+            "interval": max(0.0, interval),
+            "duration": duration,
+            "quality": max(1, min(100, quality)),
+            "preview_width": preview_width,
+            "captured": 0,
+            "saved": 0,
+            "files": [],
+            "previews": [],
+            "errors": [],
+            "created": time.time(),
+            "finished": None,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > MAX_JOBS_KEPT:
+                self._jobs.popitem(last=False)
+        self._capture_pool.submit(self._capture, job)
+        return job["id"]
+
+    def encode_now(self, camera, quality=90, save=True):
+        """Future with (jpeg bytes, saved path or None) for the current frame"""
+        frame, grabbed_at = self.grabbers[camera].latest_frame()
+        if frame is None:
+            return None
+        return self.pool.submit(self._encode_single, camera, frame, grabbed_at, quality, save, self.pose(camera))
+
+    def _encode_single(self, camera, frame, grabbed_at, quality, save, pose):
+        jpeg = encode_jpeg(frame, quality)
+        path = None
+        if save:
+            path = self._write(camera, jpeg)
+            print(f"Snapshot saved: {path}")
+            try:
+                self._catalog_add(camera, path, frame, grabbed_at, pose, len(jpeg))
+            except Exception as e:
+                print(f"Snapshot not cataloged: {e}")
+        return jpeg, path
+
+    def _catalog_add(self, camera, path, frame, grabbed_at, pose, size, preview=None, job=None):
+        if self.catalog is None:
+            return
+        thumbnail = encode_jpeg(frame, THUMBNAIL_QUALITY, self.thumbnail_width)
+        # The wall-clock time of the grab, grabbed_at is monotonic
+        taken = time.time() - (time.monotonic() - grabbed_at)
+        self.catalog.add(path, camera, taken, pose, frame.shape[1], frame.shape[0], size, thumbnail,
+                         preview, job)
+
+    def _write(self, camera, jpeg, suffix=""):
+        started = time.perf_counter()
+        os.makedirs(self.output_dir, exist_ok=True)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        name = f"snapshot_{timestamp}_{camera}{suffix}"
+        # A second capture in the same millisecond gets a file of its own, a saved
+        # image never changes (the catalog serves them as immutable)
+        for n in itertools.count():
+            path = os.path.join(self.output_dir, f"{name}-{n}.jpg" if n else f"{name}.jpg")
+            try:
+                with open(path, "xb") as f:
+                    f.write(jpeg)
+                break
+            except FileExistsError:
+                continue
+        WRITE_SECONDS.observe(time.perf_counter() - started)
+        return path
+
+    def _capture(self, job):
+        grabber = self.grabbers[job["camera"]]
+        deadline = time.monotonic() + job["duration"] if job["duration"] else None
+        last_grab = None
+        futures = []
+        try:
+            while True:
+                if deadline is not None:
+                    if time.monotonic() >= deadline or job["captured"] >= self.max_burst_frames:
+                        break
+                elif job["captured"] >= job["requested"]:
+                    break
+                frame, grabbed_at = grabber.latest_frame()
+                if frame is None:
+                    job["errors"].append(f"No frame available from {job['camera']}")
+                    break
+                if grabbed_at == last_grab:
+                    time.sleep(NEW_FRAME_POLL)  # Same frame as last time, wait for a new one
+                    continue
+                if not self._slots.acquire(timeout=SLOT_TIMEOUT):
+                    job["errors"].append("Encoder backlog, burst stopped early")
+                    break
+                try:
+                    future = self.pool.submit(self._save, job, frame, grabbed_at, job["captured"] + 1,
+                                              self.pose(job["camera"]))
+                except Exception:
+                    self._slots.release()
+                    raise
+                last_grab = grabbed_at
+                job["captured"] += 1
+                futures.append(future)
+                if job["interval"]:
+                    time.sleep(job["interval"])
+            for future in futures:
+                future.result()
+        except Exception as e:
+            job["errors"].append(str(e))
+        finally:
+            self._bursts.release()
+            with self._lock:
+                job["status"] = "failed" if job["errors"] and not job["saved"] else "done"
+                job["finished"] = time.time()
+
+    def _save(self, job, frame, grabbed_at, index, pose):
+        try:
+            suffix = f"_{index:03d}" if job["requested"] != 1 else ""
+            jpeg = encode_jpeg(frame, job["quality"])
+            path = self._write(job["camera"], jpeg, suffix)
+            preview = None
+            if job["preview_width"]:
+                preview = self._write(job["camera"], encode_jpeg(frame, job["quality"], job["preview_width"]),
+                                      suffix + "_preview")
+            self._catalog_add(job["camera"], path, frame, grabbed_at, pose, len(jpeg), preview, job["id"])
+            with self._lock:
+                job["files"].append(path)
+                if preview:
+                    job["previews"].append(preview)
+                job["saved"] += 1
+        except Exception as e:
+            job["errors"].append(str(e))
+        finally:
+            self._slots.release()
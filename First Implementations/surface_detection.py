@@ -0,0 +1,308 @@
+# Surface detection and wall labeling for the IMU.
+# Kept free of hardware and server imports so the mission replay tool
+# (mission_replay.py) runs the exact same classification offline.
+#
+# SurfaceTracker is what the server uses. surface()/classify() below are the
+# original per-angle-frame classification, kept for bench_surface.py to compare
+# against.
+import collections
+import math
+
+WALLS = ("Left Wall", "Right Wall", "Front Wall", "Back Wall")
+WALL_LABELS = ("Wall A", "Wall B", "Wall C", "Wall D")
+
+# Wall labeling system - calibrated at startup
+wall_calibration = {
+    "reference_yaw": None,  # Yaw angle when starting at Wall A
+    "reference_surface": None,  # Which surface type is Wall A
+    "is_calibrated": False
+}
+
+def get_wall_label(yaw, current_surface):
+    """
+    Label walls as A, B, C, D based on starting position.
+    Wall A = starting wall (basic input)
+    Wall B = 90° clockwise from A
+    Wall C = opposite of A
+    Wall D = 90° counter-clockwise from A
+    """
+    if not wall_calibration["is_calibrated"]:
+        return "Calibrating..."
+
+    # Only label actual walls, not floor/ceiling
+    if current_surface not in WALLS:
+        return current_surface
+    return wall_label(yaw, wall_calibration["reference_yaw"])
+
+def wall_label(yaw, reference_yaw, current=None, margin=0.0):
+    """
+    Wall A/B/C/D for a yaw relative to the yaw Wall A was calibrated at.
+    0° = Wall A, 90° = Wall B, 180° = Wall C, 270° = Wall D. With a current label
+    it is kept until the yaw is more than `margin` degrees past its 45° boundary.
+    """
+    angle_diff = (yaw - reference_yaw) % 360
+    if current in WALL_LABELS:
+        center = WALL_LABELS.index(current) * 90
+        if abs((angle_diff - center + 180) % 360 - 180) <= 45 + margin:
+            return current
+    return WALL_LABELS[int((angle_diff + 45) % 360 // 90)]
+
+def surface(pitch, roll, accel=None):
+    """
+    Enhanced surface detection using gravity vector from accelerometer.
+    The accelerometer measures gravity direction - this tells us which surface we're on.
+
+    Gravity components:
+    - Z-axis negative (az < -0.7): Gravity pulling down → Floor
+    - Z-axis positive (az > 0.7): Gravity pulling up → Ceiling
+    - X-axis negative (ax < -0.7): Gravity pulling left → Left Wall
+    - X-axis positive (ax > 0.7): Gravity pulling right → Right Wall
+    - Y-axis negative (ay < -0.7): Gravity pulling forward → Front Wall
+    - Y-axis positive (ay > 0.7): Gravity pulling backward → Back Wall
+    """
+    if accel:
+        ax, ay, az = accel
+
+        # Use accelerometer to detect gravity direction (most accurate)
+        # Threshold of 0.7g means axis is within ~45° of vertical
+        if abs(az) > 0.7:
+            return "Floor" if az < 0 else "Ceiling"
+        elif abs(ax) > 0.7:
+            return "Left Wall" if ax < 0 else "Right Wall"
+        elif abs(ay) > 0.7:
+            return "Front Wall" if ay < 0 else "Back Wall"
+        else:
+            # Transitioning between surfaces or at an angle
+            return "Transitioning"
+
+    # Fallback to pitch/roll if no accelerometer data
+    if abs(pitch) < 45 and abs(roll) < 45:
+        return "Floor"
+    elif abs(pitch) > 135 or abs(roll) > 135:
+        return "Ceiling"
+    return "Wall"
+
+def classify(pitch, roll, yaw, accel):
+    """Returns (surface, location) and calibrates Wall A on the first wall seen"""
+    surf = surface(pitch, roll, accel)  # Get surface type
+    location = get_wall_label(yaw, surf)  # Convert to Wall A/B/C/D
+
+    # Auto-calibrate on first wall detection
+    if not wall_calibration["is_calibrated"] and "Wall" in surf:
+        wall_calibration["reference_yaw"] = yaw
+        wall_calibration["reference_surface"] = surf
+        wall_calibration["is_calibrated"] = True
+        print(f"✓ Calibrated! Starting wall set as Wall A at yaw={yaw:.1f}°")
+    return surf, location
+
+def reset_calibration():
+    wall_calibration.update({"reference_yaw": None, "reference_surface": None, "is_calibrated": False})
+
+
+# Surface for each gravity axis and sign, in the priority order surface() uses
+SURFACE_AXES = ((2, -1.0, "Floor"), (2, 1.0, "Ceiling"), (0, -1.0, "Left Wall"), (0, 1.0, "Right Wall"),
+                (1, -1.0, "Front Wall"), (1, 1.0, "Back Wall"))
+SURFACE_AXIS = {name: (axis, sign) for axis, sign, name in SURFACE_AXES}
+MAX_DT = 0.1           # longer gaps between samples are not integrated
+ACCEL_GATE = 0.5       # accel samples this far (in g) from 1 g get no weight
+
+
+class _SampleClock:
+    """
+    Time step per sample of one IMU stream. The reader hands over every frame
+    of a serial read with the same timestamp, so the step is the mean spacing
+    of the previous read's samples rather than the difference of timestamps.
+    """
+    __slots__ = ("last", "count", "period")
+
+    def __init__(self, period):
+        self.last = None
+        self.count = 0
+        self.period = period
+
+    def step(self, t):
+        if self.last is None:
+            self.last, self.count = t, 1
+            return 0.0
+        if t > self.last:
+            spacing = min((t - self.last) / self.count, MAX_DT)
+            self.period += 0.2 * (spacing - self.period)
+            self.last, self.count = t, 1
+        else:
+            self.count += 1
+        return self.period
+
+
+class SurfaceTracker:
+    """
+    Incremental surface and wall tracking from every accel, gyro and angle
+    sample, O(1) work per sample on state allocated up front.
+
+    The gravity direction is a complementary filter: each gyro sample rotates
+    it by the measured body rate, each accel sample pulls it towards the
+    measured direction with time constant `tau` (less while the robot is
+    accelerating, not at all in a >0.5 g jolt). Motor vibration is averaged
+    out and a tilt shows up from the gyro without waiting for the accel.
+
+    Surfaces use hysteresis on the gravity component of their axis: a new
+    surface needs `enter` (of 1 g) and the current one is kept until its axis
+    drops below `exit`. A change also has to hold for `dwell` seconds before
+    it is committed. Committed changes are kept as timestamped events.
+    Wall A is calibrated from the mean yaw over the first `dwell` seconds on
+    the first wall, and wall labels have `yaw_margin` degrees of hysteresis at the 45° boundaries.
+
+    Feed samples with accel()/gyro()/angle() in g, deg/s and deg, with a
+    monotonic time; events get that time plus `clock_offset`.
+    """
+
+    def __init__(self, enter=0.75, exit=0.65, dwell=0.25, tau=0.5, yaw_margin=5.0,
+                 history=200, clock_offset=0.0):
+        self.enter = enter
+        self.exit = exit
+        self.dwell = dwell
+        self.tau = tau
+        self.yaw_margin = yaw_margin
+        self.clock_offset = clock_offset
+        self.events = collections.deque(maxlen=history)
+        self.samples = 0
+        self._accel_clock = _SampleClock(0.01)
+        self._gyro_clock = _SampleClock(0.01)
+        self.reset_calibration()
+        self.reset()
+
+    def reset(self):
+        self.gravity = [0.0, 0.0, 0.0]   # unit vector, what the accelerometer reads at rest
+        self.roll = self.pitch = self.yaw = 0.0
+        self.surface = None
+        self.location = "Calibrating..."
+        self.changed_at = None
+        self._has_gravity = False
+        self._candidate = None
+        self._candidate_since = 0.0
+        self._calibrating_since = None
+        self._yaw_sin = self._yaw_cos = 0.0
+
+    def reset_calibration(self):
+        self.reference_yaw = None
+        self.reference_surface = None
+
+    def accel(self, t, ax, ay, az):
+        self.samples += 1
+        dt = self._accel_clock.step(t)
+        norm = math.sqrt(ax * ax + ay * ay + az * az)
+        if norm < 1e-6:
+            return
+        g = self.gravity
+        if not self._has_gravity:
+            g[0], g[1], g[2] = ax / norm, ay / norm, az / norm
+            self._has_gravity = True
+        else:
+            weight = max(0.0, 1.0 - abs(norm - 1.0) / ACCEL_GATE) * dt / (self.tau + dt)
+            if weight <= 0.0:
+                return
+            self._set_gravity(g[0] + weight * (ax / norm - g[0]), g[1] + weight * (ay / norm - g[1]),
+                              g[2] + weight * (az / norm - g[2]))
+        self._update(t)
+
+    def gyro(self, t, gx, gy, gz):
+        self.samples += 1
+        dt = self._gyro_clock.step(t)
+        if not self._has_gravity or not dt:
+            return
+        # A world-fixed vector seen from the body turns by -omega x v
+        scale = math.pi / 180.0 * dt
+        wx, wy, wz = gx * scale, gy * scale, gz * scale
+        x, y, z = self.gravity
+        self._set_gravity(x - (wy * z - wz * y), y - (wz * x - wx * z), z - (wx * y - wy * x))
+        self._update(t)
+
+    def angle(self, t, roll, pitch, yaw):
+        self.samples += 1
+        self.roll, self.pitch, self.yaw = roll, pitch, yaw
+        if self.reference_yaw is None and self.surface in WALLS:
+            self._calibrate(t, yaw)
+        if not self._has_gravity:
+            # No accelerometer frames configured, fall back to the WT901's own angles
+            self._classify(t, surface(pitch, roll))
+        self._update_location()
+
+    def _set_gravity(self, x, y, z):
+        norm = math.sqrt(x * x + y * y + z * z)
+        if norm > 1e-9:
+            g = self.gravity
+            g[0], g[1], g[2] = x / norm, y / norm, z / norm
+
+    def _update(self, t):
+        g = self.gravity
+        current = SURFACE_AXIS.get(self.surface)
+        if current is not None and g[current[0]] * current[1] >= self.exit:
+            self._classify(t, self.surface)
+            return
+        for axis, sign, name in SURFACE_AXES:
+            if g[axis] * sign > self.enter:
+                self._classify(t, name)
+                return
+        # No axis is close enough to gravity, e.g. on the edge between two surfaces
+        self._classify(t, "Transitioning")
+
+    def _classify(self, t, instant):
+        if instant == self.surface:
+            self._candidate = None
+            return
+        if instant != self._candidate:
+            self._candidate = instant
+            self._candidate_since = t
+            if self.surface is not None:
+                return
+        elif t - self._candidate_since < self.dwell:
+            return
+        self._commit(t, instant)
+
+    def _commit(self, t, new_surface):
+        previous = self.surface
+        self.surface = new_surface
+        self.changed_at = t
+        self._candidate = None
+        self._calibrating_since = None
+        self._yaw_sin = self._yaw_cos = 0.0
+        self._update_location()
+        self.events.append({
+            "at": t + self.clock_offset,
+            "from": previous,
+            "to": new_surface,
+            "location": self.location,
+            "yaw": round(self.yaw, 1),
+        })
+
+    def _calibrate(self, t, yaw):
+        # Wall A is the mean yaw over the first `dwell` seconds on the first wall
+        if self._calibrating_since is None:
+            self._calibrating_since = t
+        rad = math.radians(yaw)
+        self._yaw_sin += math.sin(rad)
+        self._yaw_cos += math.cos(rad)
+        if t - self._calibrating_since >= self.dwell:
+            self.reference_yaw = math.degrees(math.atan2(self._yaw_sin, self._yaw_cos))
+            self.reference_surface = self.surface
+            print(f"✓ Calibrated! Starting wall set as Wall A at yaw={self.reference_yaw:.1f}°")
+
+    def _update_location(self):
+        if self.reference_yaw is None:
+            self.location = "Calibrating..."
+        elif self.surface in WALLS:
+            self.location = wall_label(self.yaw, self.reference_yaw, self.location, self.yaw_margin)
+        else:
+            self.location = self.surface or "Transitioning"
+
+    def get_state(self, events=20):
+        history = list(self.events)
+        return {
+            "surface": self.surface or "Transitioning",
+            "location": self.location,
+            "gravity": [round(v, 3) for v in self.gravity],
+            "changed_at": None if self.changed_at is None else self.changed_at + self.clock_offset,
+            "reference_yaw": self.reference_yaw,
+            "reference_surface": self.reference_surface,
+            "samples": self.samples,
+            "events": history[max(0, len(history) - events):][::-1],   # [-0:] would be all of them
+        }
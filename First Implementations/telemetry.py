@@ -0,0 +1,73 @@
+# One fan-out broadcaster for live telemetry (IMU + control input).
+# Producers (the IMU reader thread, the control handlers) publish the newest
+# state. Every subscriber is woken when something changes, re-reads only the
+# newest payload and then waits out its own rate limit, so a slow browser
+# skips intermediate updates instead of building a backlog.
+import asyncio
+import json
+import threading
+
+KEEPALIVE_INTERVAL = 15.0  # seconds between SSE comments on a quiet stream
+
+
+class TelemetryBroadcaster:
+    def __init__(self, max_rate):
+        self.max_rate = max_rate
+        self.version = 0
+        self.subscribers = 0
+        self._state = {}
+        self._lock = threading.Lock()
+        self._encoded = (0, b"")  # (version, SSE message) - encoded once per version
+        self._loop = None
+        self._changed = None
+        self._notify_pending = False
+
+    def attach(self, loop):
+        # Called once from the startup hook, subscribers wait on this loop
+        self._loop = loop
+        self._changed = asyncio.Condition()
+
+    def publish(self, key, value):
+        # Safe to call from any thread
+        with self._lock:
+            self._state[key] = dict(value)
+            self.version += 1
+            if self._loop is None or self._notify_pending:
+                return
+            self._notify_pending = True
+        self._loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._notify()))
+
+    async def _notify(self):
+        with self._lock:
+            self._notify_pending = False
+        async with self._changed:
+            self._changed.notify_all()
+
+    def _message(self):
+        with self._lock:
+            version = self.version
+            if self._encoded[0] != version:
+                data = json.dumps(self._state, separators=(",", ":"))
+                self._encoded = (version, f"event: telemetry\ndata: {data}\n\n".encode())
+            return self._encoded
+
+    async def subscribe(self, rate):
+        """Async generator of Server-Sent Events, at most `rate` per second"""
+        interval = 1.0 / max(0.1, min(rate, self.max_rate))
+        seen = -1
+        self.subscribers += 1
+        try:
+            while True:
+                if self.version == seen:
+                    async with self._changed:
+                        try:
+                            await asyncio.wait_for(
+                                self._changed.wait_for(lambda: self.version != seen), KEEPALIVE_INTERVAL)
+                        except asyncio.TimeoutError:
+                            yield b": keepalive\n\n"
+                            continue
+                seen, message = self._message()
+                yield message
+                await asyncio.sleep(interval)
+        finally:
+            self.subscribers -= 1
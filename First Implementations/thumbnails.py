@@ -0,0 +1,254 @@
+# Keyframe thumbnails and timeline sprites for recordings.
+# A background thread takes finished segments from the recordings index and runs
+# one ffmpeg pass per segment with -skip_frame nokey: only keyframes are decoded
+# (the cameras send one every second or two), and of those one every `interval`
+# seconds is scaled down to a JPEG. The thumbnails are then tiled into one
+# sprite image, so the UI can show a whole hour as a strip and jump to a time
+# without downloading any video.
+#
+# Storage is content-addressed: every JPEG is stored once under its SHA-1
+# (blobs/ab/abcdef....jpg) and can be cached forever by browsers; a JSON manifest
+# per source file (keyed by path, mtime and size) lists the frame times and
+# blob hashes.
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from remux_cache import cache_key
+
+PTS_TIME = re.compile(rb"pts_time:\s*([0-9.]+)")
+RETRY_AFTER = 3600.0   # seconds before a segment that failed is tried again
+PRUNE_EVERY = 120      # passes between removing thumbnails of deleted recordings
+
+
+class ThumbnailCache(threading.Thread):
+    def __init__(self, index, cache_dir, interval=10.0, width=160, columns=10, quality=70,
+                 scan_interval=30.0, settle_seconds=120.0, ffmpeg="ffmpeg", timeout=600):
+        super().__init__(name="thumbnails", daemon=True)
+        self.index = index
+        self.cache_dir = cache_dir
+        self.interval = interval
+        self.width = width
+        self.columns = columns
+        self.quality = quality
+        self.scan_interval = scan_interval
+        self.settle_seconds = settle_seconds
+        self.ffmpeg = ffmpeg
+        self.timeout = timeout
+        self._manifest_dir = os.path.join(cache_dir, "manifests")
+        self._blob_dir = os.path.join(cache_dir, "blobs")
+        os.makedirs(self._manifest_dir, exist_ok=True)
+        os.makedirs(self._blob_dir, exist_ok=True)
+        for leftover in glob.glob(os.path.join(cache_dir, "thumbs-*")):
+            shutil.rmtree(leftover, ignore_errors=True)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._requested = []        # paths asked for through the API, served first
+        self._failed = {}           # key -> (error, monotonic time)
+        self._working = None
+        self._done = {name[:-5] for name in os.listdir(self._manifest_dir) if name.endswith(".json")}
+        self._running = True
+        self.stats = {"segments": len(self._done), "failed": 0, "frames": 0, "last_ms": None, "pruned": 0}
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def blob_path(self, digest):
+        if not re.fullmatch(r"[0-9a-f]{40}", digest):
+            raise KeyError(digest)
+        return os.path.join(self._blob_dir, digest[:2], f"{digest}.jpg")
+
+    def get(self, rel_path, mtime, size):
+        """
+        The manifest for a recording, or a dict with "status" pending/failed.
+        Asking for one that isn't done moves it to the front of the queue.
+        """
+        key = cache_key(rel_path, mtime, size)
+        if key in self._done:
+            try:
+                with open(os.path.join(self._manifest_dir, f"{key}.json")) as f:
+                    return {"status": "ready", **json.load(f)}
+            except FileNotFoundError:
+                self._done.discard(key)
+        with self._lock:
+            failed = self._failed.get(key)
+            if failed and time.monotonic() - failed[1] < RETRY_AFTER:
+                return {"status": "failed", "error": failed[0]}
+            if time.time() - mtime < self.settle_seconds:
+                return {"status": "recording"}
+            if self._working != key and rel_path not in self._requested:
+                self._requested.append(rel_path)
+        self._wake.set()
+        return {"status": "pending"}
+
+    def run(self):
+        passes = 0
+        while self._running:
+            with self._lock:
+                requested = self._requested.pop(0) if self._requested else None
+            try:
+                if requested is not None:
+                    self._process_path(requested)
+                    continue
+                if not self._process_next():
+                    passes += 1
+                    if passes % PRUNE_EVERY == 1 and self.index.stats["scans"]:
+                        self.prune()
+                    self._wake.wait(self.scan_interval)
+                    self._wake.clear()
+            except Exception as e:
+                print(f"Thumbnail pass failed: {e}")
+                self._wake.wait(self.scan_interval)
+                self._wake.clear()
+
+    def _candidates(self):
+        # Finished recordings, newest first - those are the ones being looked at
+        cutoff = time.time() - self.settle_seconds
+        cursor = None
+        while True:
+            recordings, cursor = self.index.query(limit=200, cursor=cursor, end=cutoff)
+            yield from recordings
+            if cursor is None:
+                return
+
+    def _process_next(self):
+        now = time.monotonic()
+        for recording in self._candidates():
+            key = cache_key(recording["path"], recording["mtime"], recording["size"])
+            if key in self._done:
+                continue
+            failed = self._failed.get(key)
+            if failed and now - failed[1] < RETRY_AFTER:
+                continue
+            self._process(recording["path"], key)
+            return True
+        return False
+
+    def _process_path(self, rel_path):
+        try:
+            st = os.stat(os.path.join(self.index.root, rel_path))
+        except FileNotFoundError:
+            return
+        key = cache_key(rel_path, st.st_mtime, st.st_size)
+        if key not in self._done:
+            self._process(rel_path, key)
+
+    def _process(self, rel_path, key):
+        started = time.monotonic()
+        with self._lock:
+            self._working = key
+        try:
+            manifest = self._extract(rel_path)
+            path = os.path.join(self._manifest_dir, f"{key}.json")
+            with open(path + ".part", "w") as f:
+                json.dump(manifest, f)
+            os.replace(path + ".part", path)
+            self._done.add(key)
+            self.stats["segments"] += 1
+            self.stats["frames"] += len(manifest["frames"])
+            self.stats["last_ms"] = round((time.monotonic() - started) * 1000)
+        except Exception as e:
+            with self._lock:
+                self._failed[key] = (str(e), time.monotonic())
+            self.stats["failed"] += 1
+            print(f"Thumbnails for {rel_path} failed: {e}")
+        finally:
+            with self._lock:
+                self._working = None
+
+    def _extract(self, rel_path):
+        source = os.path.join(self.index.root, rel_path)
+        workdir = tempfile.mkdtemp(prefix="thumbs-", dir=self.cache_dir)
+        try:
+            # select keeps the first keyframe and then one at least `interval` seconds
+            # after the previously kept one; showinfo logs the pts of each kept frame.
+            # -vsync rather than -fps_mode so the ffmpeg 4.x in Raspberry Pi OS accepts it
+            select = f"select='isnan(prev_selected_t)+gte(t-prev_selected_t\\,{self.interval})'"
+            result = subprocess.run(
+                [self.ffmpeg, "-nostdin", "-loglevel", "info", "-skip_frame", "nokey", "-i", source,
+                 "-an", "-sn", "-dn", "-vf", f"{select},showinfo,scale={self.width}:-2",
+                 "-vsync", "vfr", "-q:v", "5", os.path.join(workdir, "%05d.jpg")],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=self.timeout)
+            files = sorted(glob.glob(os.path.join(workdir, "*.jpg")))
+            if result.returncode != 0 or not files:
+                message = result.stderr.decode(errors="replace").strip().splitlines()
+                raise RuntimeError(message[-1] if message else f"ffmpeg exited with {result.returncode}")
+            times = [float(t) for t in PTS_TIME.findall(result.stderr)]
+            if len(times) < len(files):
+                times = [i * self.interval for i in range(len(files))]
+
+            frames, tiles = [], []
+            for path, t in zip(files, times):
+                with open(path, "rb") as f:
+                    data = f.read()
+                frames.append({"t": round(t - times[0], 3), "thumb": self._store(data)})
+                tiles.append(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR))
+            tile_h, tile_w = tiles[0].shape[:2]
+            rows = -(-len(tiles) // self.columns)
+            sprite = np.zeros((rows * tile_h, self.columns * tile_w, 3), np.uint8)
+            for i, tile in enumerate(tiles):
+                row, col = divmod(i, self.columns)
+                h, w = min(tile.shape[0], tile_h), min(tile.shape[1], tile_w)
+                sprite[row * tile_h:row * tile_h + h, col * tile_w:col * tile_w + w] = tile[:h, :w]
+            ok, sprite_jpeg = cv2.imencode(".jpg", sprite, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                raise RuntimeError("Failed to encode sprite")
+            return {
+                "path": rel_path,
+                "interval": self.interval,
+                "tile_width": tile_w,
+                "tile_height": tile_h,
+                "columns": self.columns,
+                "sprite": self._store(sprite_jpeg.tobytes()),
+                "frames": frames,
+                "created": time.time(),
+            }
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _store(self, data):
+        digest = hashlib.sha1(data).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".part", "wb") as f:
+                f.write(data)
+            os.replace(path + ".part", path)
+        return digest
+
+    def prune(self):
+        """Removes manifests of recordings that are gone and blobs nobody references"""
+        live = set()
+        cursor = None
+        while True:
+            recordings, cursor = self.index.query(limit=500, cursor=cursor)
+            live.update(cache_key(r["path"], r["mtime"], r["size"]) for r in recordings)
+            if cursor is None:
+                break
+        referenced = set()
+        for name in os.listdir(self._manifest_dir):
+            key, ext = os.path.splitext(name)
+            path = os.path.join(self._manifest_dir, name)
+            if ext != ".json" or key not in live:
+                os.remove(path)
+                self._done.discard(key)
+                self.stats["pruned"] += 1
+                continue
+            with open(path) as f:
+                manifest = json.load(f)
+            referenced.add(manifest["sprite"])
+            referenced.update(frame["thumb"] for frame in manifest["frames"])
+        for path in glob.glob(os.path.join(self._blob_dir, "*", "*")):
+            if os.path.basename(path)[:40] not in referenced:
+                os.remove(path)
@@ -0,0 +1,181 @@
+# In-process V4L2 camera controls (zoom, focus, exposure).
+# Each camera gets a thread that keeps /dev/videoN open and sets controls with
+# VIDIOC_S_CTRL directly, instead of a v4l2-ctl process per change. Requests
+# only update a target value, so holding the zoom button queues nothing: the
+# thread applies whatever the latest target is when it gets to it. Control
+# ranges come from VIDIOC_QUERYCTRL when the device is opened, so each camera's
+# own limits are used.
+# The control fd can be open while ffmpeg streams from the same device.
+import errno
+import fcntl
+import os
+import struct
+import threading
+import time
+
+QUERYCTRL = struct.Struct("<II32siiiiI2I")   # struct v4l2_queryctrl
+CONTROL = struct.Struct("<Ii")               # struct v4l2_control
+
+
+def _iowr(nr, size):
+    return (3 << 30) | (size << 16) | (ord("V") << 8) | nr
+
+
+VIDIOC_G_CTRL = _iowr(27, CONTROL.size)
+VIDIOC_S_CTRL = _iowr(28, CONTROL.size)
+VIDIOC_QUERYCTRL = _iowr(36, QUERYCTRL.size)
+
+CTRL_FLAG_DISABLED = 0x0001
+CAMERA_CLASS_BASE = 0x009A0900
+CONTROLS = {
+    "exposure_auto": CAMERA_CLASS_BASE + 1,   # menu: 1 = manual, 3 = aperture priority
+    "exposure": CAMERA_CLASS_BASE + 2,
+    "focus": CAMERA_CLASS_BASE + 10,
+    "focus_auto": CAMERA_CLASS_BASE + 12,
+    "zoom": CAMERA_CLASS_BASE + 13,
+}
+ZOOM_STEPS = 10          # zoom in/out presses from one end of the range to the other
+REOPEN_DELAY = 2.0
+# Errors that mean the device went away, anything else is about the one control
+DEVICE_ERRORS = (errno.ENODEV, errno.EIO, errno.EBADF, errno.ENOENT, errno.ENXIO)
+
+
+class CameraControls(threading.Thread):
+    def __init__(self, camera, device):
+        super().__init__(name=f"v4l2-{camera}", daemon=True)
+        self.camera = camera
+        self.device = device
+        self.ranges = {}       # name -> {"min", "max", "step", "default"}
+        self.values = {}       # name -> value last applied to the device
+        self._fd = None
+        self._targets = {}     # name -> value waiting to be applied
+        self._cond = threading.Condition()
+        self._running = True
+        self.stats = {"connected": False, "requested": 0, "applied": 0, "coalesced": 0, "errors": 0,
+                      "last_error": None}
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def check(self, name, value):
+        """
+        The value as an integer; KeyError if the camera has no such control,
+        ValueError or TypeError if the value isn't a number
+        """
+        if name not in CONTROLS or (self.ranges and name not in self.ranges):
+            raise KeyError(name)
+        return int(value)
+
+    def set(self, name, value):
+        """Sets the target of a control and returns it after clamping to the device range"""
+        value = self.check(name, value)
+        with self._cond:
+            value = self._clamp(name, value)
+            if name in self._targets:
+                self.stats["coalesced"] += 1
+            self._targets[name] = value
+            self.stats["requested"] += 1
+            self._cond.notify()
+        return value
+
+    def zoom_by(self, steps):
+        """Relative zoom in presses (positive = in), counted from the pending target"""
+        with self._cond:
+            current = self._targets.get("zoom", self.values.get("zoom"))
+            limits = self.ranges.get("zoom")
+            if limits is None or current is None:
+                return None
+            step = max(limits["step"], round((limits["max"] - limits["min"]) / ZOOM_STEPS))
+        return self.set("zoom", current + steps * step)
+
+    def get_state(self):
+        with self._cond:
+            return {
+                "device": self.device,
+                **self.stats,
+                "controls": {name: {**limits, "value": self.values.get(name),
+                                    "target": self._targets.get(name, self.values.get(name))}
+                             for name, limits in self.ranges.items()},
+            }
+
+    def _clamp(self, name, value):
+        limits = self.ranges.get(name)
+        if limits is None:
+            return value
+        step = limits["step"] or 1
+        value = limits["min"] + round((value - limits["min"]) / step) * step
+        return max(limits["min"], min(limits["max"], value))
+
+    def _open(self):
+        fd = os.open(self.device, os.O_RDWR | os.O_NONBLOCK)
+        ranges, values = {}, {}
+        for name, cid in CONTROLS.items():
+            try:
+                query = bytearray(QUERYCTRL.pack(cid, 0, b"", 0, 0, 0, 0, 0, 0, 0))
+                fcntl.ioctl(fd, VIDIOC_QUERYCTRL, query)
+                _, _, _, minimum, maximum, step, default, flags, _, _ = QUERYCTRL.unpack(query)
+                if flags & CTRL_FLAG_DISABLED:
+                    continue
+                control = bytearray(CONTROL.pack(cid, 0))
+                fcntl.ioctl(fd, VIDIOC_G_CTRL, control)
+            except OSError as e:
+                if e.errno == errno.EINVAL:  # The camera doesn't have this control
+                    continue
+                os.close(fd)
+                raise
+            ranges[name] = {"min": minimum, "max": maximum, "step": step, "default": default}
+            values[name] = CONTROL.unpack(control)[1]
+        with self._cond:
+            self._fd = fd
+            self.ranges = ranges
+            self.values = values
+            # Targets set while disconnected are re-clamped to the real ranges
+            self._targets = {name: self._clamp(name, value) for name, value in self._targets.items()
+                             if name in ranges}
+            self.stats["connected"] = True
+        print(f"Camera controls {self.camera} on {self.device}: {', '.join(ranges) or 'none'}")
+
+    def _close(self):
+        with self._cond:
+            fd, self._fd = self._fd, None
+            self.stats["connected"] = False
+        if fd is not None:
+            os.close(fd)
+
+    def run(self):
+        while self._running:
+            if self._fd is None:
+                try:
+                    self._open()
+                except OSError as e:
+                    self.stats["last_error"] = str(e)
+                    time.sleep(REOPEN_DELAY)
+                    continue
+
+            with self._cond:
+                while self._running and not self._targets:
+                    self._cond.wait()
+                # Everything requested since the last pass, one ioctl per control
+                targets, self._targets = self._targets, {}
+
+            for name, value in targets.items():
+                if self.values.get(name) == value:
+                    continue
+                try:
+                    fcntl.ioctl(self._fd, VIDIOC_S_CTRL, CONTROL.pack(CONTROLS[name], value))
+                except OSError as e:
+                    self.stats["errors"] += 1
+                    self.stats["last_error"] = f"{name}={value}: {e}"
+                    if e.errno in DEVICE_ERRORS:
+                        with self._cond:
+                            # Retry on the reopened device unless something newer came in
+                            for pending_name, pending_value in targets.items():
+                                self._targets.setdefault(pending_name, pending_value)
+                        self._close()
+                        break
+                    continue
+                self.values[name] = value
+                self.stats["applied"] += 1
+        self._close()
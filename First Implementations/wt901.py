@@ -0,0 +1,147 @@
+# WT901 IMU serial protocol helpers
+# Every frame is 11 bytes: 0x55 | type | 4 x int16 little endian | checksum
+# ![](./docs/Acceleration0x51.png) ![](./docs/AngularVelocity0x52.png) ![](./docs/Angle0x53.png)
+import struct
+import numpy as np
+
+FRAME_HEADER = 0x55
+FRAME_LEN = 11
+FRAME_VALUES = struct.Struct('<hhhh')
+# Data types the WT901 can emit (0x50 time ... 0x5A port status)
+FRAME_TYPES = frozenset(range(0x50, 0x5B))
+
+ACCEL = 0x51
+GYRO = 0x52
+ANGLE = 0x53
+
+# Raw int16 -> g, deg/s and deg
+ACCEL_SCALE = 16.0 / 32768.0
+GYRO_SCALE = 2000.0 / 32768.0
+ANGLE_SCALE = 180.0 / 32768.0
+
+# One frame as a NumPy record, used by decode_buffer
+FRAME_DTYPE = np.dtype([
+    ("header", "u1"),
+    ("type", "u1"),
+    ("values", "<i2", (4,)),
+    ("checksum", "u1"),
+])
+
+
+def checksum(data):
+    return sum(data) & 0xFF
+
+
+def parse_data(packet):
+    if len(packet) < 11 or packet[0] != 0x55 or checksum(packet[:10]) != packet[10]:
+        return None, None
+    return packet[1], FRAME_VALUES.unpack_from(packet, 2)
+
+
+class FrameBuffer:
+    """
+    Reusable receive buffer for the IMU byte stream.
+    Serial chunks are appended at the end and complete frames are taken from the
+    front. Leftover bytes (a partial frame) are moved back to the start instead of
+    wrapping, so a frame is always contiguous and can be decoded in place.
+    A header that fails the type or checksum test only skips one byte, so a
+    0x55 inside a payload never costs us the real frame that follows it.
+    """
+
+    def __init__(self, capacity=4096):
+        self.buf = bytearray(capacity)
+        self.start = 0
+        self.end = 0
+        self.stats = {"frames": 0, "bad_frames": 0, "skipped_bytes": 0, "overflows": 0}
+
+    def __len__(self):
+        return self.end - self.start
+
+    def append(self, data):
+        n = len(data)
+        if self.end + n > len(self.buf):
+            unread = self.end - self.start
+            if unread + n > len(self.buf):
+                # Reader fell far behind, drop the unread bytes and keep the newest
+                self.stats["overflows"] += 1
+                data = data[-len(self.buf):]
+                n = len(data)
+                self.start = self.end
+                unread = 0
+            self.buf[:unread] = self.buf[self.start:self.end]
+            self.start, self.end = 0, unread
+        self.buf[self.end:self.end + n] = data
+        self.end += n
+
+    def pop_frames(self):
+        """Returns a list of (data_type, values) for every complete, valid frame"""
+        buf, i, end = self.buf, self.start, self.end
+        frames = []
+        while end - i >= FRAME_LEN:
+            if buf[i] != FRAME_HEADER:
+                nxt = buf.find(FRAME_HEADER, i, end)
+                self.stats["skipped_bytes"] += (end if nxt < 0 else nxt) - i
+                if nxt < 0:
+                    i = end
+                    break
+                i = nxt
+                continue
+            if buf[i + 1] in FRAME_TYPES and sum(buf[i:i + 10]) & 0xFF == buf[i + 10]:
+                frames.append((buf[i + 1], FRAME_VALUES.unpack_from(buf, i + 2)))
+                i += FRAME_LEN
+            else:
+                # Not a real header, resync from the next byte
+                self.stats["bad_frames"] += 1
+                self.stats["skipped_bytes"] += 1
+                i += 1
+        self.stats["frames"] += len(frames)
+        self.start = i
+        if self.start == self.end:
+            self.start = self.end = 0
+        return frames
+
+
+def decode_buffer(data, t0=0.0, baud=115200):
+    """
+    Decodes every valid frame in a buffer of raw IMU bytes in one pass.
+    Returns a dict with float32 (N, 3) arrays "accel" (g), "gyro" (deg/s) and
+    "angle" (roll, pitch, yaw in deg), a float64 timestamp array for each
+    ("accel_t", ...) estimated from the frame's byte offset at the given baud
+    rate, "bad_frames" and "consumed" - the number of leading bytes that are
+    fully resolved. Bytes after "consumed" may hold a partial frame and should
+    be prepended to the next buffer.
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    last_start = raw.size - FRAME_LEN + 1
+    result = {"bad_frames": 0, "consumed": max(0, last_start)}
+    starts = np.flatnonzero(raw[:max(0, last_start)] == FRAME_HEADER)
+
+    if starts.size:
+        windows = np.lib.stride_tricks.sliding_window_view(raw, FRAME_LEN)[starts]
+        valid = (windows[:, :10].sum(axis=1, dtype=np.uint32) & 0xFF) == windows[:, 10]
+        valid &= (windows[:, 1] >= 0x50) & (windows[:, 1] <= 0x5A)
+        result["bad_frames"] = int(starts.size - np.count_nonzero(valid))
+        starts, windows = starts[valid], windows[valid]
+        # A valid-looking header inside an accepted frame is payload, drop it
+        if starts.size > 1 and np.any(np.diff(starts) < FRAME_LEN):
+            keep = np.zeros(starts.size, dtype=bool)
+            next_free = -FRAME_LEN
+            for i, start in enumerate(starts.tolist()):
+                if start >= next_free:
+                    keep[i] = True
+                    next_free = start + FRAME_LEN
+            starts, windows = starts[keep], windows[keep]
+        frames = np.ascontiguousarray(windows).view(FRAME_DTYPE).reshape(-1)
+        if starts.size:
+            result["consumed"] = max(result["consumed"], int(starts[-1]) + FRAME_LEN)
+    else:
+        frames = np.zeros(0, dtype=FRAME_DTYPE)
+
+    times = t0 + starts * (10.0 / baud)  # 10 bits per byte on the wire
+    for name, data_type, scale in (("accel", ACCEL, ACCEL_SCALE),
+                                   ("gyro", GYRO, GYRO_SCALE),
+                                   ("angle", ANGLE, ANGLE_SCALE)):
+        selected = frames["type"] == data_type
+        result[name] = frames["values"][selected, :3].astype(np.float32) * np.float32(scale)
+        result[f"{name}_t"] = times[selected]
+    return result